@@ -0,0 +1,30 @@
+"""
+記帳系統頁面與 API 的回應壓縮
+只處理 ExpenseTracker 的 HTML / JSON 回應，小於門檻或串流（SSE）的回應不壓縮
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+
+COMPRESSIBLE_TYPES = ('text/html', 'application/json')
+
+
+class ResponseCompressionMiddleware(GZipMiddleware):
+    """沿用 GZipMiddleware 的隨機填充（BREACH 緩解）與 ETag 處理，只加上範圍與大小門檻"""
+
+    app_names = ('expense_tracker',)
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'RESPONSE_COMPRESS_MIN_SIZE', 1024)
+
+    def process_response(self, request, response):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.app_name not in self.app_names:
+            return response
+        if response.streaming or len(response.content) < self.min_size:
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,245 @@
+"""
+線上請求的取樣式 CPU 分析
+符合條件的請求才會啟動取樣執行緒：帶有效的 X-Profile-Token 簽章標頭、staff 登入並加上 ?_profile=1，
+或依 PROFILER_SAMPLE_RATE 隨機抽中；其餘請求只多做幾次字串判斷
+
+取樣執行緒每 PROFILER_INTERVAL 秒讀一次請求執行緒的呼叫堆疊，累計成 collapsed stack
+（flamegraph.pl / speedscope 可直接讀取），與網址、耗時、SQL 摘要一起寫到 TMP_ROOT/profiles
+"""
+import json
+import os
+import random
+import re
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+TOKEN_SALT = 'CoDevStudio.profiling'
+QUERY_PARAM = '_profile'
+PROFILE_ID_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$')
+TOP_QUERIES = 10
+
+# 堆疊標籤去掉這些前綴，避免火焰圖被絕對路徑塞滿
+PATH_PREFIXES = sorted(
+    {str(settings.BASE_DIR) + os.sep, sysconfig.get_paths()['purelib'] + os.sep, sysconfig.get_paths()['stdlib'] + os.sep},
+    key=len, reverse=True,
+)
+
+
+def get_profile_dir() -> 'Path':
+    return Path(settings.TMP_ROOT) / 'profiles'
+
+
+def make_token() -> 'str':
+    """產生 X-Profile-Token 標頭的值，有效期限為 PROFILER_TOKEN_MAX_AGE 秒"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(uuid.uuid4().hex)
+
+
+def _short_path(filename: 'str') -> 'str':
+    for prefix in PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+class StackSampler(threading.Thread):
+    """定時讀取指定執行緒的堆疊，以 'root;...;leaf' 累計取樣次數"""
+
+    def __init__(self, thread_id: 'int', interval: 'float'):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        labels = {}
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    # 以函式為單位彙整；分號是 collapsed 格式的分隔字元
+                    label = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+                    label = labels[code] = label.replace(';', ':')
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.stacks[';'.join(stack)] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class QueryCollector:
+    """以 execute_wrapper 累計請求內的 SQL 次數與耗時，依 SQL 文字（未代入參數）分組"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            entry = self.statements.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def summary(self) -> 'dict':
+        top = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:TOP_QUERIES]
+        return {
+            'count': self.count,
+            'duration_ms': round(self.duration * 1000, 2),
+            'distinct': len(self.statements),
+            'top': [
+                {'sql': sql[:1000], 'count': count, 'duration_ms': round(duration * 1000, 2)}
+                for sql, (count, duration) in top
+            ],
+        }
+
+
+class SamplingProfilerMiddleware:
+    """
+    依需求分析單一請求，回應加上 X-Profile-Id 標頭
+    需放在 AuthenticationMiddleware 之後（staff 判斷）；PROFILER_ENABLED 為 False 時不載入
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+        self.interval = getattr(settings, 'PROFILER_INTERVAL', 0.005)
+        self.token_max_age = getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 60 * 60)
+        self.max_profiles = getattr(settings, 'PROFILER_MAX_PROFILES', 200)
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return self._profile(request, trigger)
+
+    def _trigger(self, request) -> 'str|None':
+        token = request.META.get(TOKEN_HEADER)
+        if token:
+            try:
+                signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=self.token_max_age)
+                return 'token'
+            except signing.BadSignature:
+                pass
+        # 先看原始查詢字串，避免每個請求都解析 GET 或載入 session
+        if QUERY_PARAM in request.META.get('QUERY_STRING', '') and request.GET.get(QUERY_PARAM) == '1':
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_staff:
+                return 'staff'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def _profile(self, request, trigger: 'str'):
+        collector = QueryCollector()
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            started_at = timezone.now()
+            start, cpu_start = time.perf_counter(), time.thread_time()
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+            duration, cpu = time.perf_counter() - start, time.thread_time() - cpu_start
+
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        profile_id = f'{started_at:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+        meta = {
+            'id': profile_id,
+            'created_at': started_at.isoformat(),
+            'method': request.method,
+            'url': request.get_full_path(),
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'trigger': trigger,
+            'user': user.get_username() if user is not None and user.is_authenticated else None,
+            'duration_ms': round(duration * 1000, 2),
+            'cpu_ms': round(cpu * 1000, 2),
+            'interval_ms': self.interval * 1000,
+            'samples': sampler.samples,
+            'queries': collector.summary(),
+        }
+        try:
+            save_profile(profile_id, sampler.stacks, meta, self.max_profiles)
+            response['X-Profile-Id'] = profile_id
+        except OSError:
+            # 分析結果寫入失敗不影響回應
+            pass
+        return response
+
+
+def save_profile(profile_id: 'str', stacks: 'Counter', meta: 'dict', max_profiles: 'int'):
+    """寫入 <id>.folded 與 <id>.json，超過 max_profiles 份時刪除最舊的"""
+    profile_dir = get_profile_dir()
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    folded = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+    for suffix, content in (
+        ('.folded', folded),
+        ('.json', json.dumps(meta, ensure_ascii=False, indent=2)),
+    ):
+        path = profile_dir / (profile_id + suffix)
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(content, encoding='utf-8')
+        os.replace(tmp_path, path)
+
+    # 檔名以時間開頭，依名稱排序即為新舊順序
+    names = sorted(path.stem for path in profile_dir.glob('*.json'))
+    for stale in names[:max(0, len(names) - max_profiles)]:
+        for suffix in ('.folded', '.json'):
+            (profile_dir / (stale + suffix)).unlink(missing_ok=True)
+
+
+def list_profiles(limit: 'int' = 100) -> 'list[dict]':
+    """最近的分析結果（新到舊）"""
+    profile_dir = get_profile_dir()
+    if not profile_dir.is_dir():
+        return []
+    profiles = []
+    for path in sorted(profile_dir.glob('*.json'), reverse=True)[:limit]:
+        try:
+            profiles.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def get_profile_path(profile_id: 'str', suffix: 'str') -> 'Path|None':
+    if not PROFILE_ID_RE.match(profile_id) or suffix not in ('.folded', '.json'):
+        return None
+    path = get_profile_dir() / (profile_id + suffix)
+    return path if path.is_file() else None
@@ -0,0 +1,109 @@
+"""
+從 STATIC_ROOT 提供 collectstatic 後的靜態檔
+依 Accept-Encoding 回傳預先壓縮的 .br / .gz，有內容雜湊的檔名加上一年 immutable 快取
+"""
+import json
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+re_accept_encoding = re.compile(r'\s*([\w*]+)\s*(?:;\s*q=([\d.]+))?')
+
+
+def _qvalue(value: 'str|None') -> 'float':
+    """未指定為 1；格式錯誤（如 q=1..0）視為 0，不採用該編碼"""
+    if value is None:
+        return 1.0
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def accepted_encodings(header: 'str') -> 'set[str]':
+    encodings = set()
+    for part in header.split(','):
+        match = re_accept_encoding.match(part)
+        if match and _qvalue(match.group(2)) > 0:
+            encodings.add(match.group(1).lower())
+    return encodings
+
+
+def etag_matches(header: 'str', etag: 'str') -> 'bool':
+    """If-None-Match 以弱比對判斷，可帶多個 ETag 或 *"""
+    etags = parse_etags(header)
+    return '*' in etags or etag in (value.removeprefix('W/') for value in etags)
+
+
+class PrecompressedStaticFilesMiddleware:
+    """需放在 SecurityMiddleware 之後、其他 middleware 之前；開發模式下由 runserver 自行處理靜態檔"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.static_url = '/' + settings.STATIC_URL.lstrip('/')
+        self.static_root = str(getattr(settings, 'STATIC_ROOT', '') or '')
+        self.immutable_names = self._load_hashed_names()
+
+    def _load_hashed_names(self) -> 'set[str]':
+        try:
+            with open(os.path.join(self.static_root, 'staticfiles.json'), encoding='utf-8') as f:
+                return set(json.load(f).get('paths', {}).values())
+        except (OSError, ValueError):
+            return set()
+
+    def __call__(self, request):
+        if self.static_root and request.method in ('GET', 'HEAD') and request.path.startswith(self.static_url):
+            response = self.serve(request, request.path[len(self.static_url):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name: 'str'):
+        try:
+            path = safe_join(self.static_root, name)
+        except ValueError:
+            return None
+        if not os.path.isfile(path) or name.endswith(('.gz', '.br')):
+            return None
+
+        stat = os.stat(path)
+        cache_control = IMMUTABLE_CACHE_CONTROL if name in self.immutable_names else REVALIDATE_CACHE_CONTROL
+        encoding = suffix = None
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for candidate, candidate_suffix in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + candidate_suffix):
+                encoding, suffix = candidate, candidate_suffix
+                break
+        # 各編碼的內容不同，ETag 依編碼區分，避免快取把 br 的驗證結果套到原檔或 gzip
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag) or (
+            'HTTP_IF_NONE_MATCH' not in request.META
+            and (parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', '')) or 0) >= int(stat.st_mtime)
+        ):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = cache_control
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+
+        content_type, _ = mimetypes.guess_type(path)
+        response = FileResponse(open(path + (suffix or ''), 'rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = cache_control
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -5,6 +5,8 @@ Django settings for ExpenseTracker project.
 from pathlib import Path
 import os
 
+from .settings_local import settings as app_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -34,10 +36,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "CoDevStudio.middleware.static_files.PrecompressedStaticFilesMiddleware",
+    "CoDevStudio.middleware.compression.ResponseCompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "CoDevStudio.middleware.profiling.SamplingProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -68,6 +73,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL 讓背景 worker 寫入時不會阻擋網頁請求的讀取
+            'init_command': 'PRAGMA journal_mode=WAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+# Cache
+# 資料版本號需跨行程共用（網頁、run_worker 與管理指令），不可用 LocMem / Dummy
+# 單機使用檔案快取（遞增版本號以快取目錄的檔案鎖依序進行，不能放在多台主機共用的網路磁碟）；
+# 多台主機請改用 Redis / Memcached（遞增版本號為原子操作）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(app_settings.TMP_ROOT, 'django_cache'),
     }
 }
 
@@ -88,9 +110,80 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    # collectstatic 產生內容雜湊檔名與 .gz/.br 壓縮檔
+    "staticfiles": {"BACKEND": "CoDevStudio.storage.CompressedManifestStaticFilesStorage"},
+}
+STATIC_COMPRESS_MIN_SIZE = 256     # 小於此大小的靜態檔不預先壓縮（bytes）
+RESPONSE_COMPRESS_MIN_SIZE = 1024  # 小於此大小的 HTML/JSON 回應不壓縮（bytes）
+
+# Tiered Storage Settings (Hot/Cold Data Separation)
+ARCHIVE_ROOT = app_settings.ARCHIVE_ROOT
+ARCHIVE_URL = app_settings.ARCHIVE_URL
+TMP_ROOT = app_settings.TMP_ROOT
+ARCHIVE_MAX_FOLDER_SIZE = app_settings.ARCHIVE_MAX_FOLDER_SIZE
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS Settings
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Email
+EMAIL_BACKEND = app_settings.EMAIL_BACKEND
+EMAIL_HOST = app_settings.EMAIL_HOST or 'localhost'
+EMAIL_HOST_USER = app_settings.EMAIL_HOST_USER or ''
+EMAIL_HOST_PASSWORD = app_settings.EMAIL_HOST_PASSWORD or ''
+DEFAULT_FROM_EMAIL = app_settings.EMAIL_HOST_USER or 'webmaster@localhost'
+STATEMENT_EMAIL_BATCH_SIZE = 50  # 對帳單每次 send_messages 的封數（共用同一條連線）
+
+# Notification Outbox（與記帳異動同交易寫入，由 dispatch_outbox 背景工作合併寄出）
+EXPENSE_CHANGE_NOTIFICATIONS = True  # 記帳新增 / 更新 / 刪除時通知付款人與分攤者
+OUTBOX_DIGEST_DELAY = 60             # 寫入後延遲幾秒寄送，期間同一收件人的通知合併成一封
+OUTBOX_BATCH_SIZE = 100              # 每批（共用一條郵件連線）的收件人數
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF = 60            # 重試延遲基數（秒），第 n 次重試延遲 backoff * 2^(n-1)
+OUTBOX_STALE_AFTER = 60 * 10         # 取出後超過此秒數未完成視為寄送工作已失聯，放回佇列
+
+# Budgets
+BUDGET_ALERT_THRESHOLDS = (80, 100)  # 每月支出跨過預算的這些百分比時排入警示
+BUDGET_ALERT_RECIPIENTS = []         # 類型預算警示的收件人；參與者預算寄給該參與者
+
+# Dashboard
+DASHBOARD_DAILY_MAX_DAYS = 366       # 儀表板自訂區間的最長天數（每日金額每天一筆）
+
+# Request Profiling（結果寫到 TMP_ROOT/profiles，於 /admin/profiles/ 檢視）
+PROFILER_ENABLED = True
+PROFILER_SAMPLE_RATE = 0.0           # 隨機抽樣分析的請求比例，0 為關閉
+PROFILER_INTERVAL = 0.005            # 堆疊取樣間隔（秒）
+PROFILER_TOKEN_MAX_AGE = 60 * 60     # X-Profile-Token 有效秒數
+PROFILER_MAX_PROFILES = 200          # 保留的分析結果份數
+
+# Background Jobs
+JOB_WORKER_POLL_INTERVAL = 1.0  # 無工作時的輪詢間隔（秒）
+JOB_DEFAULT_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 5  # 重試延遲基數（秒），第 n 次重試延遲 backoff * 2^(n-1)
+JOB_STALE_AFTER = 60 * 30  # 執行中超過此秒數沒有心跳視為 worker 已失聯，重新排入佇列（次數用完則標記失敗）
+JOB_HEARTBEAT_INTERVAL = 60  # 執行中的工作每隔幾秒更新一次心跳
+JOB_STALE_CHECK_INTERVAL = 60  # worker 每隔幾秒檢查一次失聯的工作
+
+# OpenSearch Settings
+OPENSEARCH_HOST = app_settings.OPENSEARCH_HOST
+OPENSEARCH_USERNAME = app_settings.OPENSEARCH_USERNAME
+OPENSEARCH_PASSWORD = app_settings.OPENSEARCH_PASSWORD
+OPENSEARCH_VERIFY_CERTS = app_settings.OPENSEARCH_VERIFY_CERTS
+OPENSEARCH_TIMEOUT = app_settings.OPENSEARCH_TIMEOUT
+OPENSEARCH_MAX_RETRIES = app_settings.OPENSEARCH_MAX_RETRIES
+OPENSEARCH_RETRY_ON_TIMEOUT = app_settings.OPENSEARCH_RETRY_ON_TIMEOUT
+OPENSEARCH_HTTP_COMPRESS = app_settings.OPENSEARCH_HTTP_COMPRESS
+OPENSEARCH_INDEX_CACHE_TIMEOUT = app_settings.OPENSEARCH_INDEX_CACHE_TIMEOUT
+
+# Expense Search
+# 單機或測試用行程內索引；多台主機請改用 'ExpenseTracker.search.opensearch.OpenSearchBackend'
+EXPENSE_SEARCH_BACKEND = 'ExpenseTracker.search.inprocess.InProcessSearchBackend'
+EXPENSE_SEARCH_INDEX = 'expense-tracker-expenses'
+EXPENSE_SEARCH_BATCH_SIZE = 500       # write-behind 與重建索引的批次大小
+EXPENSE_SEARCH_FLUSH_INTERVAL = 2.0   # write-behind 最長延遲（秒）
+EXPENSE_SEARCH_MAX_HITS = 10000       # 記帳列表關鍵字搜尋最多取回的筆數
@@ -0,0 +1,62 @@
+"""
+靜態檔案儲存
+collectstatic 時以內容雜湊命名，並預先產生 gzip / brotli 壓縮檔，執行期不需再壓縮
+"""
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compress_min_size = getattr(settings, 'STATIC_COMPRESS_MIN_SIZE', 256)
+
+    def stored_name(self, name):
+        # 找不到檔案時退回原檔名，避免少一個靜態檔就讓整頁 500
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            for compressed_name in self.compress_file(name):
+                yield name, compressed_name, True
+
+    def compress_file(self, name: 'str') -> 'list[str]':
+        """寫出 name.gz / name.br；壓縮後沒有變小的不保留"""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return []
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        if len(content) < self.compress_min_size:
+            return []
+
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content, quality=11)))
+
+        written = []
+        for suffix, compressed in variants:
+            if len(compressed) >= len(content):
+                continue
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(name + suffix)
+        return written
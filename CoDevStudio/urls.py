@@ -5,7 +5,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
 
+from . import views
+
 urlpatterns = [
+    path("admin/profiles/", admin.site.admin_view(views.profile_list), name="admin_profiles"),
+    path(
+        "admin/profiles/<str:profile_id>.<str:kind>",
+        admin.site.admin_view(views.profile_download),
+        name="admin_profile_download",
+    ),
     path("admin/", admin.site.urls),
     path("expense/", include("ExpenseTracker.urls")),
     # Default redirect to expense list
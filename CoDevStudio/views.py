@@ -0,0 +1,24 @@
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+
+from .middleware import profiling
+
+
+def profile_list(request):
+    """最近的請求分析結果（只限 staff，經 admin_view 包裝）"""
+    context = {
+        **admin.site.each_context(request),
+        'title': '請求分析',
+        'profiles': profiling.list_profiles(),
+        'profile_dir': profiling.get_profile_dir(),
+    }
+    return render(request, 'admin/profile_list.html', context)
+
+
+def profile_download(request, profile_id, kind):
+    path = profiling.get_profile_path(profile_id, '.' + kind)
+    if path is None:
+        raise Http404
+    content_type = 'application/json' if kind == 'json' else 'text/plain; charset=utf-8'
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name, content_type=content_type)
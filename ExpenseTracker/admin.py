@@ -1,11 +1,110 @@
-from django.contrib import admin
-from .models import ExpenseCategory, Participant, Expense, ExpenseSplit
+import hashlib
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import cache as data_cache
+from .batch import BatchError, recategorize_expenses, reassign_payer, resplit_expenses_evenly, delete_expenses
+from .choices import CachedModelChoiceField, category_choices, participant_choices
+from .models import ExpenseCategory, Participant, Expense, ExpenseSplit, Job, Budget, BudgetAlert, OutboxMessage
+from .outbox import schedule_dispatch
+from .search import keyword_filter
+
+
+# PostgreSQL 上未篩選的資料表超過此筆數時改用 pg_class 的估計值
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+
+CHOICE_SOURCES = {
+    ExpenseCategory: category_choices,
+    Participant: participant_choices,
+}
+
+
+class CachedCountPaginator(Paginator):
+    """
+    changelist 分頁，筆數依記帳資料版本號快取，記帳沒有異動時翻頁不再執行 COUNT(*)
+    只有 PostgreSQL 上未篩選的大表改用 pg_class.reltuples 的估計值；
+    SQLite 等其他資料庫一律是精確的 COUNT(*)，每次記帳異動後的第一次瀏覽仍會全表計數
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = queryset.query
+        if not query.where:
+            estimate = self._estimate(queryset)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+
+        try:
+            sql, params = query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        digest = hashlib.md5(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+        version = data_cache.get_data_version(data_cache.EXPENSE)
+        key = f'expense_tracker:admin_count:{version}:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, data_cache.FRAGMENT_CACHE_TIMEOUT)
+        return count
+
+    @staticmethod
+    def _estimate(queryset) -> 'int|None':
+        """PostgreSQL 的統計筆數；其他資料庫沒有便宜的估計方式，回傳 None"""
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] > 0 else None
+
+
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """類型 / 參與者篩選選項取自選項快取，不再每次載入整張表"""
+
+    def field_choices(self, field, request, model_admin):
+        source = CHOICE_SOURCES[field.remote_field.model]
+        return [(obj.pk, str(obj)) for obj in source.get_objects()]
+
+
+class ExpenseActionForm(ActionForm):
+    """批次操作列的額外欄位"""
+    category = CachedModelChoiceField(category_choices, required=False, label='類型')
+    paid_by = CachedModelChoiceField(participant_choices, required=False, empty_label='（無付款人）', label='付款人')
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    paginator = CachedCountPaginator
+    # 篩選後不再另外計算全表筆數
+    show_full_result_count = False
 
 
 class ExpenseSplitInline(admin.TabularInline):
     model = ExpenseSplit
     extra = 1
 
+    def get_queryset(self, request):
+        # 每列標題會讀 participant.name
+        return super().get_queryset(request).select_related('participant')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # 每列的參與者下拉選單共用選項快取，不再每列查詢一次
+        if db_field.name == 'participant':
+            return CachedModelChoiceField(participant_choices, label=db_field.verbose_name)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 @admin.register(ExpenseCategory)
 class ExpenseCategoryAdmin(admin.ModelAdmin):
@@ -24,17 +123,116 @@ class ParticipantAdmin(admin.ModelAdmin):
 
 
 @admin.register(Expense)
-class ExpenseAdmin(admin.ModelAdmin):
+class ExpenseAdmin(ScalableModelAdmin):
     list_display = ['date', 'time', 'item_name', 'category', 'amount', 'paid_by', 'created_at']
-    list_filter = ['category', 'date', 'paid_by']
+    list_select_related = ['category', 'paid_by']
+    # date_hierarchy 每次都要掃描不重複日期，改用固定選項的日期篩選
+    list_filter = [
+        ('category', CachedRelatedFieldListFilter),
+        'date',
+        ('paid_by', CachedRelatedFieldListFilter),
+    ]
     search_fields = ['item_name', 'note']
-    date_hierarchy = 'date'
+    autocomplete_fields = ['category', 'paid_by']
     inlines = [ExpenseSplitInline]
     list_per_page = 20
 
+    def get_search_results(self, request, queryset, search_term):
+        # 與記帳列表相同，由搜尋後端比對品項與備註
+        if not search_term:
+            return queryset, False
+        return queryset.filter(keyword_filter(search_term)), False
+
+    # 批次操作以集合式更新完成，不逐筆 save/delete
+    action_form = ExpenseActionForm
+    actions = ['recategorize_selected', 'reassign_payer_selected', 'resplit_selected_evenly']
+
+    def _run_bulk(self, request, queryset, func, *args):
+        try:
+            return func(queryset, *args)
+        except BatchError as exc:
+            self.message_user(request, str(exc), messages.ERROR)
+            return None
+
+    @admin.action(description='將選取的記帳改為指定類型')
+    def recategorize_selected(self, request, queryset):
+        form = ExpenseActionForm(request.POST)
+        if not form.is_valid() or not form.cleaned_data['category']:
+            self.message_user(request, '請先選擇類型', messages.ERROR)
+            return
+        count = self._run_bulk(request, queryset, recategorize_expenses, form.cleaned_data['category'])
+        if count is not None:
+            self.message_user(request, f'已將 {count} 筆記帳改為「{form.cleaned_data["category"]}」')
+
+    @admin.action(description='將選取的記帳改為指定付款人')
+    def reassign_payer_selected(self, request, queryset):
+        form = ExpenseActionForm(request.POST)
+        if not form.is_valid():
+            self.message_user(request, '付款人不存在', messages.ERROR)
+            return
+        count = self._run_bulk(request, queryset, reassign_payer, form.cleaned_data['paid_by'])
+        if count is not None:
+            self.message_user(request, f'已變更 {count} 筆記帳的付款人')
+
+    @admin.action(description='選取的記帳依原分攤者重新平均分攤')
+    def resplit_selected_evenly(self, request, queryset):
+        count = self._run_bulk(request, queryset, resplit_expenses_evenly)
+        if count is not None:
+            self.message_user(request, f'已重新平均分攤 {count} 筆記帳')
+
+    def delete_queryset(self, request, queryset):
+        # 內建「刪除所選」確認後改走批次刪除
+        self._run_bulk(request, queryset, delete_expenses)
+
 
 @admin.register(ExpenseSplit)
-class ExpenseSplitAdmin(admin.ModelAdmin):
+class ExpenseSplitAdmin(ScalableModelAdmin):
     list_display = ['expense', 'participant', 'share_amount']
-    list_filter = ['participant']
+    list_select_related = ['expense', 'participant']
+    list_filter = [('participant', CachedRelatedFieldListFilter)]
     search_fields = ['expense__item_name', 'participant__name']
+    autocomplete_fields = ['expense', 'participant']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'progress', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'task']
+    readonly_fields = ['started_at', 'heartbeat_at', 'finished_at', 'locked_by', 'created_at']
+
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'category', 'participant', 'amount', 'is_active', 'updated_at']
+    list_select_related = ['category', 'participant']
+    list_filter = ['is_active']
+    list_editable = ['amount', 'is_active']
+
+
+@admin.register(BudgetAlert)
+class BudgetAlertAdmin(admin.ModelAdmin):
+    list_display = ['budget', 'period', 'threshold', 'spent', 'created_at', 'notified_at']
+    list_select_related = ['budget__category', 'budget__participant']
+    list_filter = ['threshold', 'period']
+    readonly_fields = ['budget', 'period', 'threshold', 'spent', 'created_at', 'notified_at']
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'recipient', 'kind', 'subject', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['recipient']
+    readonly_fields = [
+        'recipient', 'kind', 'subject', 'body', 'attempts', 'next_attempt_at',
+        'locked_by', 'locked_at', 'last_error', 'created_at', 'sent_at',
+    ]
+    actions = ['retry_selected']
+
+    @admin.action(description='重新寄送選取的失敗通知')
+    def retry_selected(self, request, queryset):
+        count = queryset.filter(status=OutboxMessage.STATUS_FAILED).update(
+            status=OutboxMessage.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now(),
+        )
+        if count:
+            schedule_dispatch()
+        self.message_user(request, f'已重新排入 {count} 則通知')
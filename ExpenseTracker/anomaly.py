@@ -0,0 +1,406 @@
+"""
+異常記帳偵測
+每個類型維護線上統計（Welford 平均/變異數 + DDSketch 分位數），記憶體與歷史筆數無關
+新記帳寫入時只讀寫該類型的統計列即可評分，不需重掃歷史
+"""
+import math
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Expense, CategoryAmountStats, ExpenseAnomaly
+
+
+Z_THRESHOLD = getattr(settings, 'ANOMALY_Z_THRESHOLD', 3.0)
+PERCENTILE_THRESHOLD = getattr(settings, 'ANOMALY_PERCENTILE_THRESHOLD', 0.99)
+MIN_SAMPLES = getattr(settings, 'ANOMALY_MIN_SAMPLES', 20)
+REBUILD_CHUNK_SIZE = 2000
+
+
+@dataclass
+class RunningStats:
+    """Welford 線上平均與變異數，可合併"""
+    count: 'int' = 0
+    mean: 'float' = 0.0
+    m2: 'float' = 0.0
+
+    def add(self, x: 'float'):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other: 'RunningStats'):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def subtract(self, other: 'RunningStats'):
+        """merge 的反運算：移除 other 所代表的樣本"""
+        if not other.count:
+            return
+        count = self.count - other.count
+        if count <= 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean = (self.count * self.mean - other.count * other.mean) / count
+        delta = other.mean - mean
+        self.m2 = max(0.0, self.m2 - other.m2 - delta * delta * count * other.count / self.count)
+        self.mean = mean
+        self.count = count
+
+    @property
+    def std(self) -> 'float':
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def z_score(self, x: 'float') -> 'float':
+        std = self.std
+        return (x - self.mean) / std if std else 0.0
+
+
+class QuantileSketch:
+    """
+    DDSketch：對數分桶的分位數 sketch，相對誤差固定，可合併
+    桶數超過上限時合併最小的桶，只影響低分位數的精度
+    """
+
+    def __init__(self, relative_accuracy: 'float' = 0.01, max_bins: 'int' = 512):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: 'dict[int, int]' = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _key(self, x: 'float') -> 'int':
+        return math.ceil(math.log(x) / self.log_gamma)
+
+    def _value(self, key: 'int') -> 'float':
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, x: 'float'):
+        self.count += 1
+        if x <= 0:
+            self.zero_count += 1
+            return
+        key = self._key(x)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: 'QuantileSketch'):
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._collapse()
+
+    def subtract(self, other: 'QuantileSketch'):
+        """移除 other 的樣本；已被合併掉的低位桶從目前最低的桶扣除"""
+        for key, count in other.bins.items():
+            if key not in self.bins and self.bins:
+                key = min(self.bins)
+            if key in self.bins:
+                self.bins[key] -= count
+                if self.bins[key] <= 0:
+                    del self.bins[key]
+        self.zero_count = max(0, self.zero_count - other.zero_count)
+        self.count = max(0, self.count - other.count)
+
+    def _collapse(self):
+        if len(self.bins) <= self.max_bins:
+            return
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.bins[target] += self.bins.pop(key)
+
+    def quantile(self, q: 'float') -> 'float':
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return self._value(key)
+        return self._value(max(self.bins))
+
+    def rank(self, x: 'float') -> 'float':
+        """小於等於 x 的比例"""
+        if not self.count:
+            return 0.0
+        if x <= 0:
+            return self.zero_count / self.count
+        limit = self._key(x)
+        below = self.zero_count + sum(count for key, count in self.bins.items() if key <= limit)
+        return below / self.count
+
+    def to_dict(self) -> 'dict':
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_bins': self.max_bins,
+            'bins': {str(key): count for key, count in self.bins.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: 'dict') -> 'QuantileSketch':
+        sketch = cls(
+            relative_accuracy=data.get('relative_accuracy', 0.01),
+            max_bins=data.get('max_bins', 512),
+        )
+        sketch.bins = {int(key): count for key, count in data.get('bins', {}).items()}
+        sketch.zero_count = data.get('zero_count', 0)
+        sketch.count = data.get('count', 0)
+        return sketch
+
+
+class CategoryDetector:
+    """單一類型的統計與評分"""
+
+    def __init__(self, stats: 'RunningStats' = None, sketch: 'QuantileSketch' = None):
+        self.stats = stats or RunningStats()
+        self.sketch = sketch or QuantileSketch()
+
+    def score(self, x: 'float') -> 'tuple[float, float, str]':
+        """回傳 (z, 百分位, 原因)；未達異常標準時原因為空字串"""
+        z = self.stats.z_score(x)
+        percentile = self.sketch.rank(x)
+        reason = ''
+        if self.stats.count >= MIN_SAMPLES and z >= Z_THRESHOLD and percentile >= PERCENTILE_THRESHOLD:
+            ratio = x / self.stats.mean if self.stats.mean else 0
+            reason = f'金額為該類型平均的 {ratio:.1f} 倍（z={z:.1f}）'
+        return z, percentile, reason
+
+    def add(self, x: 'float'):
+        self.stats.add(x)
+        self.sketch.add(x)
+
+    def merge(self, other: 'CategoryDetector'):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+
+    def subtract(self, other: 'CategoryDetector'):
+        self.stats.subtract(other.stats)
+        self.sketch.subtract(other.sketch)
+
+    @classmethod
+    def from_row(cls, row: 'CategoryAmountStats') -> 'CategoryDetector':
+        return cls(
+            stats=RunningStats(count=row.count, mean=row.mean, m2=row.m2),
+            sketch=QuantileSketch.from_dict(row.sketch) if row.sketch else None,
+        )
+
+    def to_row(self, row: 'CategoryAmountStats') -> 'CategoryAmountStats':
+        row.count = self.stats.count
+        row.mean = self.stats.mean
+        row.m2 = self.stats.m2
+        row.sketch = self.sketch.to_dict()
+        return row
+
+
+def _score_stream(rows, detectors: 'dict') -> 'list[ExpenseAnomaly]':
+    """依序評分後再納入統計，回傳異常清單"""
+    anomalies = []
+    for expense_id, category_id, amount in rows:
+        detector = detectors.setdefault(category_id, CategoryDetector())
+        x = float(amount)
+        z, percentile, reason = detector.score(x)
+        if reason:
+            anomalies.append(ExpenseAnomaly(
+                expense_id=expense_id, z_score=z, percentile=percentile, reason=reason,
+            ))
+        detector.add(x)
+    return anomalies
+
+
+def _category_condition(category_ids) -> 'Q':
+    condition = Q(category_id__in=[pk for pk in category_ids if pk is not None])
+    if None in category_ids:
+        condition |= Q(category__isnull=True)
+    return condition
+
+
+def score_new_expenses(rows) -> 'list[ExpenseAnomaly]':
+    """
+    新記帳評分並更新統計
+    rows: [(expense_id, category_id, amount), ...]，只讀寫相關類型的統計列
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    category_ids = {category_id for _, category_id, _ in rows}
+    condition = _category_condition(category_ids)
+
+    with transaction.atomic():
+        stats_rows = {
+            row.category_id: row
+            for row in CategoryAmountStats.objects.select_for_update().filter(condition)
+        }
+        detectors = {pk: CategoryDetector.from_row(row) for pk, row in stats_rows.items()}
+        anomalies = _score_stream(rows, detectors)
+
+        new_rows = []
+        for category_id, detector in detectors.items():
+            row = stats_rows.get(category_id) or CategoryAmountStats(category_id=category_id)
+            detector.to_row(row)
+            if row.pk:
+                row.save(update_fields=['count', 'mean', 'm2', 'sketch', 'updated_at'])
+            else:
+                new_rows.append(row)
+        CategoryAmountStats.objects.bulk_create(new_rows)
+        ExpenseAnomaly.objects.bulk_create(anomalies, ignore_conflicts=True)
+    return anomalies
+
+
+def adjust_category_statistics(removed=(), added=()):
+    """
+    批次改類型或刪除記帳後，以合併/扣除一次調整相關類型的統計，不重掃歷史
+    removed / added: [(expense_id, category_id, amount), ...]
+    移入新類型的記帳以新類型的統計重新評分，原本的異常標記一併更新
+    """
+    removed, added = list(removed), list(added)
+    if not removed and not added:
+        return
+    deltas = {}  # category_id -> (移入, 移出)
+    for _, category_id, amount in added:
+        deltas.setdefault(category_id, (CategoryDetector(), CategoryDetector()))[0].add(float(amount))
+    for _, category_id, amount in removed:
+        deltas.setdefault(category_id, (CategoryDetector(), CategoryDetector()))[1].add(float(amount))
+
+    with transaction.atomic():
+        stats_rows = {
+            row.category_id: row
+            for row in CategoryAmountStats.objects.select_for_update().filter(_category_condition(set(deltas)))
+        }
+        detectors = {}
+        new_rows = []
+        for category_id, (plus, minus) in deltas.items():
+            row = stats_rows.get(category_id) or CategoryAmountStats(category_id=category_id)
+            detector = CategoryDetector.from_row(row) if row.pk else CategoryDetector()
+            detector.subtract(minus)
+            detector.merge(plus)
+            detectors[category_id] = detector
+            detector.to_row(row)
+            if row.pk:
+                row.save(update_fields=['count', 'mean', 'm2', 'sketch', 'updated_at'])
+            else:
+                new_rows.append(row)
+        CategoryAmountStats.objects.bulk_create(new_rows)
+
+        if added:
+            # 異常標記遠少於記帳，先取出全部再比對，避免上萬個 IN 參數
+            moved_ids = {expense_id for expense_id, _, _ in added}
+            stale_ids = [pk for pk in ExpenseAnomaly.objects.values_list('expense_id', flat=True) if pk in moved_ids]
+            if stale_ids:
+                ExpenseAnomaly.objects.filter(expense_id__in=stale_ids).delete()
+            anomalies = []
+            scores = {}  # 同類型同金額只評分一次
+            for expense_id, category_id, amount in added:
+                key = (category_id, amount)
+                if key not in scores:
+                    scores[key] = detectors[category_id].score(float(amount))
+                z, percentile, reason = scores[key]
+                if reason:
+                    anomalies.append(ExpenseAnomaly(
+                        expense_id=expense_id, z_score=z, percentile=percentile, reason=reason,
+                    ))
+            ExpenseAnomaly.objects.bulk_create(anomalies, ignore_conflicts=True)
+
+
+def _stream_expenses(chunk_size: 'int'):
+    """依 (日期, 時間, 主鍵) 以 keyset 分批讀取，每批查詢結束後才寫入，不必整段持有讀取游標"""
+    queryset = Expense.objects.order_by('date', 'time', 'pk').values_list('date', 'time', 'pk', 'category_id', 'amount')
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            day, at, pk = last
+            page = page.filter(Q(date__gt=day) | Q(date=day, time__gt=at) | Q(date=day, time=at, pk__gt=pk))
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][:3]
+        yield [(pk, category_id, amount) for _, _, pk, category_id, amount in rows]
+
+
+def _save_chunk_anomalies(chunk, anomalies: 'list[ExpenseAnomaly]', flagged_ids: 'set'):
+    """
+    以這批重新評分的結果更新異常標記：既有的就地更新（保留偵測時間），新的建立，不再異常的刪除
+    flagged_ids: 重建開始時已有異常標記的記帳，只查回這批中相關的標記
+    """
+    expense_ids = {expense_id for expense_id, _, _ in chunk} & flagged_ids
+    expense_ids.update(anomaly.expense_id for anomaly in anomalies)
+    existing = {
+        anomaly.expense_id: anomaly
+        for anomaly in ExpenseAnomaly.objects.filter(expense_id__in=expense_ids)
+    } if expense_ids else {}
+    updated, created = [], []
+    for anomaly in anomalies:
+        current = existing.pop(anomaly.expense_id, None)
+        if current is None:
+            created.append(anomaly)
+            continue
+        current.z_score, current.percentile, current.reason = anomaly.z_score, anomaly.percentile, anomaly.reason
+        updated.append(current)
+    with transaction.atomic():
+        if existing:
+            ExpenseAnomaly.objects.filter(pk__in=[anomaly.pk for anomaly in existing.values()]).delete()
+        ExpenseAnomaly.objects.bulk_update(updated, ['z_score', 'percentile', 'reason'])
+        ExpenseAnomaly.objects.bulk_create(created, ignore_conflicts=True)
+
+
+def rebuild_statistics(chunk_size: 'int' = REBUILD_CHUNK_SIZE, progress=None) -> 'dict':
+    """
+    依日期串流全部記帳重建統計與異常
+    記憶體只與類型數相關；progress(done, total) 可回報進度
+    每批的異常標記各自提交，不會整段重建期間都持有寫入鎖；統計最後在一個短交易內寫入
+    重建期間新增的記帳若已被串流略過，統計會少算這幾筆，下次重建時校正
+    """
+    total = Expense.objects.count()
+    # 異常標記遠少於記帳，先取出全部，每批只查回相關的幾筆
+    flagged_ids = set(ExpenseAnomaly.objects.values_list('expense_id', flat=True))
+    detectors = {}
+    anomaly_count = 0
+    done = 0
+    for chunk in _stream_expenses(chunk_size):
+        anomalies = _score_stream(chunk, detectors)
+        _save_chunk_anomalies(chunk, anomalies, flagged_ids)
+        anomaly_count += len(anomalies)
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+    with transaction.atomic():
+        stats_rows = {row.category_id: row for row in CategoryAmountStats.objects.select_for_update()}
+        new_rows = []
+        for category_id, detector in detectors.items():
+            row = stats_rows.pop(category_id, None) or CategoryAmountStats(category_id=category_id)
+            detector.to_row(row)
+            if row.pk:
+                row.save(update_fields=['count', 'mean', 'm2', 'sketch', 'updated_at'])
+            else:
+                new_rows.append(row)
+        CategoryAmountStats.objects.bulk_create(new_rows)
+        # 已沒有記帳的類型
+        CategoryAmountStats.objects.filter(pk__in=[row.pk for row in stats_rows.values()]).delete()
+
+    return {
+        'expenses': done,
+        'categories': len(detectors),
+        'anomalies': anomaly_count,
+    }
@@ -5,3 +5,13 @@ class ExpenseTrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ExpenseTracker'
     verbose_name = '記帳系統'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from . import checks, signals, tasks  # noqa: F401
+        from .choices import warm_choice_cache
+
+        # 初始化階段不宜查資料庫，改在請求開始時預熱選項快取（版本未變時不查詢）
+        request_started.connect(
+            warm_choice_cache, dispatch_uid='expense_tracker_warm_choice_cache'
+        )
@@ -0,0 +1,370 @@
+"""
+冷儲存封存
+已結束年度的記帳與分攤寫成欄式壓縮檔放到 ARCHIVE_ROOT，再從熱資料表分批刪除
+封存時同步累加每日類型彙總與參與者收支彙總，統計與結算仍能得到全期間的正確結果
+
+檔案格式（單一檔案可用 mmap 只讀取需要的欄位）：
+    MAGIC(8) | header 長度(8, little endian) | header JSON | 對齊 8 bytes 的欄位區塊...
+"""
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import date, time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .batch import delete_expenses
+from .models import (
+    Expense,
+    ExpenseSplit,
+    ArchiveSegment,
+    ArchivedDailyRollup,
+    ArchivedBalance,
+)
+
+
+MAGIC = b'ETARC001'
+FORMAT_VERSION = 1
+DEFAULT_BATCH_SIZE = 20000
+CODEC = getattr(settings, 'ARCHIVE_CODEC', 'zlib')  # 'zlib' 或 'raw'（不壓縮，可直接 mmap 取值）
+
+EXPENSE_COLUMNS = ['id', 'date', 'time', 'item_name', 'category_id', 'amount', 'note', 'paid_by_id']
+SPLIT_COLUMNS = ['id', 'expense_id', 'participant_id', 'share_amount']
+
+
+class ArchiveError(RuntimeError):
+    """封存流程錯誤"""
+
+
+def get_archive_root() -> 'Path':
+    return Path(settings.ARCHIVE_ROOT) / 'expense_tracker'
+
+
+def _to_cents(value: 'Decimal') -> 'int':
+    return int((value * 100).quantize(Decimal('1')))
+
+
+def _encode_columns(expenses, splits) -> 'dict':
+    """把資料列轉成欄式陣列；日期存序數、時間存秒、金額存分、空值存 -1"""
+    return {
+        'expenses': {
+            'id': ('q', [row[0] for row in expenses]),
+            'date': ('i', [row[1].toordinal() for row in expenses]),
+            'time': ('i', [row[2].hour * 3600 + row[2].minute * 60 + row[2].second for row in expenses]),
+            'item_name': ('str', [row[3] for row in expenses]),
+            'category_id': ('q', [-1 if row[4] is None else row[4] for row in expenses]),
+            'amount': ('q', [_to_cents(row[5]) for row in expenses]),
+            'note': ('str', [row[6] for row in expenses]),
+            'paid_by_id': ('q', [-1 if row[7] is None else row[7] for row in expenses]),
+        },
+        'splits': {
+            'id': ('q', [row[0] for row in splits]),
+            'expense_id': ('q', [row[1] for row in splits]),
+            'participant_id': ('q', [row[2] for row in splits]),
+            'share_amount': ('q', [_to_cents(row[3]) for row in splits]),
+        },
+    }
+
+
+def _pack_block(raw: 'bytes', codec: 'str') -> 'bytes':
+    return zlib.compress(raw, 6) if codec == 'zlib' else raw
+
+
+def _pad(data: 'bytes') -> 'bytes':
+    return data + b'\0' * (-len(data) % 8)
+
+
+def build_segment(expenses, splits, codec: 'str' = None) -> 'bytes':
+    """組出封存檔內容"""
+    codec = codec or CODEC
+    blocks = []
+    body = bytearray()
+
+    def add_block(raw: 'bytes') -> 'int':
+        packed = _pack_block(raw, codec)
+        blocks.append({'offset': len(body), 'length': len(packed), 'raw_length': len(raw)})
+        body.extend(_pad(packed))
+        return len(blocks) - 1
+
+    tables = {}
+    for table, columns in _encode_columns(expenses, splits).items():
+        rows = len(expenses) if table == 'expenses' else len(splits)
+        spec = {}
+        for name, (typecode, values) in columns.items():
+            if typecode == 'str':
+                encoded = [value.encode('utf-8') for value in values]
+                offsets = array('q', [0])
+                for value in encoded:
+                    offsets.append(offsets[-1] + len(value))
+                spec[name] = {
+                    'type': 'str',
+                    'offsets': add_block(offsets.tobytes()),
+                    'data': add_block(b''.join(encoded)),
+                }
+            else:
+                spec[name] = {'type': typecode, 'block': add_block(array(typecode, values).tobytes())}
+        tables[table] = {'rows': rows, 'columns': spec}
+
+    header = json.dumps({
+        'version': FORMAT_VERSION,
+        'codec': codec,
+        'byteorder': sys.byteorder,
+        'blocks': blocks,
+        'tables': tables,
+    }).encode('utf-8')
+    prefix = MAGIC + len(header).to_bytes(8, 'little') + header
+    return _pad(prefix) + bytes(body)
+
+
+class ArchiveSegmentReader:
+    """以 mmap 讀取封存檔，只解壓需要的欄位"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:8] != MAGIC:
+            self.close()
+            raise ArchiveError(f'不是封存檔：{self.path}')
+        header_length = int.from_bytes(self._mmap[8:16], 'little')
+        self.header = json.loads(self._mmap[16:16 + header_length])
+        self._data_start = 16 + header_length + (-(16 + header_length) % 8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def _block(self, index: 'int') -> 'bytes':
+        block = self.header['blocks'][index]
+        start = self._data_start + block['offset']
+        data = self._mmap[start:start + block['length']]
+        return zlib.decompress(data) if self.header['codec'] == 'zlib' else data
+
+    def rows(self, table: 'str') -> 'int':
+        return self.header['tables'][table]['rows']
+
+    def column(self, table: 'str', name: 'str'):
+        """取出單一欄位：數值欄回傳 array，文字欄回傳 list[str]"""
+        spec = self.header['tables'][table]['columns'][name]
+        if spec['type'] == 'str':
+            offsets = array('q')
+            offsets.frombytes(self._block(spec['offsets']))
+            data = self._block(spec['data'])
+            if self.header['byteorder'] != sys.byteorder:
+                offsets.byteswap()
+            return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+        values = array(spec['type'])
+        values.frombytes(self._block(spec['block']))
+        if self.header['byteorder'] != sys.byteorder:
+            values.byteswap()
+        return values
+
+    def iter_expenses(self):
+        """還原為與 Expense.values() 相同鍵名的 dict"""
+        columns = {name: self.column('expenses', name) for name in EXPENSE_COLUMNS}
+        for i in range(self.rows('expenses')):
+            seconds = columns['time'][i]
+            yield {
+                'id': columns['id'][i],
+                'date': date.fromordinal(columns['date'][i]),
+                'time': time(seconds // 3600, seconds // 60 % 60, seconds % 60),
+                'item_name': columns['item_name'][i],
+                'category_id': None if columns['category_id'][i] < 0 else columns['category_id'][i],
+                'amount': Decimal(columns['amount'][i]).scaleb(-2),
+                'note': columns['note'][i],
+                'paid_by_id': None if columns['paid_by_id'][i] < 0 else columns['paid_by_id'][i],
+            }
+
+    def iter_splits(self):
+        columns = {name: self.column('splits', name) for name in SPLIT_COLUMNS}
+        for i in range(self.rows('splits')):
+            yield {
+                'id': columns['id'][i],
+                'expense_id': columns['expense_id'][i],
+                'participant_id': columns['participant_id'][i],
+                'share_amount': Decimal(columns['share_amount'][i]).scaleb(-2),
+            }
+
+
+def _folder_size(path: 'Path') -> 'int':
+    if not path.exists():
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def _target_folder(year: 'int', size: 'int') -> 'Path':
+    """同年度依序使用 part-0001、part-0002...，資料夾超過 ARCHIVE_MAX_FOLDER_SIZE 就換下一個"""
+    year_dir = get_archive_root() / str(year)
+    parts = sorted(year_dir.glob('part-*')) if year_dir.exists() else []
+    if parts and _folder_size(parts[-1]) + size <= settings.ARCHIVE_MAX_FOLDER_SIZE:
+        return parts[-1]
+    folder = year_dir / f'part-{len(parts) + 1:04d}'
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+
+def _write_segments(year: 'int', expenses: 'list', splits: 'list') -> 'list[tuple]':
+    """
+    寫出封存檔，單檔超過大小上限時對半切開
+    回傳 [(路徑, 記帳列, 分攤列), ...]
+    """
+    content = build_segment(expenses, splits)
+    if len(content) > settings.ARCHIVE_MAX_FOLDER_SIZE and len(expenses) > 1:
+        middle = len(expenses) // 2
+        boundary = expenses[middle - 1][0]
+        left = [row for row in splits if row[1] <= boundary]
+        right = [row for row in splits if row[1] > boundary]
+        return (
+            _write_segments(year, expenses[:middle], left)
+            + _write_segments(year, expenses[middle:], right)
+        )
+
+    # 先寫到 TMP_ROOT 再搬到冷儲存，避免留下寫到一半的檔案
+    os.makedirs(settings.TMP_ROOT, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=settings.TMP_ROOT, suffix='.etarc', delete=False) as f:
+        f.write(content)
+        tmp_path = f.name
+    folder = _target_folder(year, len(content))
+    path = folder / f'expenses-{expenses[0][0]}-{expenses[-1][0]}.etarc'
+    shutil.move(tmp_path, path)
+    return [(path, expenses, splits)]
+
+
+def _accumulate_rollups(expenses, splits):
+    daily = defaultdict(lambda: [Decimal('0'), 0])
+    paid = defaultdict(Decimal)
+    owed = defaultdict(Decimal)
+    for row in expenses:
+        bucket = daily[(row[1], row[4])]
+        bucket[0] += row[5]
+        bucket[1] += 1
+        if row[7] is not None:
+            paid[row[7]] += row[5]
+    for row in splits:
+        owed[row[2]] += row[3]
+    return daily, paid, owed
+
+
+def _save_rollups(year, daily, paid, owed):
+    existing = {
+        (rollup.date, rollup.category_id): rollup
+        for rollup in ArchivedDailyRollup.objects.filter(date__year=year)
+    }
+    to_create, to_update = [], []
+    for (day, category_id), (total, count) in daily.items():
+        rollup = existing.get((day, category_id))
+        if rollup is None:
+            to_create.append(ArchivedDailyRollup(date=day, category_id=category_id, total=total, count=count))
+        else:
+            rollup.total += total
+            rollup.count += count
+            to_update.append(rollup)
+    ArchivedDailyRollup.objects.bulk_create(to_create)
+    ArchivedDailyRollup.objects.bulk_update(to_update, ['total', 'count'])
+
+    participant_ids = set(paid) | set(owed)
+    balances = ArchivedBalance.objects.in_bulk(participant_ids, field_name='participant_id')
+    to_create, to_update = [], []
+    for participant_id in participant_ids:
+        balance = balances.get(participant_id)
+        if balance is None:
+            balance = ArchivedBalance(participant_id=participant_id)
+            to_create.append(balance)
+        else:
+            to_update.append(balance)
+        balance.paid += paid.get(participant_id, Decimal('0'))
+        balance.owed += owed.get(participant_id, Decimal('0'))
+    ArchivedBalance.objects.bulk_create(to_create)
+    ArchivedBalance.objects.bulk_update(to_update, ['paid', 'owed'])
+
+
+def archive_year(year: 'int', batch_size: 'int' = DEFAULT_BATCH_SIZE, progress=None) -> 'dict':
+    """
+    封存整個年度，只接受已結束的年度
+    以主鍵 keyset 分批處理；每批寫檔成功後才在單一交易內累加彙總並刪除熱資料
+    刪除走批次刪除（raw delete + expenses_bulk_changed），不逐筆觸發 signal
+    progress(done, total) 可回報進度
+    """
+    if year >= timezone.localdate().year:
+        raise ArchiveError('只能封存已結束的年度')
+
+    total = Expense.objects.filter(date__year=year).count()
+    archived_expenses = archived_splits = 0
+    segments = []
+    last_pk = 0
+    while True:
+        expenses = list(
+            Expense.objects.filter(date__year=year, pk__gt=last_pk)
+            .order_by('pk')
+            .values_list(*EXPENSE_COLUMNS)[:batch_size]
+        )
+        if not expenses:
+            break
+        last_pk = expenses[-1][0]
+        expense_ids = [row[0] for row in expenses]
+        splits = list(
+            ExpenseSplit.objects.filter(expense_id__in=expense_ids)
+            .order_by('expense_id', 'pk')
+            .values_list(*SPLIT_COLUMNS)
+        )
+
+        written = _write_segments(year, expenses, splits)
+        try:
+            with transaction.atomic():
+                for path, segment_expenses, segment_splits in written:
+                    ArchiveSegment.objects.create(
+                        path=str(path),
+                        year=year,
+                        first_date=min(row[1] for row in segment_expenses),
+                        last_date=max(row[1] for row in segment_expenses),
+                        expense_count=len(segment_expenses),
+                        split_count=len(segment_splits),
+                        size=path.stat().st_size,
+                    )
+                _save_rollups(year, *_accumulate_rollups(expenses, splits))
+                delete_expenses(Expense.objects.filter(pk__in=expense_ids), max_items=None, notify=False)
+        except Exception:
+            for path, _, _ in written:
+                path.unlink(missing_ok=True)
+            raise
+
+        archived_expenses += len(expenses)
+        archived_splits += len(splits)
+        segments.extend(str(path) for path, _, _ in written)
+        if progress:
+            progress(archived_expenses, total)
+
+    return {
+        'year': year,
+        'expenses': archived_expenses,
+        'splits': archived_splits,
+        'segments': segments,
+    }
+
+
+def iter_archived_expenses(year: 'int' = None):
+    """依封存紀錄讀回記帳"""
+    segments = ArchiveSegment.objects.all()
+    if year:
+        segments = segments.filter(year=year)
+    for segment in segments:
+        with ArchiveSegmentReader(segment.path) as reader:
+            yield from reader.iter_expenses()
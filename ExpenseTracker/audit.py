@@ -0,0 +1,221 @@
+"""
+帳務一致性稽核
+檢查每筆記帳的分攤總和是否等於金額、是否沒有任何分攤，以及指向不存在記帳的孤兒分攤
+
+以主鍵 keyset 分批，每批只執行分組查詢、只讀回有問題的列，記憶體與批次大小相關而與總筆數無關；
+可依日期區間分給多個執行緒平行稽核，fix=True 時每批在單一交易內以 executemany 修正
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Sum
+from django.db.models.functions import Abs
+
+from .dbutils import update_values
+from .models import Expense, ExpenseSplit
+from .services import split_amount_evenly
+from .signals import expenses_bulk_changed
+
+
+AUDIT_BATCH_SIZE = 10000
+
+MISMATCH = 'mismatch'        # 分攤總和不等於金額
+UNSPLIT = 'unsplit'          # 沒有任何分攤（僅回報，無法推得分攤者）
+ORPHAN_SPLIT = 'orphan_split'  # 分攤指向不存在的記帳
+
+# SQLite 的小數加總為浮點數，差距未達半分視為相符
+TOLERANCE = Decimal('0.005')
+
+
+def rescale_shares(amount, shares: 'list[Decimal]') -> 'list[Decimal]':
+    """
+    依原分攤比例重新分配金額，以分為單位用最大餘數法分配，總和必定等於 amount
+    原分攤全為 0 時改為平均分攤；均分造成的尾差修正後與 split_amount_evenly 結果相同
+    """
+    weights = [max(int((Decimal(share) * 100).quantize(Decimal('1'))), 0) for share in shares]
+    total_weight = sum(weights)
+    if total_weight == 0:
+        return split_amount_evenly(amount, len(shares))
+    cents = int((Decimal(amount) * 100).quantize(Decimal('1')))
+    allocated = [cents * weight // total_weight for weight in weights]
+    order = sorted(range(len(weights)), key=lambda i: (-(cents * weights[i] % total_weight), i))
+    for i in order[:cents - sum(allocated)]:
+        allocated[i] += 1
+    return [Decimal(value).scaleb(-2) for value in allocated]
+
+
+def _key_ranges(queryset, batch_size: 'int'):
+    """依主鍵 keyset 切批，每批產生一個 pk 範圍條件；每批只多一次取上界的查詢"""
+    last_pk = 0
+    while True:
+        bound = queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[
+            batch_size - 1:batch_size
+        ].first()
+        if bound is None:
+            yield Q(pk__gt=last_pk)
+            return
+        yield Q(pk__gt=last_pk, pk__lte=bound)
+        last_pk = bound
+
+
+def _inconsistent_expenses(queryset):
+    """分攤總和與金額不符或沒有分攤的記帳"""
+    return queryset.annotate(
+        split_count=Count('splits'),
+        split_total=Sum('splits__share_amount'),
+    ).annotate(
+        split_difference=Abs(F('split_total') - F('amount')),
+    ).filter(
+        Q(split_count=0) | Q(split_difference__gte=TOLERANCE),
+    ).order_by('pk').values_list('pk', 'date', 'amount', 'split_count', 'split_total')
+
+
+def _repair_splits(expense_amounts: 'dict') -> 'int':
+    """依原比例修正分攤金額，回傳更新的分攤筆數"""
+    rows = ExpenseSplit.objects.filter(expense_id__in=list(expense_amounts)).order_by(
+        'expense_id', 'pk',
+    ).values_list('pk', 'expense_id', 'share_amount')
+    splits = {}
+    for pk, expense_id, share in rows:
+        splits.setdefault(expense_id, []).append((pk, share))
+
+    adapt_decimal = connection.ops.adapt_decimalfield_value
+    updates = []
+    for expense_id, members in splits.items():
+        shares = rescale_shares(expense_amounts[expense_id], [share for _, share in members])
+        updates.extend(
+            (adapt_decimal(new, 12, 2), pk)
+            for (pk, old), new in zip(members, shares) if old != new
+        )
+    if updates:
+        update_values(ExpenseSplit, ['share_amount'], updates)
+        expenses_bulk_changed.send(sender=Expense, split_ids=[pk for _, pk in updates])
+    return len(updates)
+
+
+def _audit_expenses(queryset, batch_size: 'int', fix: 'bool', report) -> 'dict':
+    totals = {'expenses': 0, MISMATCH: 0, UNSPLIT: 0, 'fixed': 0, 'splits_updated': 0}
+    for key_range in _key_ranges(queryset, batch_size):
+        with transaction.atomic():
+            issues = list(_inconsistent_expenses(queryset.filter(key_range)))
+            repairable = []
+            for pk, day, amount, split_count, split_total in issues:
+                kind = UNSPLIT if split_count == 0 else MISMATCH
+                totals[kind] += 1
+                issue = {
+                    'kind': kind,
+                    'expense_id': pk,
+                    'date': day.isoformat(),
+                    'amount': str(amount),
+                    'split_count': split_count,
+                }
+                if kind == MISMATCH:
+                    split_total = Decimal(split_total).quantize(Decimal('0.01'))
+                    issue['split_total'] = str(split_total)
+                    issue['difference'] = str(split_total - amount)
+                    if fix:
+                        repairable.append(pk)
+                        issue['fixed'] = True
+                report(issue)
+            if repairable:
+                # 分組查詢不能加 FOR UPDATE，修正前另外鎖住並重讀金額
+                amounts = dict(
+                    Expense.objects.filter(pk__in=repairable).select_for_update().values_list('pk', 'amount')
+                )
+                totals['splits_updated'] += _repair_splits(amounts)
+                totals['fixed'] += len(amounts)
+        # 筆數只為報告用途，取自同一範圍的 COUNT
+        totals['expenses'] += queryset.filter(key_range).count()
+    return totals
+
+
+def audit_orphan_splits(batch_size: 'int' = AUDIT_BATCH_SIZE, fix: 'bool' = False, report=None) -> 'dict':
+    """指向不存在記帳的分攤；fix 時直接刪除"""
+    report = report or (lambda issue: None)
+    totals = {'splits': 0, ORPHAN_SPLIT: 0, 'fixed': 0}
+    splits = ExpenseSplit.objects.all()
+    for key_range in _key_ranges(splits, batch_size):
+        orphans = splits.filter(key_range).filter(
+            ~Exists(Expense.objects.filter(pk=OuterRef('expense_id'))),
+        )
+        with transaction.atomic():
+            rows = list(orphans.order_by('pk').values_list('pk', 'expense_id', 'participant_id', 'share_amount'))
+            for pk, expense_id, participant_id, share in rows:
+                report({
+                    'kind': ORPHAN_SPLIT,
+                    'split_id': pk,
+                    'expense_id': expense_id,
+                    'participant_id': participant_id,
+                    'share_amount': str(share),
+                    **({'fixed': True} if fix else {}),
+                })
+            if fix and rows:
+                stale = ExpenseSplit.objects.filter(pk__in=[row[0] for row in rows])
+                stale._raw_delete(stale.db)
+                expenses_bulk_changed.send(sender=Expense, deleted_split_ids=[row[0] for row in rows])
+                totals['fixed'] += len(rows)
+        totals[ORPHAN_SPLIT] += len(rows)
+        totals['splits'] += splits.filter(key_range).count()
+    return totals
+
+
+def date_ranges(parts: 'int') -> 'list[tuple]':
+    """把記帳的日期範圍切成 parts 段不重疊的 (起, 訖)"""
+    bounds = Expense.objects.aggregate(first=Min('date'), last=Max('date'))
+    if bounds['first'] is None:
+        return []
+    days = (bounds['last'] - bounds['first']).days + 1
+    step = max(1, -(-days // max(1, parts)))
+    ranges = []
+    start = bounds['first']
+    while start <= bounds['last']:
+        end = min(start + timedelta(days=step - 1), bounds['last'])
+        ranges.append((start, end))
+        start = end + timedelta(days=1)
+    return ranges
+
+
+def audit_ledger(batch_size: 'int' = AUDIT_BATCH_SIZE, fix: 'bool' = False, workers: 'int' = 1,
+                 report=None, progress=None) -> 'dict':
+    """
+    稽核全部記帳與分攤
+    report(issue) 逐筆收到問題（可直接串流寫出）；progress(start, end, totals) 於每個日期區間完成時呼叫
+    workers > 1 時依日期區間平行稽核，每個執行緒使用自己的資料庫連線
+    """
+    lock = threading.Lock()
+
+    def emit(issue):
+        if report:
+            with lock:
+                report(issue)
+
+    def run(start, end):
+        try:
+            totals = _audit_expenses(Expense.objects.filter(date__range=(start, end)), batch_size, fix, emit)
+        finally:
+            if workers > 1:
+                connection.close()
+        if progress:
+            with lock:
+                progress(start, end, totals)
+        return totals
+
+    ranges = date_ranges(workers)
+    if workers > 1 and len(ranges) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda r: run(*r), ranges))
+    else:
+        results = [run(*r) for r in ranges]
+
+    summary = {'expenses': 0, MISMATCH: 0, UNSPLIT: 0, 'fixed': 0, 'splits_updated': 0}
+    for totals in results:
+        for key, value in totals.items():
+            summary[key] += value
+    orphans = audit_orphan_splits(batch_size=batch_size, fix=fix, report=emit)
+    summary['splits'] = orphans['splits']
+    summary[ORPHAN_SPLIT] = orphans[ORPHAN_SPLIT]
+    summary['fixed'] += orphans['fixed']
+    return summary
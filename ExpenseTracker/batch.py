@@ -0,0 +1,429 @@
+"""
+批次新增/更新記帳與分攤
+整批一起驗證，驗證全部通過才在單一交易內以 bulk 寫入
+
+另提供列表多選的批次操作（改類型、改付款人、重新平均分攤、刪除）：
+以 QuerySet.update()、bulk 重寫分攤與 raw delete 在單一交易內完成，
+不逐筆 save/delete；異常統計、預算計數與品項索引以讀回的欄位一次調整，異動紀錄與搜尋索引由批次 signal 處理
+通知與單筆編輯相同，在同一個交易內一次寫入 outbox，寄送時依收件人合併成摘要
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .anomaly import adjust_category_statistics
+from .budgets import apply_spending
+from .classifier import classify_items
+from .dbutils import insert_values, update_values
+from .forms import ExpenseBatchItemForm
+from .models import Expense, ExpenseCategory, Participant, ExpenseSplit, ExpenseAnomaly
+from .outbox import notify_expense_changes
+from .services import split_amount_evenly
+from .signals import expenses_bulk_changed
+
+
+MAX_BATCH_ITEMS = getattr(settings, 'EXPENSE_BATCH_MAX_ITEMS', 5000)
+MAX_BULK_ACTION_ITEMS = getattr(settings, 'EXPENSE_BULK_ACTION_MAX_ITEMS', 20000)
+
+EXPENSE_FIELDS = ['date', 'time', 'item_name', 'category', 'amount', 'note', 'paid_by']
+# 批次操作讀回的欄位，供異常統計、預算計數、品項索引調整與通知
+BULK_ACTION_FIELDS = ('pk', 'item_name', 'category_id', 'amount', 'date', 'time', 'paid_by_id')
+
+
+class BatchError(ValueError):
+    """整批請求格式錯誤"""
+
+
+def parse_split_input(item):
+    """
+    取出分攤設定
+    split_participants: [id, ...] 平均分攤
+    splits: [{"participant": id, "share_amount": "10.00"}, ...] 自訂金額
+    """
+    if item.get('splits') is not None:
+        splits = item['splits']
+        if not isinstance(splits, list):
+            raise ValueError('splits 必須為陣列')
+        parsed = []
+        for split in splits:
+            try:
+                participant_id = int(split['participant'])
+                share_amount = Decimal(str(split['share_amount'])).quantize(Decimal('0.01'))
+                # NaN 可以 quantize，但之後與 0 比較會拋出 InvalidOperation
+                if not share_amount.is_finite():
+                    raise ValueError(share_amount)
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                raise ValueError('splits 每筆需有 participant 與 share_amount')
+            if share_amount < 0:
+                raise ValueError('share_amount 不可為負數')
+            parsed.append((participant_id, share_amount))
+        return parsed, False
+
+    participant_ids = item.get('split_participants') or []
+    if not isinstance(participant_ids, list):
+        raise ValueError('split_participants 必須為陣列')
+    try:
+        return [(int(pk), None) for pk in participant_ids], True
+    except (TypeError, ValueError):
+        raise ValueError('split_participants 必須為參與者 ID')
+
+
+def save_expense_batch(items) -> 'tuple[bool, list[dict]]':
+    """
+    批次寫入記帳
+    回傳 (是否寫入, 每筆結果)；任何一筆驗證失敗則整批不寫入
+    """
+    if not isinstance(items, list) or not items:
+        raise BatchError('expenses 必須為非空陣列')
+    if len(items) > MAX_BATCH_ITEMS:
+        raise BatchError(f'單次最多 {MAX_BATCH_ITEMS} 筆')
+
+    # 第一輪：欄位格式，收集所有參照的 ID
+    forms = []
+    split_inputs = []
+    results = []
+    category_ids, participant_ids, update_ids = set(), set(), set()
+    for index, item in enumerate(items):
+        errors = {}
+        if not isinstance(item, dict):
+            forms.append(None)
+            split_inputs.append(([], False))
+            results.append({'index': index, 'ok': False, 'errors': {'__all__': ['格式錯誤']}})
+            continue
+        form = ExpenseBatchItemForm(item)
+        if form.is_valid():
+            data = form.cleaned_data
+            if data['category']:
+                category_ids.add(data['category'])
+            if data['paid_by']:
+                participant_ids.add(data['paid_by'])
+            if data['id'] in update_ids:
+                errors['id'] = ['同一筆記帳重複出現']
+            elif data['id']:
+                update_ids.add(data['id'])
+        else:
+            errors.update({field: list(errs) for field, errs in form.errors.items()})
+        try:
+            split_input = parse_split_input(item)
+            participant_ids.update(pk for pk, _ in split_input[0])
+        except ValueError as exc:
+            split_input = ([], False)
+            errors['splits'] = [str(exc)]
+        forms.append(form)
+        split_inputs.append(split_input)
+        results.append({'index': index, 'ok': not errors, 'errors': errors})
+
+    # 未填類型的記帳整批交給分類器
+    unclassified = [
+        (form.cleaned_data, result) for form, result in zip(forms, results)
+        if result['ok'] and not form.cleaned_data['category']
+    ]
+    predictions = classify_items(data['item_name'] for data, _ in unclassified)
+    for (data, result), prediction in zip(unclassified, predictions):
+        if prediction.category_id is None:
+            result['ok'] = False
+            result['errors']['category'] = ['無法自動判斷類型，請指定']
+            continue
+        data['category'] = prediction.category_id
+        category_ids.add(prediction.category_id)
+        result['predicted_category'] = {
+            'id': prediction.category_id, 'confidence': round(prediction.confidence, 4),
+        }
+
+    # 一次查出所有參照資料
+    category_map = ExpenseCategory.objects.in_bulk(category_ids)
+    participant_map = Participant.objects.in_bulk(participant_ids)
+    existing_map = Expense.objects.in_bulk(update_ids)
+
+    # 第二輪：參照存在性與分攤金額
+    prepared = []
+    for form, (split_input, even), result in zip(forms, split_inputs, results):
+        if not result['ok']:
+            continue
+        data = form.cleaned_data
+        errors = result['errors']
+        if data['category'] not in category_map:
+            errors['category'] = ['類型不存在']
+        if data['paid_by'] and data['paid_by'] not in participant_map:
+            errors['paid_by'] = ['付款人不存在']
+        if data['id'] and data['id'] not in existing_map:
+            errors['id'] = ['記帳不存在']
+
+        split_ids = [pk for pk, _ in split_input]
+        if len(set(split_ids)) != len(split_ids):
+            errors['splits'] = ['分攤者重複']
+        elif any(pk not in participant_map or not participant_map[pk].is_active for pk in split_ids):
+            errors['splits'] = ['分攤者不存在或已停用']
+        elif even:
+            shares = split_amount_evenly(data['amount'], len(split_ids))
+            split_input = list(zip(split_ids, shares))
+        elif split_input and sum(share for _, share in split_input) != data['amount']:
+            errors['splits'] = ['分攤金額總和需等於記帳金額']
+
+        if errors:
+            result['ok'] = False
+            continue
+        prepared.append((data, split_input, result))
+
+    if not all(result['ok'] for result in results):
+        return False, results
+
+    _write_batch(prepared, category_map, participant_map, existing_map)
+    return True, results
+
+
+def _write_batch(prepared, category_map, participant_map, existing_map):
+    now = timezone.now()
+    expenses = []
+    # 更新前的值，供預算計數扣回與通知原付款人
+    before = [
+        (expense.date, expense.category_id, expense.paid_by_id, expense.amount) for expense in existing_map.values()
+    ]
+    previous_ids = {pk: {expense.paid_by_id} for pk, expense in existing_map.items()}
+    for data, _, _ in prepared:
+        expense = existing_map[data['id']] if data['id'] else Expense()
+        expense.date = data['date']
+        expense.time = data['time'] or timezone.localtime(now).time()
+        expense.item_name = data['item_name']
+        expense.category = category_map[data['category']]
+        expense.amount = data['amount']
+        expense.note = data['note']
+        expense.paid_by = participant_map.get(data['paid_by'])
+        expense.updated_at = now
+        expenses.append(expense)
+    to_create = [expense for expense in expenses if expense.pk is None]
+    to_update = [expense for expense in expenses if expense.pk is not None]
+
+    with transaction.atomic():
+        Expense.objects.bulk_create(to_create)
+        Expense.objects.bulk_update(to_update, EXPENSE_FIELDS + ['updated_at'])
+
+        # 更新的記帳先清掉舊分攤；以 raw delete 避免逐筆觸發 signal，改由批次 signal 記錄
+        old_splits = ExpenseSplit.objects.filter(expense_id__in=[expense.pk for expense in to_update])
+        deleted_split_ids = []
+        for pk, expense_id, participant_id in old_splits.values_list('pk', 'expense_id', 'participant_id'):
+            deleted_split_ids.append(pk)
+            previous_ids[expense_id].add(participant_id)
+        if deleted_split_ids:
+            old_splits._raw_delete(old_splits.db)
+
+        splits = []
+        for (data, split_input, result), expense in zip(prepared, expenses):
+            result['id'] = expense.pk
+            result['created'] = not data['id']
+            splits.extend(
+                ExpenseSplit(expense=expense, participant_id=participant_id, share_amount=share)
+                for participant_id, share in split_input
+            )
+        ExpenseSplit.objects.bulk_create(splits)
+        apply_spending(
+            removed=before,
+            added=[(expense.date, expense.category_id, expense.paid_by_id, expense.amount) for expense in expenses],
+        )
+        notify_expense_changes(
+            ('update' if data['id'] else 'create', expense, dict(split_input), previous_ids.get(expense.pk, ()))
+            for (data, split_input, _), expense in zip(prepared, expenses)
+        )
+
+        expenses_bulk_changed.send(
+            sender=Expense,
+            expense_ids=[expense.pk for expense in expenses],
+            created_expense_ids=[expense.pk for expense in to_create],
+            split_ids=[split.pk for split in splits],
+            deleted_split_ids=deleted_split_ids,
+        )
+
+
+def _check_bulk_size(count: 'int'):
+    if count > MAX_BULK_ACTION_ITEMS:
+        raise BatchError(f'單次最多 {MAX_BULK_ACTION_ITEMS} 筆')
+
+
+def _current_shares(queryset) -> 'dict[int, dict[int, Decimal]]':
+    """記帳目前的分攤 {記帳 ID: {參與者 ID: 金額}}，一次查詢"""
+    shares = {}
+    for expense_id, participant_id, share in ExpenseSplit.objects.filter(
+        expense__in=queryset.values('pk'),
+    ).values_list('expense_id', 'participant_id', 'share_amount'):
+        shares.setdefault(expense_id, {})[participant_id] = share
+    return shares
+
+
+def _summary(row, **changes) -> 'Expense':
+    """由 BULK_ACTION_FIELDS 讀回的列組成通知用的記帳（不寫入）"""
+    return Expense(**dict(zip(BULK_ACTION_FIELDS, row), **changes))
+
+
+def recategorize_expenses(queryset, category: 'ExpenseCategory') -> 'int':
+    """批次改類型，回傳實際變更的筆數；queryset 為要套用的記帳"""
+    with transaction.atomic():
+        changed = queryset.exclude(category=category).order_by()
+        rows = list(changed.select_for_update().values_list(*BULK_ACTION_FIELDS))
+        if not rows:
+            return 0
+        _check_bulk_size(len(rows))
+        shares = _current_shares(changed)
+        changed.update(category=category, updated_at=timezone.now())
+        adjust_category_statistics(
+            removed=[(pk, category_id, amount) for pk, _, category_id, amount, *_ in rows],
+            added=[(pk, category.pk, amount) for pk, _, _, amount, *_ in rows],
+        )
+        # 付款人不變，只調整類型的計數
+        apply_spending(
+            removed=[(day, category_id, None, amount) for _, _, category_id, amount, day, *_ in rows],
+            added=[(day, category.pk, None, amount) for _, _, _, amount, day, *_ in rows],
+        )
+        notify_expense_changes(
+            ('update', _summary(row, category_id=category.pk), shares.get(row[0], {}), ()) for row in rows
+        )
+        expenses_bulk_changed.send(sender=Expense, expense_ids=[row[0] for row in rows])
+    return len(rows)
+
+
+def reassign_payer(queryset, participant: 'Participant|None') -> 'int':
+    """批次改付款人（None 表示清除），回傳實際變更的筆數"""
+    with transaction.atomic():
+        changed = queryset.exclude(paid_by=participant) if participant else queryset.exclude(paid_by=None)
+        changed = changed.order_by()
+        rows = list(changed.select_for_update().values_list(*BULK_ACTION_FIELDS))
+        if not rows:
+            return 0
+        _check_bulk_size(len(rows))
+        shares = _current_shares(changed)
+        changed.update(paid_by=participant, updated_at=timezone.now())
+        # 類型不變，只調整付款人的計數
+        paid_by_id = participant.pk if participant else None
+        apply_spending(
+            removed=[(day, None, old_paid_by_id, amount) for _, _, _, amount, day, _, old_paid_by_id in rows],
+            added=[(day, None, paid_by_id, amount) for _, _, _, amount, day, *_ in rows],
+        )
+        # 原付款人也會收到通知
+        notify_expense_changes(
+            ('update', _summary(row, paid_by_id=paid_by_id), shares.get(row[0], {}), {row[-1]}) for row in rows
+        )
+        changed_ids = [row[0] for row in rows]
+        expenses_bulk_changed.send(sender=Expense, expense_ids=changed_ids)
+    return len(changed_ids)
+
+
+def resplit_expenses_evenly(queryset, participants=None) -> 'int':
+    """
+    批次重新平均分攤
+    participants 為 None 時沿用每筆記帳原本的分攤者，否則改由指定的參與者平均分攤
+    與現有分攤比對後只寫入有變動的列：金額改變的就地更新、多出的刪除、缺少的新增
+    """
+    with transaction.atomic():
+        queryset = queryset.order_by()
+        rows = {row[0]: row for row in queryset.select_for_update().values_list(*BULK_ACTION_FIELDS)}
+        if not rows:
+            return 0
+        _check_bulk_size(len(rows))
+        amounts = {pk: row[3] for pk, row in rows.items()}
+        splits = ExpenseSplit.objects.filter(expense__in=queryset.values('pk'))
+        existing = {
+            (expense_id, participant_id): (pk, share)
+            for pk, expense_id, participant_id, share in splits.order_by('expense_id', 'pk').values_list(
+                'pk', 'expense_id', 'participant_id', 'share_amount',
+            )
+        }
+        if participants is None:
+            members = {}
+            for expense_id, participant_id in existing:
+                members.setdefault(expense_id, []).append(participant_id)
+        else:
+            participant_ids = [participant.pk for participant in participants]
+            members = dict.fromkeys(amounts, participant_ids)
+
+        to_update, to_insert = [], []
+        kept_ids = set()
+        new_shares, changed_ids = {}, set()
+        for expense_id, participant_ids in members.items():
+            shares = split_amount_evenly(amounts[expense_id], len(participant_ids))
+            new_shares[expense_id] = dict(zip(participant_ids, shares))
+            for participant_id, share in zip(participant_ids, shares):
+                current = existing.get((expense_id, participant_id))
+                if current is None:
+                    to_insert.append((expense_id, participant_id, share))
+                    changed_ids.add(expense_id)
+                    continue
+                kept_ids.add(current[0])
+                if current[1] != share:
+                    to_update.append((share, current[0]))
+                    changed_ids.add(expense_id)
+        deleted_split_ids = []
+        for (expense_id, _), (pk, _) in existing.items():
+            if pk not in kept_ids:
+                deleted_split_ids.append(pk)
+                changed_ids.add(expense_id)
+
+        adapt_decimal = connections[ExpenseSplit.objects.db].ops.adapt_decimalfield_value
+        if deleted_split_ids:
+            stale = ExpenseSplit.objects.filter(pk__in=deleted_split_ids)
+            stale._raw_delete(stale.db)
+        update_values(ExpenseSplit, ['share_amount'], (
+            (adapt_decimal(share, 12, 2), pk) for share, pk in to_update
+        ))
+        insert_values(ExpenseSplit, ['expense', 'participant', 'share_amount'], (
+            (expense_id, participant_id, adapt_decimal(share, 12, 2)) for expense_id, participant_id, share in to_insert
+        ))
+        inserted_ids = []
+        if to_insert:
+            known_ids = {pk for pk, _ in existing.values()}
+            inserted_ids = [pk for pk in splits.values_list('pk', flat=True) if pk not in known_ids]
+        # 只通知分攤有變動的記帳；被移除的分攤者也會收到
+        previous_ids = {}
+        for expense_id, participant_id in existing:
+            previous_ids.setdefault(expense_id, set()).add(participant_id)
+        notify_expense_changes(
+            ('update', _summary(rows[expense_id]), new_shares.get(expense_id, {}), previous_ids.get(expense_id, ()))
+            for expense_id in sorted(changed_ids)
+        )
+        expenses_bulk_changed.send(
+            sender=Expense,
+            split_ids=[pk for _, pk in to_update] + inserted_ids,
+            deleted_split_ids=deleted_split_ids,
+        )
+    return len(members)
+
+
+def delete_expenses(queryset, max_items: 'int|None' = MAX_BULK_ACTION_ITEMS, notify: 'bool' = True) -> 'int':
+    """
+    批次刪除記帳與其分攤、異常標記，回傳刪除的筆數
+    max_items: 筆數上限，None 表示不限（封存等已自行分批的呼叫端）
+    notify: 是否通知付款人與分攤者；封存只是搬移資料，不通知
+    """
+    with transaction.atomic():
+        queryset = queryset.order_by()
+        rows = list(queryset.select_for_update().values_list(*BULK_ACTION_FIELDS))
+        if not rows:
+            return 0
+        if max_items is not None and len(rows) > max_items:
+            raise BatchError(f'單次最多 {max_items} 筆')
+        targets = queryset.values('pk')
+        splits = ExpenseSplit.objects.filter(expense__in=targets)
+        deleted_split_ids, shares = [], {}
+        for pk, expense_id, participant_id, share in splits.values_list(
+            'pk', 'expense_id', 'participant_id', 'share_amount',
+        ):
+            deleted_split_ids.append(pk)
+            shares.setdefault(expense_id, {})[participant_id] = share
+        # 以 raw delete 依外鍵順序刪除，避免 Collector 逐筆載入與觸發 signal
+        anomalies = ExpenseAnomaly.objects.filter(expense__in=targets)
+        anomalies._raw_delete(anomalies.db)
+        splits._raw_delete(splits.db)
+        expenses = Expense.objects.filter(pk__in=targets)
+        expenses._raw_delete(expenses.db)
+        adjust_category_statistics(removed=[(pk, category_id, amount) for pk, _, category_id, amount, *_ in rows])
+        apply_spending(removed=[
+            (day, category_id, paid_by_id, amount) for _, _, category_id, amount, day, _, paid_by_id in rows
+        ])
+        if notify:
+            notify_expense_changes(('delete', _summary(row), shares.get(row[0], {}), ()) for row in rows)
+        expenses_bulk_changed.send(
+            sender=Expense,
+            deleted_expense_ids=[row[0] for row in rows],
+            deleted_split_ids=deleted_split_ids,
+        )
+    return len(rows)
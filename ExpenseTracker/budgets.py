@@ -0,0 +1,245 @@
+"""
+每月預算
+每個類型與付款人每月一列累計計數（SpendingCounter），記帳寫入時在同一個交易內以 F() 增減，
+只讀寫受影響的計數列即可判斷是否跨過門檻，不需 SUM 整個月份；警示在同一個交易內寫入通知 outbox
+"""
+import threading
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import cache as data_cache
+from . import outbox
+from .models import Budget, BudgetAlert, Expense, SpendingCounter
+
+
+THRESHOLDS = tuple(sorted(getattr(settings, 'BUDGET_ALERT_THRESHOLDS', (80, 100))))
+ALERT_RECIPIENTS = list(getattr(settings, 'BUDGET_ALERT_RECIPIENTS', []))
+CENT = Decimal('0.01')
+
+SCOPE_FIELDS = {
+    SpendingCounter.SCOPE_CATEGORY: 'category_id',
+    SpendingCounter.SCOPE_PARTICIPANT: 'paid_by_id',
+}
+
+_date_field = Expense._meta.get_field('date')
+_amount_field = Expense._meta.get_field('amount')
+
+
+def month_start(day) -> 'date':
+    return _date_field.to_python(day).replace(day=1)
+
+
+def _counter_keys(day, category_id, paid_by_id):
+    """記帳影響的計數列 (範圍, ID, 月份)；未分類或沒有付款人的部分不計"""
+    period = month_start(day)
+    if category_id is not None:
+        yield SpendingCounter.SCOPE_CATEGORY, category_id, period
+    if paid_by_id is not None:
+        yield SpendingCounter.SCOPE_PARTICIPANT, paid_by_id, period
+
+
+_budget_lock = threading.Lock()
+_budgets = (None, {})  # (資料版本, {(範圍, ID): Budget})
+
+
+def get_active_budgets() -> 'dict[tuple[str, int], Budget]':
+    """行程內快取的啟用中預算；以預算的資料版本號判斷是否失效"""
+    global _budgets
+    version = data_cache.get_data_version(data_cache.BUDGET)
+    cached_version, budgets = _budgets
+    if cached_version == version:
+        return budgets
+    with _budget_lock:
+        cached_version, budgets = _budgets
+        if cached_version == version:
+            return budgets
+        budgets = {}
+        for budget in Budget.objects.filter(is_active=True).select_related('category', 'participant'):
+            if budget.category_id is not None:
+                budgets[(SpendingCounter.SCOPE_CATEGORY, budget.category_id)] = budget
+            else:
+                budgets[(SpendingCounter.SCOPE_PARTICIPANT, budget.participant_id)] = budget
+        _budgets = (version, budgets)
+        return budgets
+
+
+def _increment(key, amount: 'Decimal', count: 'int', read_back: 'bool') -> 'Decimal|None':
+    """原子增減一列計數；read_back 時回傳更新後的金額（本交易已鎖定該列）"""
+    scope, object_id, period = key
+    counter = SpendingCounter.objects.filter(scope=scope, object_id=object_id, period=period)
+    values = {'total': F('total') + amount, 'count': F('count') + count}
+    if not counter.update(**values):
+        try:
+            with transaction.atomic():
+                SpendingCounter.objects.create(scope=scope, object_id=object_id, period=period, total=amount, count=count)
+        except IntegrityError:
+            # 其他交易同時建立了同一列
+            counter.update(**values)
+    if read_back:
+        return counter.values_list('total', flat=True).get()
+    return None
+
+
+def crossed_thresholds(before: 'Decimal', after: 'Decimal', limit: 'Decimal') -> 'list[int]':
+    """金額由 before 增加到 after 時跨過的門檻（%）"""
+    return [threshold for threshold in THRESHOLDS if before < limit * threshold / 100 <= after]
+
+
+def apply_spending(removed=(), added=()) -> 'list[BudgetAlert]':
+    """
+    記帳寫入後調整計數列並檢查門檻，需在記帳寫入的交易內呼叫
+    removed / added: [(date, category_id, paid_by_id, amount), ...]；欄位為 None 表示不影響該範圍
+    同一列的增減先合併，每列只更新一次；有預算且金額增加的列才讀回金額判斷門檻
+    """
+    deltas = {}
+    for sign, rows in ((-1, removed), (1, added)):
+        for day, category_id, paid_by_id, amount in rows:
+            amount = _amount_field.to_python(amount)
+            for key in _counter_keys(day, category_id, paid_by_id):
+                total, count = deltas.get(key, (Decimal('0'), 0))
+                deltas[key] = (total + sign * amount, count + sign)
+    deltas = {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+    if not deltas:
+        return []
+
+    budgets = get_active_budgets()
+    alerts = []
+    with transaction.atomic():
+        # 固定更新順序，避免兩個交易交錯鎖定計數列
+        for key in sorted(deltas):
+            amount, count = deltas[key]
+            budget = budgets.get(key[:2])
+            after = _increment(key, amount, count, read_back=budget is not None and amount > 0)
+            if after is None:
+                continue
+            for threshold in crossed_thresholds(after - amount, after, budget.amount):
+                alerts.append(BudgetAlert(budget=budget, period=key[2], threshold=threshold, spent=after))
+        if alerts:
+            # 同一預算同月同門檻只警示一次（支出減少後再次跨過門檻不重複通知）
+            existing = set(BudgetAlert.objects.filter(
+                budget__in={alert.budget_id for alert in alerts},
+                period__in={alert.period for alert in alerts},
+            ).values_list('budget_id', 'period', 'threshold'))
+            alerts = [alert for alert in alerts if (alert.budget_id, alert.period, alert.threshold) not in existing]
+            now = timezone.now()
+            for alert in alerts:
+                alert.notified_at = now
+            BudgetAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+            outbox.add([message for alert in alerts for message in alert_messages(alert)])
+    return alerts
+
+
+def get_budget_usage(today=None) -> 'list[dict]':
+    """本月各預算的使用狀況；只讀取預算對應的計數列"""
+    budgets = get_active_budgets()
+    if not budgets:
+        return []
+    period = month_start(today or timezone.localdate())
+    condition = Q()
+    for scope in SCOPE_FIELDS:
+        object_ids = [object_id for budget_scope, object_id in budgets if budget_scope == scope]
+        if object_ids:
+            condition |= Q(scope=scope, object_id__in=object_ids)
+    spent = {
+        (scope, object_id): total
+        for scope, object_id, total in SpendingCounter.objects.filter(condition, period=period).values_list(
+            'scope', 'object_id', 'total',
+        )
+    }
+
+    usage = []
+    for key, budget in budgets.items():
+        total = spent.get(key, Decimal('0'))
+        percentage = total / budget.amount * 100
+        reached = [threshold for threshold in THRESHOLDS if percentage >= threshold]
+        usage.append({
+            'id': budget.pk,
+            'scope': key[0],
+            'name': budget.category.name if budget.category_id else budget.participant.name,
+            'amount': float(budget.amount),
+            'spent': float(total),
+            'remaining': float(budget.amount - total),
+            'percentage': round(float(percentage), 1),
+            'threshold': reached[-1] if reached else None,
+        })
+    usage.sort(key=lambda row: row['percentage'], reverse=True)
+    return usage
+
+
+def alert_messages(alert: 'BudgetAlert') -> 'list[tuple]':
+    """警示的 outbox 通知：類型預算寄給 BUDGET_ALERT_RECIPIENTS，參與者預算寄給該參與者"""
+    budget = alert.budget
+    if budget.category_id:
+        name, recipients = budget.category.name, ALERT_RECIPIENTS
+    else:
+        name = budget.participant.name
+        recipients = [budget.participant.email] if budget.participant.email else []
+    subject = f'預算提醒：{name} {alert.period:%Y 年 %m 月}已達 {alert.threshold}%'
+    body = (
+        f'{name} {alert.period:%Y 年 %m 月} 已支出 {alert.spent}，'
+        f'每月預算 {budget.amount}（{alert.spent / budget.amount * 100:.0f}%）。'
+    )
+    return [(recipient, outbox.KIND_BUDGET, subject, body) for recipient in recipients]
+
+
+def queue_pending_alerts() -> 'dict':
+    """把尚未通知的警示寫入 outbox（改用 outbox 之前排入的警示）"""
+    alerts = list(
+        BudgetAlert.objects.filter(notified_at=None).select_related('budget__category', 'budget__participant')
+    )
+    with transaction.atomic():
+        BudgetAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=timezone.now())
+        messages = outbox.add([message for alert in alerts for message in alert_messages(alert)])
+    return {'alerts': len(alerts), 'messages': len(messages)}
+
+
+def _month_q(months) -> 'Q':
+    condition = Q()
+    for period in months:
+        next_month = date(period.year + period.month // 12, period.month % 12 + 1, 1)
+        condition |= Q(date__gte=period, date__lt=next_month)
+    return condition
+
+
+def reconcile_counters(months=None) -> 'dict':
+    """
+    以記帳重新彙總計數列並取代現有的值
+    months: [月初日期, ...]，None 表示全部月份；回傳計數列數與有差異的列數
+    """
+    months = [month_start(period) for period in months] if months else None
+    expenses = Expense.objects.filter(_month_q(months)) if months else Expense.objects.all()
+    counters = SpendingCounter.objects.filter(period__in=months) if months else SpendingCounter.objects.all()
+
+    with transaction.atomic():
+        rebuilt = {}
+        for scope, field in SCOPE_FIELDS.items():
+            grouped = expenses.exclude(**{field: None}).annotate(period=TruncMonth('date')).values_list(
+                'period', field,
+            ).annotate(total=Sum('amount'), count=Count('pk')).order_by()
+            for period, object_id, total, count in grouped:
+                key = (scope, object_id, period)
+                current_total, current_count = rebuilt.get(key, (Decimal('0'), 0))
+                rebuilt[key] = ((current_total + total).quantize(CENT), current_count + count)
+
+        existing = {
+            (scope, object_id, period): (total, count)
+            for scope, object_id, period, total, count in counters.values_list(
+                'scope', 'object_id', 'period', 'total', 'count',
+            )
+        }
+        changed = sum(
+            1 for key in rebuilt.keys() | existing.keys()
+            if rebuilt.get(key, (0, 0)) != existing.get(key, (0, 0))
+        )
+        counters.delete()
+        SpendingCounter.objects.bulk_create([
+            SpendingCounter(scope=scope, object_id=object_id, period=period, total=total, count=count)
+            for (scope, object_id, period), (total, count) in rebuilt.items()
+        ], batch_size=1000)
+    return {'counters': len(rebuilt), 'changed': changed}
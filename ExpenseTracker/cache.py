@@ -0,0 +1,116 @@
+import contextlib
+import os
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import locks
+from django.db import connections, transaction
+
+
+# 片段快取存活時間（秒）；實際失效靠資料版本號
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+VERSION_KEY_PREFIX = 'expense_tracker:version:'
+VERSION_LOCK_FILE = '.data_version.lock'
+
+# 資料版本名稱
+CATEGORY = 'category'
+PARTICIPANT = 'participant'
+EXPENSE = 'expense'
+BUDGET = 'budget'
+
+
+def _version_key(name: 'str') -> 'str':
+    return VERSION_KEY_PREFIX + name
+
+
+def _initial_version() -> 'int':
+    # 以時間戳當初始值，快取被清空或重啟後不會與舊版本號撞號
+    return int(time.time() * 1000)
+
+
+@contextlib.contextmanager
+def _version_lock():
+    """
+    FileBasedCache 的 incr / add 是先讀再寫，多個行程同時遞增會互相覆蓋成同一個版本號，
+    以快取目錄下的檔案鎖讓同一台主機的行程依序讀寫；Redis / Memcached 的 incr 本身是原子操作
+    """
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        yield
+        return
+    os.makedirs(backend._dir, exist_ok=True)
+    with open(os.path.join(backend._dir, VERSION_LOCK_FILE), 'ab') as lock_file:
+        locks.lock(lock_file, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(lock_file)
+
+
+def get_data_version(name: 'str') -> 'int':
+    """取得資料版本號"""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        with _version_lock():
+            cache.add(key, _initial_version(), timeout=None)
+            version = cache.get(key)
+    return version
+
+
+def get_data_versions(*names: 'str') -> 'dict[str, int]':
+    """一次取得多個資料版本號"""
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, name in keys.items():
+        if key in found:
+            versions[name] = found[key]
+        else:
+            versions[name] = get_data_version(name)
+    return versions
+
+
+def _incr_data_version(name: 'str') -> 'None':
+    key = _version_key(name)
+    with _version_lock():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+
+
+def bump_data_version(name: 'str') -> 'None':
+    """
+    資料異動時遞增版本號，讓以此版本為 key 的快取全部失效
+    在交易內呼叫時等交易提交後才遞增，否則其他請求可能在提交前讀到新版本號、把舊資料快取在新版本下；
+    同時有多個資料庫的交易時每個提交後各遞增一次
+    """
+    aliases = [connection.alias for connection in connections.all(initialized_only=True) if connection.in_atomic_block]
+    if not aliases:
+        _incr_data_version(name)
+        return
+    for alias in aliases:
+        transaction.on_commit(lambda: _incr_data_version(name), using=alias)
+
+
+def is_shared_cache() -> 'bool':
+    """版本號是否存在跨行程共用的快取；LocMem / Dummy 只在單一行程內有效"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def require_shared_cache(purpose: 'str') -> 'None':
+    """
+    在網頁以外的行程（run_worker、管理指令）寫入資料前檢查
+    快取只在行程內有效時，這裡遞增的版本號網頁行程看不到，會一直使用舊的快取
+    """
+    if not is_shared_cache():
+        raise ImproperlyConfigured(
+            f'{purpose}需要跨行程共用的快取，'
+            f'CACHES["default"] 目前是 {type(caches["default"]).__name__}，請改用 FileBasedCache、Redis 或 Memcached'
+        )
@@ -0,0 +1,93 @@
+"""
+增量同步用的異動紀錄
+客戶端帶上次拿到的游標，只會取得之後的異動
+"""
+from django.db import connections, router
+from django.utils import timezone
+
+from .dbutils import insert_values
+from .models import Expense, ExpenseSplit, Participant, ExpenseCategory, ChangeLogEntry
+
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# 同步資料類型名稱 -> (model, 輸出欄位)
+TRACKED_MODELS = {
+    'expense': (Expense, [
+        'id', 'date', 'time', 'item_name', 'category_id', 'amount', 'note',
+        'paid_by_id', 'created_at', 'updated_at',
+    ]),
+    'expense_split': (ExpenseSplit, ['id', 'expense_id', 'participant_id', 'share_amount']),
+    'participant': (Participant, ['id', 'name', 'email', 'is_active', 'created_at']),
+    'category': (ExpenseCategory, ['id', 'name', 'icon', 'color', 'is_default', 'created_at']),
+}
+
+MODEL_NAMES = {model: name for name, (model, _) in TRACKED_MODELS.items()}
+
+
+def record_change(model_name: 'str', object_id: 'int', action: 'str') -> 'None':
+    ChangeLogEntry.objects.create(model=model_name, object_id=object_id, action=action)
+
+
+def record_changes(model_name: 'str', object_ids, action: 'str') -> 'None':
+    """
+    批次寫入異動紀錄，給不觸發 signal 的批次操作使用
+    筆數可能上萬，直接寫入欄位值而不建立 model 實例
+    """
+    connection = connections[router.db_for_write(ChangeLogEntry)]
+    changed_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    insert_values(
+        ChangeLogEntry,
+        ['model', 'object_id', 'action', 'changed_at'],
+        ((model_name, object_id, action, changed_at) for object_id in object_ids),
+    )
+
+
+def get_changes(since: 'int' = 0, limit: 'int' = DEFAULT_LIMIT) -> 'dict':
+    """
+    取得游標之後的異動
+    同一筆資料在這一頁內多次異動只回傳最後狀態
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    entries = list(
+        ChangeLogEntry.objects.filter(id__gt=since)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    cursor = entries[-1][0] if entries else since
+
+    # 以最後一次異動為準
+    latest = {}
+    for _, model_name, object_id, action in entries:
+        latest[(model_name, object_id)] = action
+
+    upsert_ids = {name: [] for name in TRACKED_MODELS}
+    delete_ids = {name: [] for name in TRACKED_MODELS}
+    for (model_name, object_id), action in latest.items():
+        if model_name not in TRACKED_MODELS:
+            continue
+        if action == ChangeLogEntry.ACTION_DELETE:
+            delete_ids[model_name].append(object_id)
+        else:
+            upsert_ids[model_name].append(object_id)
+
+    changes = {}
+    for model_name, (model, fields) in TRACKED_MODELS.items():
+        ids = upsert_ids[model_name]
+        rows = list(model.objects.filter(pk__in=ids).order_by().values(*fields)) if ids else []
+        # 取資料時已被刪除的列視為刪除，之後的 tombstone 會再確認一次
+        found = {row['id'] for row in rows}
+        deletes = delete_ids[model_name] + [pk for pk in ids if pk not in found]
+        changes[model_name] = {
+            'upserts': rows,
+            'deletes': sorted(deletes),
+        }
+
+    return {
+        'cursor': cursor,
+        'has_more': has_more,
+        'changes': changes,
+    }
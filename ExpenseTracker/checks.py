@@ -0,0 +1,17 @@
+from django.core.checks import Tags, Warning, register
+
+from . import cache as data_cache
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """資料版本號需放在跨行程共用的快取，背景工作與管理指令的異動網頁行程才看得到"""
+    if data_cache.is_shared_cache():
+        return []
+    return [
+        Warning(
+            'CACHES["default"] 只在單一行程內有效，背景工作與管理指令遞增的資料版本號不會傳到網頁行程',
+            hint='改用 FileBasedCache（僅限單機：版本號以快取目錄的檔案鎖依序遞增，多台主機不能共用）或 Redis / Memcached；run_worker、archive_expenses 等指令在此設定下不會執行',
+            id='ExpenseTracker.W001',
+        )
+    ]
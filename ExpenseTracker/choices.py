@@ -0,0 +1,143 @@
+import threading
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+
+from . import cache as data_cache
+from .models import ExpenseCategory, Participant
+
+
+class ChoiceSource:
+    """
+    行程內的選項快取
+    以資料版本號判斷是否失效，版本未變時不查資料庫
+    """
+
+    def __init__(self, model, version_name: 'str'):
+        self.model = model
+        self.version_name = version_name
+        self._lock = threading.Lock()
+        self._version = None
+        self._objects = ()
+        self._by_pk = {}
+
+    def _load(self):
+        version = data_cache.get_data_version(self.version_name)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            objects = tuple(self.model._default_manager.all())
+            self._by_pk = {obj.pk: obj for obj in objects}
+            self._objects = objects
+            self._version = version
+
+    def get_objects(self) -> 'tuple':
+        self._load()
+        return self._objects
+
+    def get_map(self) -> 'dict':
+        self._load()
+        return self._by_pk
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._objects = ()
+            self._by_pk = {}
+
+
+category_choices = ChoiceSource(ExpenseCategory, data_cache.CATEGORY)
+participant_choices = ChoiceSource(Participant, data_cache.PARTICIPANT)
+
+
+def is_active_participant(participant: 'Participant') -> 'bool':
+    return participant.is_active
+
+
+def warm_choice_cache(**kwargs):
+    """預先載入選項快取"""
+    category_choices.get_objects()
+    participant_choices.get_objects()
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.get_cached_objects():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.get_cached_objects()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.get_cached_objects())
+
+
+class CachedChoiceMixin:
+    """以 ChoiceSource 提供選項與驗證，不再每次查詢 queryset"""
+    iterator = CachedModelChoiceIterator
+
+    def __init__(self, source: 'ChoiceSource', *, filter_func=None, **kwargs):
+        self.source = source
+        self.filter_func = filter_func
+        super().__init__(queryset=source.model._default_manager.all(), **kwargs)
+
+    def get_cached_objects(self) -> 'list':
+        objects = self.source.get_objects()
+        if self.filter_func is None:
+            return list(objects)
+        return [obj for obj in objects if self.filter_func(obj)]
+
+    def lookup(self, value):
+        """依主鍵取得快取物件，不在選項內時回傳 None"""
+        if isinstance(value, self.source.model):
+            value = value.pk
+        try:
+            pk = self.source.model._meta.pk.to_python(value)
+        except ValidationError:
+            return None
+        obj = self.source.get_map().get(pk)
+        if obj is None or (self.filter_func and not self.filter_func(obj)):
+            return None
+        return obj
+
+
+class CachedModelChoiceField(CachedChoiceMixin, forms.ModelChoiceField):
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self.lookup(value)
+        if obj is None:
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+        return obj
+
+
+class CachedModelMultipleChoiceField(CachedChoiceMixin, forms.ModelMultipleChoiceField):
+    def _check_values(self, value):
+        """回傳快取物件清單，取代原本的 IN 查詢"""
+        try:
+            value = frozenset(value)
+        except TypeError:
+            raise ValidationError(
+                self.error_messages["invalid_list"],
+                code="invalid_list",
+            )
+        objects = []
+        for val in value:
+            obj = self.lookup(val)
+            if obj is None:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": val},
+                )
+            objects.append(obj)
+        return objects
@@ -0,0 +1,330 @@
+"""
+記帳類型自動分類
+以品項名稱的字元 n-gram 訓練多項式 naive Bayes，離線可用，不需呼叫外部 LLM
+模型存成 JSON 檔，每個行程只載入一次，之後依異動紀錄（ChangeLogEntry）增量學習：
+新增的記帳學進模型，改類型、改名或刪除的記帳先扣掉原本學到的內容再重新學習
+"""
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Expense, ChangeLogEntry, Job
+
+
+MODEL_PATH = getattr(
+    settings, 'CATEGORY_CLASSIFIER_PATH',
+    os.path.join(settings.TMP_ROOT, 'category_classifier.json'),
+)
+REFRESH_INTERVAL = getattr(settings, 'CATEGORY_CLASSIFIER_REFRESH_INTERVAL', 60.0)
+MIN_CONFIDENCE = getattr(settings, 'CATEGORY_CLASSIFIER_MIN_CONFIDENCE', 0.3)
+NGRAM_RANGE = (1, 3)
+ALPHA = 0.1
+HOLDOUT_MODULO = 5  # 主鍵除以此數餘 0 者作為驗證集
+TRAIN_CHUNK_SIZE = 5000
+TRAIN_TASK = 'train_category_classifier'
+
+
+def extract_features(item_name: 'str') -> 'list[str]':
+    """字元 n-gram，前後加邊界符號讓詞首詞尾有區別"""
+    text = f"^{' '.join(item_name.lower().split())}$"
+    low, high = NGRAM_RANGE
+    return [
+        text[i:i + n]
+        for n in range(low, high + 1)
+        for i in range(len(text) - n + 1)
+        if text[i:i + n] not in ('^', '$')
+    ]
+
+
+@dataclass
+class Prediction:
+    category_id: 'int|None'
+    confidence: 'float'
+    ranking: 'list[tuple[int, float]]'
+
+
+class NaiveBayesClassifier:
+
+    def __init__(self):
+        self.class_counts: 'dict[int, int]' = {}
+        self.feature_totals: 'dict[int, int]' = {}
+        self.feature_counts: 'dict[str, dict[int, int]]' = {}
+        # 每筆記帳學進模型的 (品項名稱, 類型)，記帳被修改或刪除時據此扣除
+        self.learned: 'dict[int, tuple[str, int]]' = {}
+        self.cursor = 0  # 已套用的異動紀錄 ID
+        self.metrics: 'dict' = {}
+        self._table = None
+
+    @property
+    def samples(self) -> 'int':
+        return sum(self.class_counts.values())
+
+    def partial_fit(self, pairs, weight: 'int' = 1):
+        """pairs: [(item_name, category_id), ...]；weight 為 -1 時扣除先前學到的樣本"""
+        for item_name, category_id in pairs:
+            self._add_count(self.class_counts, category_id, weight)
+            features = extract_features(item_name)
+            self._add_count(self.feature_totals, category_id, weight * len(features))
+            for feature in features:
+                counts = self.feature_counts.setdefault(feature, {})
+                self._add_count(counts, category_id, weight)
+                if not counts:
+                    del self.feature_counts[feature]
+        self._table = None
+
+    @staticmethod
+    def _add_count(counts: 'dict', key, delta: 'int'):
+        value = counts.get(key, 0) + delta
+        if value > 0:
+            counts[key] = value
+        else:
+            counts.pop(key, None)
+
+    def learn(self, rows):
+        """rows: [(pk, item_name, category_id), ...]；已學過的記帳先扣掉舊內容，未分類的只扣不學"""
+        self.forget(pk for pk, _, _ in rows)
+        pairs = [(item_name, category_id) for _, item_name, category_id in rows if category_id is not None]
+        self.partial_fit(pairs)
+        self.learned.update((pk, (item_name, category_id)) for pk, item_name, category_id in rows
+                            if category_id is not None)
+
+    def forget(self, pks):
+        self.partial_fit([pair for pair in (self.learned.pop(pk, None) for pk in pks) if pair], weight=-1)
+
+    def _build_table(self):
+        """預先算好每個 feature 對各類型的 log 機率，批次推論只需查表相加"""
+        classes = sorted(self.class_counts)
+        total = self.samples
+        vocabulary = len(self.feature_counts)
+        denominators = [math.log(self.feature_totals.get(c, 0) + ALPHA * vocabulary) for c in classes]
+        priors = [math.log(self.class_counts[c] / total) for c in classes]
+        features = {
+            feature: [
+                math.log(counts.get(c, 0) + ALPHA) - denominator
+                for c, denominator in zip(classes, denominators)
+            ]
+            for feature, counts in self.feature_counts.items()
+        }
+        self._table = (classes, priors, features)
+        return self._table
+
+    def predict_batch(self, item_names, top: 'int' = 3) -> 'list[Prediction]':
+        """整批推論；模型未訓練時回傳空預測"""
+        if not self.class_counts:
+            return [Prediction(None, 0.0, []) for _ in item_names]
+        classes, priors, table = self._table or self._build_table()
+        predictions = []
+        for item_name in item_names:
+            scores = list(priors)
+            for feature in extract_features(item_name):
+                row = table.get(feature)
+                if row is not None:
+                    scores = [score + value for score, value in zip(scores, row)]
+            # softmax 轉成機率
+            peak = max(scores)
+            weights = [math.exp(score - peak) for score in scores]
+            norm = sum(weights)
+            ranking = sorted(
+                ((c, weight / norm) for c, weight in zip(classes, weights)),
+                key=lambda item: -item[1],
+            )[:top]
+            predictions.append(Prediction(ranking[0][0], ranking[0][1], ranking))
+        return predictions
+
+    def to_dict(self) -> 'dict':
+        return {
+            'class_counts': {str(c): n for c, n in self.class_counts.items()},
+            'feature_totals': {str(c): n for c, n in self.feature_totals.items()},
+            'feature_counts': {
+                feature: {str(c): n for c, n in counts.items()}
+                for feature, counts in self.feature_counts.items()
+            },
+            'learned': {str(pk): [item_name, category_id] for pk, (item_name, category_id) in self.learned.items()},
+            'cursor': self.cursor,
+            'metrics': self.metrics,
+        }
+
+    @classmethod
+    def from_dict(cls, data: 'dict') -> 'NaiveBayesClassifier':
+        model = cls()
+        model.class_counts = {int(c): n for c, n in data['class_counts'].items()}
+        model.feature_totals = {int(c): n for c, n in data['feature_totals'].items()}
+        model.feature_counts = {
+            feature: {int(c): n for c, n in counts.items()}
+            for feature, counts in data['feature_counts'].items()
+        }
+        model.learned = {int(pk): (item_name, category_id) for pk, (item_name, category_id) in data['learned'].items()}
+        model.cursor = data['cursor']
+        model.metrics = data.get('metrics', {})
+        return model
+
+    def save(self, path: 'str' = MODEL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: 'str' = MODEL_PATH) -> 'NaiveBayesClassifier|None':
+        """沒有檔案或是沒有逐筆學習紀錄的舊格式時回傳 None，需重新訓練"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+
+def _iter_training_rows(chunk_size: 'int' = TRAIN_CHUNK_SIZE):
+    """依主鍵分批取出已分類的記帳 (pk, item_name, category_id)"""
+    last_pk = 0
+    while True:
+        rows = list(
+            Expense.objects.filter(pk__gt=last_pk, category__isnull=False)
+            .order_by('pk').values_list('pk', 'item_name', 'category_id')[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def _latest_change_id() -> 'int':
+    return ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def catch_up(model: 'NaiveBayesClassifier', chunk_size: 'int' = TRAIN_CHUNK_SIZE, progress=None) -> 'int':
+    """
+    依異動紀錄重新學習游標之後新增、修改或刪除的記帳，回傳處理的異動筆數
+    progress(done, total) 可回報進度
+    """
+    changes = ChangeLogEntry.objects.filter(model='expense')
+    total = changes.filter(id__gt=model.cursor).count() if progress else 0
+    done = 0
+    while True:
+        entries = list(
+            changes.filter(id__gt=model.cursor).order_by('id').values_list('id', 'object_id')[:chunk_size]
+        )
+        if not entries:
+            return done
+        changed = {object_id for _, object_id in entries}
+        rows = list(Expense.objects.filter(pk__in=changed).values_list('pk', 'item_name', 'category_id'))
+        model.forget(changed - {pk for pk, _, _ in rows})
+        model.learn(rows)
+        model.cursor = entries[-1][0]
+        done += len(entries)
+        if progress:
+            progress(done, max(total, done))
+
+
+def train_classifier(incremental: 'bool' = False, path: 'str' = MODEL_PATH, progress=None) -> 'NaiveBayesClassifier':
+    """
+    訓練並存檔；progress(done, total) 可回報進度
+    完整訓練時以主鍵取模保留驗證集計算準確率與單筆推論延遲，之後再把驗證集併入模型
+    incremental 時載入既有模型，只依異動紀錄重新學習上次訓練之後變動的記帳；沒有可用的模型時改為完整訓練
+    """
+    model = NaiveBayesClassifier.load(path) if incremental else None
+    if model is not None:
+        catch_up(model, progress=progress)
+        model.metrics['samples'] = model.samples
+        model.metrics['trained_at'] = timezone.now().isoformat()
+        model.save(path)
+        return model
+
+    model = NaiveBayesClassifier()
+    # 先記下游標，訓練期間的異動最後再追上
+    model.cursor = _latest_change_id()
+    total = Expense.objects.filter(category__isnull=False).count()
+    holdout = []
+    done = 0
+    for rows in _iter_training_rows():
+        model.learn([row for row in rows if row[0] % HOLDOUT_MODULO])
+        holdout.extend(row for row in rows if not row[0] % HOLDOUT_MODULO)
+        done += len(rows)
+        if progress:
+            progress(done, max(total, done))
+
+    accuracy = latency_us = None
+    if holdout and model.class_counts:
+        started = time.perf_counter()
+        predictions = model.predict_batch([name for _, name, _ in holdout], top=1)
+        elapsed = time.perf_counter() - started
+        correct = sum(p.category_id == category_id for p, (_, _, category_id) in zip(predictions, holdout))
+        accuracy = correct / len(holdout)
+        latency_us = elapsed / len(holdout) * 1e6
+    model.learn(holdout)
+    catch_up(model)
+    model.metrics = {
+        'samples': model.samples,
+        'holdout': len(holdout),
+        'accuracy': accuracy,
+        'latency_us': latency_us,
+        'trained_at': timezone.now().isoformat(),
+    }
+    model.save(path)
+    return model
+
+
+def schedule_training() -> 'None':
+    """
+    排入訓練工作；已有等待中或執行中的訓練時略過
+    檢查與排入之間另一個行程可能也排入一次，重複訓練只是多算一次，模型檔以 os.replace 整檔替換，不會寫壞
+    """
+    if not Job.objects.filter(task=TRAIN_TASK, status__in=[Job.STATUS_PENDING, Job.STATUS_RUNNING]).exists():
+        enqueue(TRAIN_TASK)
+
+
+# 尚無模型檔時使用的空模型，predict_batch 一律回傳空預測
+_EMPTY_MODEL = NaiveBayesClassifier()
+
+_model = None
+_model_lock = threading.Lock()
+_refreshed_at = 0.0
+
+
+def get_classifier() -> 'NaiveBayesClassifier':
+    """
+    行程內共用的模型：第一次使用時從檔案載入
+    沒有模型檔時不在請求中訓練，排入訓練工作並回傳空模型（不做預測），每 REFRESH_INTERVAL 秒重試載入
+    載入後每 REFRESH_INTERVAL 秒依異動紀錄增量學習，不寫回檔案
+    """
+    global _model, _refreshed_at
+    with _model_lock:
+        if _model is not None and time.monotonic() - _refreshed_at < REFRESH_INTERVAL:
+            return _model
+        if _model is None or _model is _EMPTY_MODEL:
+            _model = NaiveBayesClassifier.load()
+            if _model is None:
+                schedule_training()
+                _model = _EMPTY_MODEL
+        if _model is not _EMPTY_MODEL:
+            catch_up(_model)
+        _refreshed_at = time.monotonic()
+        return _model
+
+
+def classify_items(item_names) -> 'list[Prediction]':
+    """
+    整批分類
+    已刪除的類型不會出現在結果中，信心低於 MIN_CONFIDENCE 時 category_id 為 None
+    """
+    from .choices import category_choices
+
+    item_names = list(item_names)
+    if not item_names:
+        return []
+    categories = category_choices.get_map()
+    predictions = get_classifier().predict_batch(item_names, top=len(categories) or 1)
+    results = []
+    for prediction in predictions:
+        ranking = [(c, p) for c, p in prediction.ranking if c in categories][:3]
+        best, confidence = ranking[0] if ranking else (None, 0.0)
+        results.append(Prediction(best if confidence >= MIN_CONFIDENCE else None, confidence, ranking))
+    return results
@@ -0,0 +1,50 @@
+"""
+批次寫入輔助
+大量插入/更新時直接以 executemany 寫入欄位值，不建立 model 實例，也不觸發 signal
+"""
+from django.db import connections, router
+
+
+INSERT_BATCH_SIZE = 5000
+
+
+def _execute_many(model, sql: 'str', rows, batch_size: 'int') -> 'int':
+    connection = connections[router.db_for_write(model)]
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def _columns(model, fields: 'list[str]') -> 'list[str]':
+    quote = connections[router.db_for_write(model)].ops.quote_name
+    return [quote(model._meta.get_field(name).column) for name in fields]
+
+
+def insert_values(model, fields: 'list[str]', rows, batch_size: 'int' = INSERT_BATCH_SIZE) -> 'int':
+    """
+    rows: [(欄位值, ...), ...]，順序與 fields 相同，值需已是資料庫可接受的型別
+    回傳寫入筆數；不回傳主鍵，需要時請另外查詢
+    """
+    quote = connections[router.db_for_write(model)].ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(_columns(model, fields)),
+        ', '.join(['%s'] * len(fields)),
+    )
+    return _execute_many(model, sql, rows, batch_size)
+
+
+def update_values(model, fields: 'list[str]', rows, batch_size: 'int' = INSERT_BATCH_SIZE) -> 'int':
+    """
+    逐列更新不同的值
+    rows: [(欄位值, ..., 主鍵), ...]，欄位值順序與 fields 相同，最後一欄為主鍵
+    """
+    quote = connections[router.db_for_write(model)].ops.quote_name
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        quote(model._meta.db_table),
+        ', '.join(f'{column} = %s' for column in _columns(model, fields)),
+        quote(model._meta.pk.column),
+    )
+    return _execute_many(model, sql, rows, batch_size)
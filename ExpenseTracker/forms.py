@@ -1,6 +1,15 @@
+from decimal import Decimal
+
 from django import forms
 from django.utils import timezone
 from .models import Expense, ExpenseCategory, Participant, ExpenseSplit
+from .choices import (
+    CachedModelChoiceField,
+    CachedModelMultipleChoiceField,
+    category_choices,
+    participant_choices,
+    is_active_participant,
+)
 
 
 class ExpenseForm(forms.ModelForm):
@@ -15,8 +24,20 @@ class ExpenseForm(forms.ModelForm):
         initial=timezone.now,
         label="時間"
     )
-    split_participants = forms.ModelMultipleChoiceField(
-        queryset=Participant.objects.filter(is_active=True),
+    category = CachedModelChoiceField(
+        category_choices,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label="類型"
+    )
+    paid_by = CachedModelChoiceField(
+        participant_choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label="付款人"
+    )
+    split_participants = CachedModelMultipleChoiceField(
+        participant_choices,
+        filter_func=is_active_participant,
         widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'}),
         required=False,
         label="分攤者"
@@ -26,14 +47,28 @@ class ExpenseForm(forms.ModelForm):
         model = Expense
         fields = ['date', 'time', 'item_name', 'category', 'amount', 'note', 'paid_by']
         widgets = {
-            'item_name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '品項名稱'}),
-            'category': forms.Select(attrs={'class': 'form-select'}),
+            'item_name': forms.TextInput(attrs={
+                'class': 'form-control', 'placeholder': '品項名稱',
+                'list': 'item-suggestions', 'autocomplete': 'off',
+            }),
             'amount': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0.01'}),
             'note': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': '備註 (選填)'}),
-            'paid_by': forms.Select(attrs={'class': 'form-select'}),
         }
 
 
+class ExpenseBatchItemForm(forms.Form):
+    """批次記帳單筆欄位驗證；外鍵只驗格式，存在與否由批次一次查詢"""
+    id = forms.IntegerField(required=False, min_value=1)
+    date = forms.DateField()
+    time = forms.TimeField(required=False)
+    item_name = forms.CharField(max_length=200)
+    # 未提供時由分類器依品項名稱判斷
+    category = forms.IntegerField(required=False, min_value=1)
+    amount = forms.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    note = forms.CharField(required=False)
+    paid_by = forms.IntegerField(required=False, min_value=1)
+
+
 class CategoryForm(forms.ModelForm):
     """類型表單"""
     class Meta:
@@ -71,8 +106,8 @@ class ExpenseFilterForm(forms.Form):
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
         label="結束日期"
     )
-    category = forms.ModelChoiceField(
-        queryset=ExpenseCategory.objects.all(),
+    category = CachedModelChoiceField(
+        category_choices,
         required=False,
         empty_label="全部類型",
         widget=forms.Select(attrs={'class': 'form-select'}),
@@ -96,3 +131,45 @@ class ExpenseFilterForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select'}),
         label="排序"
     )
+
+
+class ExpenseBulkActionForm(forms.Form):
+    """記帳列表批次操作"""
+    ACTION_CHOICES = [
+        ('recategorize', '改類型'),
+        ('reassign_payer', '改付款人'),
+        ('resplit', '重新平均分攤'),
+        ('delete', '刪除'),
+    ]
+    action = forms.ChoiceField(
+        choices=ACTION_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label="批次操作"
+    )
+    select_all = forms.BooleanField(required=False, label="套用到所有符合篩選條件的記帳")
+    category = CachedModelChoiceField(
+        category_choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label="類型"
+    )
+    paid_by = CachedModelChoiceField(
+        participant_choices,
+        required=False,
+        empty_label="（無付款人）",
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label="付款人"
+    )
+    split_participants = CachedModelMultipleChoiceField(
+        participant_choices,
+        filter_func=is_active_participant,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'}),
+        required=False,
+        label="分攤者（未選則沿用原分攤者）"
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('action') == 'recategorize' and not cleaned_data.get('category'):
+            self.add_error('category', '請選擇類型')
+        return cleaned_data
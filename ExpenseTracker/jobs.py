@@ -0,0 +1,271 @@
+"""
+資料庫佇列的背景工作
+不依賴外部 broker，web 端 enqueue，run_worker 指令負責執行
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = getattr(settings, 'JOB_WORKER_POLL_INTERVAL', 1.0)
+DEFAULT_MAX_ATTEMPTS = getattr(settings, 'JOB_DEFAULT_MAX_ATTEMPTS', 3)
+RETRY_BACKOFF = getattr(settings, 'JOB_RETRY_BACKOFF', 5)
+STALE_AFTER = getattr(settings, 'JOB_STALE_AFTER', 60 * 30)
+HEARTBEAT_INTERVAL = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+STALE_CHECK_INTERVAL = getattr(settings, 'JOB_STALE_CHECK_INTERVAL', 60)
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    name: 'str'
+    func: 'Callable'
+    max_attempts: 'int'
+
+
+_registry: 'dict[str, TaskSpec]' = {}
+
+
+def task(name: 'str' = None, max_attempts: 'int' = None):
+    """
+    註冊背景工作
+    被註冊的函式簽名為 func(ctx: JobContext, **payload)，回傳值需可 JSON 序列化
+    """
+    def decorator(func):
+        task_name = name or func.__name__
+        _registry[task_name] = TaskSpec(
+            name=task_name,
+            func=func,
+            max_attempts=max_attempts or DEFAULT_MAX_ATTEMPTS,
+        )
+        return func
+    return decorator
+
+
+def get_task(name: 'str') -> 'TaskSpec|None':
+    return _registry.get(name)
+
+
+def enqueue(task_name: 'str', payload: 'dict' = None, *, run_after=None, max_attempts: 'int' = None) -> 'Job':
+    """排入背景工作"""
+    spec = get_task(task_name)
+    if spec is None:
+        raise KeyError(f'未註冊的背景工作：{task_name}')
+    return Job.objects.create(
+        task=task_name,
+        payload=payload or {},
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts or spec.max_attempts,
+    )
+
+
+class JobContext:
+    """提供工作回報進度，回報時一併更新心跳"""
+
+    def __init__(self, job: 'Job'):
+        self.job = job
+
+    def set_progress(self, progress: 'int', message: 'str' = ''):
+        progress = max(0, min(100, int(progress)))
+        self.job.progress = progress
+        self.job.progress_message = message[:200]
+        Job.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by).update(
+            progress=progress,
+            progress_message=self.job.progress_message,
+            heartbeat_at=timezone.now(),
+        )
+
+
+class Heartbeat:
+    """
+    執行期間每 HEARTBEAT_INTERVAL 秒更新一次 heartbeat_at，不回報進度的長工作也不會被當成失聯
+    只更新仍由這個 worker 持有的工作；已被其他 worker 接手時不再讓它看起來還活著
+    """
+
+    def __init__(self, job: 'Job', interval: 'float' = None):
+        self.job = job
+        self.interval = HEARTBEAT_INTERVAL if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job.pk}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    alive = Job.objects.filter(
+                        pk=self.job.pk, status=Job.STATUS_RUNNING, locked_by=self.job.locked_by,
+                    ).update(heartbeat_at=timezone.now())
+                except Exception:
+                    # 例如 SQLite 正被工作本身的長交易鎖住，下一次再試
+                    logger.warning('Job %s heartbeat failed', self.job.pk, exc_info=True)
+                    continue
+                if not alive:
+                    logger.error('Job %s was taken over by another worker while still running', self.job.pk)
+                    return
+        finally:
+            connection.close()
+
+
+def default_worker_id() -> 'str':
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def requeue_stale_jobs() -> 'int':
+    """
+    把失聯 worker 留下的執行中工作重新排入佇列，回傳重新排入的筆數
+    失聯以心跳判斷，超過 STALE_AFTER 秒沒有心跳才算；次數已用完的工作（如只能執行一次的封存）標記失敗，不再重跑
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=STALE_AFTER)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED,
+        locked_by='',
+        error=f'worker 失聯，超過 {STALE_AFTER} 秒沒有心跳',
+        finished_at=now,
+    )
+    if failed:
+        logger.error('Marked %s stale jobs as failed', failed)
+    return stale.filter(attempts__lt=F('max_attempts')).update(status=Job.STATUS_PENDING, locked_by='')
+
+
+def claim_next_job(worker_id: 'str') -> 'Job|None':
+    """
+    取得下一個可執行的工作
+    以帶條件的 UPDATE 搶占，多個 worker 同時搶同一筆時只有一個會成功
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.STATUS_PENDING,
+        run_after__lte=now,
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:10]
+
+    for pk in candidates:
+        job = Job.objects.filter(pk=pk, status=Job.STATUS_PENDING)
+        claimed = job.update(
+            status=Job.STATUS_RUNNING,
+            locked_by=worker_id[:100],
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def _finish(job: 'Job', worker_id: 'str', fields: 'list[str]') -> 'bool':
+    """只在工作仍由這個 worker 持有時寫回結果，被判定失聯並由其他 worker 接手的就不覆寫"""
+    saved = Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING, locked_by=worker_id).update(
+        **{field: getattr(job, field) for field in fields}
+    )
+    if not saved:
+        logger.error('Job %s finished on %s after being taken over, result discarded', job.pk, worker_id)
+    return bool(saved)
+
+
+def run_job(job: 'Job') -> 'Job':
+    """執行已搶占的工作，失敗時依次數決定重試或標記失敗"""
+    worker_id = job.locked_by
+    job.attempts += 1
+    Job.objects.filter(pk=job.pk).update(attempts=job.attempts)
+    spec = get_task(job.task)
+
+    try:
+        if spec is None:
+            raise KeyError(f'未註冊的背景工作：{job.task}')
+        with Heartbeat(job):
+            result = spec.func(JobContext(job), **job.payload)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.status = Job.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            logger.warning('Job %s failed (attempt %s), retry in %ss', job.pk, job.attempts, delay)
+        else:
+            job.status = Job.STATUS_FAILED
+            job.finished_at = timezone.now()
+            logger.error('Job %s failed permanently', job.pk)
+        job.locked_by = ''
+        _finish(job, worker_id, ['status', 'error', 'run_after', 'finished_at', 'locked_by'])
+        return job
+
+    job.status = Job.STATUS_SUCCEEDED
+    job.result = result
+    job.progress = 100
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    _finish(job, worker_id, ['status', 'result', 'progress', 'finished_at', 'locked_by'])
+    return job
+
+
+def work(worker_id: 'str' = None, stop_event: 'threading.Event' = None, *,
+         poll_interval: 'float' = None, once: 'bool' = False) -> 'int':
+    """
+    worker 主迴圈
+    once=True 時佇列清空即結束；回傳執行的工作數
+    """
+    worker_id = worker_id or default_worker_id()
+    stop_event = stop_event or threading.Event()
+    poll_interval = POLL_INTERVAL if poll_interval is None else poll_interval
+    processed = 0
+    next_stale_check = 0.0
+
+    while not stop_event.is_set():
+        close_old_connections()
+        # 長時間執行的 worker 也要定期接手其他 worker 失聯留下的工作
+        if time.monotonic() >= next_stale_check:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                logger.warning('Requeued %s stale jobs', requeued)
+            next_stale_check = time.monotonic() + STALE_CHECK_INTERVAL
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+
+    close_old_connections()
+    return processed
+
+
+def job_to_dict(job: 'Job') -> 'dict':
+    return {
+        'id': job.pk,
+        'task': job.task,
+        'status': job.status,
+        'progress': job.progress,
+        'progress_message': job.progress_message,
+        'attempts': job.attempts,
+        'result': job.result if job.status == Job.STATUS_SUCCEEDED else None,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
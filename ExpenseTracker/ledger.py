@@ -0,0 +1,335 @@
+"""
+記帳與分攤的欄式快照（NumPy）
+第一次使用時整表載入一次：金額為以分為單位的 int64，日期為 date.toordinal() 的 int32，
+類型、付款人、參與者為 int32（無值為 -1），每筆記帳或分攤約 28 bytes
+之後依異動紀錄（ChangeLogEntry）只重新讀取變動過的列；資料版本號未變時不查資料庫
+統計、收支與時間序列都是陣列上的遮罩與 bincount，同一個儀表板的多項統計共用同一份快照
+"""
+import threading
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+
+from . import cache as data_cache
+from .models import ArchivedBalance, ArchivedDailyRollup, ChangeLogEntry, Expense, ExpenseSplit
+
+
+LOAD_BATCH_SIZE = getattr(settings, 'LEDGER_LOAD_BATCH_SIZE', 20000)
+CHANGE_BATCH_SIZE = 5000
+NULL_ID = -1
+
+
+def _cents(value) -> 'int':
+    return int((value * 100).quantize(Decimal('1')))
+
+
+def _id(value) -> 'int':
+    return NULL_ID if value is None else value
+
+
+def to_decimal(cents) -> 'Decimal':
+    return Decimal(int(cents)).scaleb(-2)
+
+
+# (欄位, dtype, 轉換函式)；第一欄為主鍵
+EXPENSE_SPEC = (
+    ('pk', np.int64, int),
+    ('date', np.int32, date.toordinal),
+    ('category_id', np.int32, _id),
+    ('paid_by_id', np.int32, _id),
+    ('amount', np.int64, _cents),
+)
+SPLIT_SPEC = (
+    ('pk', np.int64, int),
+    ('expense_id', np.int64, int),
+    ('participant_id', np.int32, int),
+    ('share_amount', np.int64, _cents),
+)
+ROLLUP_SPEC = (
+    ('date', np.int32, date.toordinal),
+    ('category_id', np.int32, _id),
+    ('total', np.int64, _cents),
+    ('count', np.int64, int),
+)
+
+
+@dataclass(frozen=True)
+class Table:
+    """同長度的一組欄位陣列；不可變，更新時回傳新的 Table，讀取中的執行緒不受影響"""
+    spec: 'tuple'
+    columns: 'dict[str, np.ndarray]'
+
+    @classmethod
+    def from_rows(cls, spec, rows) -> 'Table':
+        rows = rows if isinstance(rows, list) else list(rows)
+        return cls(spec, {
+            name: np.fromiter((convert(row[i]) for row in rows), dtype, len(rows))
+            for i, (name, dtype, convert) in enumerate(spec)
+        })
+
+    @classmethod
+    def concat(cls, spec, tables) -> 'Table':
+        """串接並依主鍵排序"""
+        tables = list(tables) or [cls.from_rows(spec, [])]
+        columns = {name: np.concatenate([table[name] for table in tables]) for name, _, _ in spec}
+        order = np.argsort(columns[spec[0][0]], kind='stable')
+        return cls(spec, {name: column[order] for name, column in columns.items()})
+
+    @property
+    def fields(self) -> 'list[str]':
+        return [name for name, _, _ in self.spec]
+
+    @property
+    def nbytes(self) -> 'int':
+        return sum(column.nbytes for column in self.columns.values())
+
+    def __getitem__(self, name: 'str') -> 'np.ndarray':
+        return self.columns[name]
+
+    def __len__(self) -> 'int':
+        return len(self.columns[self.spec[0][0]])
+
+    def replace_rows(self, changed_ids, rows) -> 'Table':
+        """移除 changed_ids 的舊資料再加入 rows（已刪除的列不在 rows 中）"""
+        keep = ~np.isin(self['pk'], np.fromiter(changed_ids, np.int64, len(changed_ids)))
+        kept = Table(self.spec, {name: column[keep] for name, column in self.columns.items()})
+        return Table.concat(self.spec, [kept, Table.from_rows(self.spec, rows)])
+
+
+def _load_table(model, spec) -> 'Table':
+    """以主鍵分批載入整表"""
+    fields = [name for name, _, _ in spec]
+    tables, last_pk = [], 0
+    queryset = model.objects.order_by('pk').values_list(*fields)
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:LOAD_BATCH_SIZE])
+        if not rows:
+            return Table.concat(spec, tables)
+        tables.append(Table.from_rows(spec, rows))
+        last_pk = rows[-1][0]
+
+
+def _date_mask(dates: 'np.ndarray', start_date, end_date) -> 'np.ndarray':
+    mask = np.ones(len(dates), dtype=bool)
+    if start_date:
+        mask &= dates >= start_date.toordinal()
+    if end_date:
+        mask &= dates <= end_date.toordinal()
+    return mask
+
+
+def _group_sum(keys: 'np.ndarray', values: 'np.ndarray', counts: 'np.ndarray' = None) -> 'dict':
+    """
+    依非負整數鍵加總，回傳 {鍵: (總和, 筆數)}；counts 為 None 時筆數為列數
+    bincount 以 float64 累加，總和在 2^53 分以內皆為精確值
+    """
+    sums = np.rint(np.bincount(keys, weights=values)).astype(np.int64)
+    if counts is None:
+        numbers = np.bincount(keys)
+    else:
+        numbers = np.rint(np.bincount(keys, weights=counts)).astype(np.int64)
+    present = np.flatnonzero(numbers)
+    return {
+        key: (total, number)
+        for key, total, number in zip(present.tolist(), sums[present].tolist(), numbers[present].tolist())
+    }
+
+
+def _group_by_id(ids: 'np.ndarray', values: 'np.ndarray', counts: 'np.ndarray' = None) -> 'dict':
+    """依 ID 加總；ID -1 以 None 表示"""
+    groups = _group_sum(ids.astype(np.int64) + 1, values, counts)
+    return {(None if key == 0 else key - 1): value for key, value in groups.items()}
+
+
+@dataclass(frozen=True)
+class LedgerSnapshot:
+    expenses: 'Table'
+    splits: 'Table'
+    rollups: 'Table'  # 已封存記帳的每日彙總
+    archived_balances: 'dict[int, tuple[int, int]]'  # participant_id -> (已付分, 應分攤分)
+    cursor: 'int'  # 已套用的最後一筆異動紀錄 ID
+
+    @classmethod
+    def load(cls) -> 'LedgerSnapshot':
+        # 先記下游標再讀資料，讀取期間的異動會在下次 refresh 時重新套用
+        cursor = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        return cls(
+            expenses=_load_table(Expense, EXPENSE_SPEC),
+            splits=_load_table(ExpenseSplit, SPLIT_SPEC),
+            cursor=cursor,
+            **cls._load_archived(),
+        )
+
+    @staticmethod
+    def _load_archived() -> 'dict':
+        rollups = ArchivedDailyRollup.objects.values_list(*[name for name, _, _ in ROLLUP_SPEC])
+        return {
+            'rollups': Table.from_rows(ROLLUP_SPEC, rollups),
+            'archived_balances': {
+                participant_id: (_cents(paid), _cents(owed))
+                for participant_id, paid, owed in ArchivedBalance.objects.values_list('participant_id', 'paid', 'owed')
+            },
+        }
+
+    def refresh(self) -> 'LedgerSnapshot':
+        """套用游標之後的異動，回傳新的快照"""
+        cursor = self.cursor
+        changed = {'expense': set(), 'expense_split': set()}
+        while True:
+            entries = list(
+                ChangeLogEntry.objects.filter(id__gt=cursor, model__in=list(changed))
+                .order_by('id').values_list('id', 'model', 'object_id')[:CHANGE_BATCH_SIZE]
+            )
+            if not entries:
+                break
+            cursor = entries[-1][0]
+            for _, model_name, object_id in entries:
+                changed[model_name].add(object_id)
+        if cursor == self.cursor:
+            return self
+
+        tables = {}
+        for model_name, model, table in (('expense', Expense, self.expenses), ('expense_split', ExpenseSplit, self.splits)):
+            ids = sorted(changed[model_name])
+            rows = []
+            for start in range(0, len(ids), CHANGE_BATCH_SIZE):
+                queryset = model.objects.filter(pk__in=ids[start:start + CHANGE_BATCH_SIZE]).values_list(*table.fields)
+                rows.extend(queryset)
+            tables[model_name] = table.replace_rows(ids, rows) if ids else table
+        # 封存會刪除記帳（留下異動紀錄）並改寫彙總，彙總表很小，整表重讀
+        return LedgerSnapshot(
+            expenses=tables['expense'], splits=tables['expense_split'], cursor=cursor, **self._load_archived(),
+        )
+
+    @property
+    def nbytes(self) -> 'int':
+        return self.expenses.nbytes + self.splits.nbytes + self.rollups.nbytes
+
+    def category_totals(self, start_date=None, end_date=None) -> 'dict':
+        """各類型的 (金額分, 筆數)，含已封存的每日彙總；未分類為 None"""
+        expenses, rollups = self.expenses, self.rollups
+        mask = _date_mask(expenses['date'], start_date, end_date)
+        totals = _group_by_id(expenses['category_id'][mask], expenses['amount'][mask])
+        mask = _date_mask(rollups['date'], start_date, end_date)
+        archived = _group_by_id(rollups['category_id'][mask], rollups['total'][mask], rollups['count'][mask])
+        for category_id, (total, count) in archived.items():
+            current_total, current_count = totals.get(category_id, (0, 0))
+            totals[category_id] = (current_total + total, current_count + count)
+        return totals
+
+    def participant_totals(self) -> 'dict[int, tuple[int, int]]':
+        """每位參與者的 (已付分, 應分攤分)，含已封存的收支"""
+        expenses, splits = self.expenses, self.splits
+        has_payer = expenses['paid_by_id'] != NULL_ID
+        paid = _group_by_id(expenses['paid_by_id'][has_payer], expenses['amount'][has_payer])
+        owed = _group_by_id(splits['participant_id'], splits['share_amount'])
+        totals = {}
+        for participant_id in paid.keys() | owed.keys() | self.archived_balances.keys():
+            archived_paid, archived_owed = self.archived_balances.get(participant_id, (0, 0))
+            totals[participant_id] = (
+                paid.get(participant_id, (0, 0))[0] + archived_paid,
+                owed.get(participant_id, (0, 0))[0] + archived_owed,
+            )
+        return totals
+
+    def date_bounds(self) -> 'tuple[date|None, date|None]':
+        """最早與最晚的記帳日期（含已封存）；沒有資料時為 (None, None)"""
+        dates = np.concatenate([self.expenses['date'], self.rollups['date']])
+        if not len(dates):
+            return None, None
+        return date.fromordinal(int(dates.min())), date.fromordinal(int(dates.max()))
+
+    def daily_totals(self, start_date, end_date, category_id=None) -> 'list[tuple[date, int, int]]':
+        """start_date ~ end_date 每日的 (日期, 金額分, 筆數)，含沒有支出的日子與已封存的彙總"""
+        first, last = start_date.toordinal(), end_date.toordinal()
+        days = max(0, last - first + 1)
+        totals = np.zeros(days, dtype=np.int64)
+        counts = np.zeros(days, dtype=np.int64)
+        for table, value, count in (
+            (self.expenses, 'amount', None),
+            (self.rollups, 'total', 'count'),
+        ):
+            mask = _date_mask(table['date'], start_date, end_date)
+            if category_id is not None:
+                mask &= table['category_id'] == category_id
+            offsets = table['date'][mask] - first
+            totals += np.rint(np.bincount(offsets, weights=table[value][mask], minlength=days)).astype(np.int64)
+            if count is None:
+                counts += np.bincount(offsets, minlength=days)
+            else:
+                counts += np.rint(np.bincount(offsets, weights=table[count][mask], minlength=days)).astype(np.int64)
+        return [
+            (date.fromordinal(first + offset), total, count)
+            for offset, (total, count) in enumerate(zip(totals.tolist(), counts.tolist()))
+        ]
+
+    def spending_groups(self, start_date=None, end_date=None, mode='share') -> 'list[tuple[int, int|None, int]]':
+        """
+        (參與者, 類型, 金額分) 的彙總
+        mode: 'share' 依分攤金額（日期、類型取自所屬記帳），'paid' 依付款人實付金額
+        """
+        expenses = self.expenses
+        if not len(expenses):
+            return []
+        if mode == 'paid':
+            mask = _date_mask(expenses['date'], start_date, end_date) & (expenses['paid_by_id'] != NULL_ID)
+            people = expenses['paid_by_id'][mask]
+            categories = expenses['category_id'][mask]
+            amounts = expenses['amount'][mask]
+        else:
+            splits = self.splits
+            # 主鍵已排序，以 searchsorted 找到每筆分攤所屬記帳的位置；找不到記帳的分攤略過
+            index = np.minimum(np.searchsorted(expenses['pk'], splits['expense_id']), len(expenses) - 1)
+            found = expenses['pk'][index] == splits['expense_id']
+            mask = found & _date_mask(expenses['date'][index], start_date, end_date)
+            people = splits['participant_id'][mask]
+            categories = expenses['category_id'][index[mask]]
+            amounts = splits['share_amount'][mask]
+
+        # 以 (參與者, 類型) 編成單一鍵後 bincount
+        category_keys, category_index = np.unique(categories, return_inverse=True)
+        keys = people.astype(np.int64) * len(category_keys) + category_index
+        groups = _group_sum(keys, amounts)
+        width = len(category_keys)
+        return [
+            (key // width, _none(category_keys[key % width]), total)
+            for key, (total, _) in groups.items()
+        ]
+
+
+def _none(category_id) -> 'int|None':
+    category_id = int(category_id)
+    return None if category_id == NULL_ID else category_id
+
+
+_ledger_lock = threading.Lock()
+_ledger = (None, None)  # (資料版本, 快照)
+
+
+def get_ledger_snapshot() -> 'LedgerSnapshot':
+    """
+    行程內共用的記帳快照
+    資料版本未變時直接回傳；有變時只套用異動紀錄中的變動，第一次使用時整表載入
+    """
+    global _ledger
+    versions = data_cache.get_data_versions(data_cache.EXPENSE, data_cache.CATEGORY, data_cache.PARTICIPANT)
+    version = tuple(sorted(versions.items()))
+    cached_version, snapshot = _ledger
+    if cached_version == version:
+        return snapshot
+    with _ledger_lock:
+        cached_version, snapshot = _ledger
+        if cached_version == version:
+            return snapshot
+        snapshot = LedgerSnapshot.load() if snapshot is None else snapshot.refresh()
+        _ledger = (version, snapshot)
+        return snapshot
+
+
+def clear():
+    global _ledger
+    with _ledger_lock:
+        _ledger = (None, None)
@@ -0,0 +1,221 @@
+"""
+儀表板即時推播（SSE）
+記帳或分攤寫入提交後，去抖動後只計算一次統計與結算快照，經 broadcaster 分送給所有連線
+閒置連線只等待佇列，不查資料庫；多 worker 部署可改用 Redis 後端轉送快照
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('day', 'week', 'month', 'all')
+DEBOUNCE = getattr(settings, 'LIVE_DASHBOARD_DEBOUNCE', 0.5)
+HEARTBEAT_INTERVAL = getattr(settings, 'LIVE_DASHBOARD_HEARTBEAT', 15)
+CLIENT_QUEUE_SIZE = 16
+BACKEND_PATH = getattr(settings, 'LIVE_DASHBOARD_BACKEND', 'ExpenseTracker.live.InProcessBroadcastBackend')
+
+
+def compute_snapshot() -> 'dict':
+    """所有期間的統計與結算；轉成 JSON 相容的型別以便比較與轉送"""
+    from .services import get_statistics, calculate_settlement
+
+    snapshot = {
+        'date': timezone.localdate().isoformat(),
+        'stats': {period: get_statistics(period=period) for period in PERIODS},
+        'settlement': calculate_settlement(),
+    }
+    return json.loads(json.dumps(snapshot, cls=DjangoJSONEncoder))
+
+
+def diff(old: 'dict|None', new: 'dict') -> 'dict':
+    """頂層欄位的差異；old 為 None 時回傳全部"""
+    if old is None:
+        return dict(new)
+    return {key: value for key, value in new.items() if old.get(key) != value}
+
+
+class Broadcaster:
+    """行程內的連線管理：每個訂閱者一個 asyncio.Queue，快照只在收到時比較一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: 'dict[str, set]' = {period: set() for period in PERIODS}
+        self._latest: 'dict|None' = None
+        self._compute_lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> 'int':
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def latest(self) -> 'dict':
+        """目前的快照；尚未計算或已跨日時才計算（同時多個連線只算一次）"""
+        with self._compute_lock:
+            snapshot = self._latest
+            if snapshot is None or snapshot['date'] != timezone.localdate().isoformat():
+                snapshot = self._latest = compute_snapshot()
+            return snapshot
+
+    def invalidate(self):
+        """沒有連線時的寫入不計算快照，只標記過期，下個連線再算"""
+        self._latest = None
+
+    def subscribe(self, period: 'str'):
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[period].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, period: 'str', subscriber):
+        with self._lock:
+            self._subscribers[period].discard(subscriber)
+
+    def receive(self, snapshot: 'dict'):
+        """由後端呼叫：與上一份快照比較，每個期間只算一次差異後分送"""
+        previous, self._latest = self._latest, snapshot
+        messages = {}
+        for period in PERIODS:
+            delta = diff(previous['stats'][period] if previous else None, snapshot['stats'][period])
+            if previous is None or snapshot['settlement'] != previous['settlement']:
+                delta['settlement'] = snapshot['settlement']
+            if delta:
+                messages[period] = delta
+        with self._lock:
+            targets = [(period, list(self._subscribers[period])) for period in messages]
+        for period, subscribers in targets:
+            message = messages[period]
+            for loop, queue in subscribers:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+
+    @staticmethod
+    def _offer(queue: 'asyncio.Queue', message: 'dict'):
+        # 慢速的連線不阻塞其他連線；差異只含變動的頂層欄位，不能丟棄，
+        # 佇列滿時把積壓的差異依序合併成一則，後到的值覆蓋先前的
+        if queue.full():
+            merged = {}
+            while not queue.empty():
+                merged.update(queue.get_nowait())
+            merged.update(message)
+            message = merged
+        queue.put_nowait(message)
+
+
+class InProcessBroadcastBackend:
+    """單一行程：計算結果直接交給本行程的 broadcaster"""
+
+    def __init__(self, broadcaster: 'Broadcaster'):
+        self.broadcaster = broadcaster
+
+    def has_listeners(self) -> 'bool':
+        return self.broadcaster.subscriber_count > 0
+
+    def publish(self, snapshot: 'dict'):
+        self.broadcaster.receive(snapshot)
+
+
+class RedisBroadcastBackend:
+    """
+    多 worker：寫入的行程計算一次快照後發佈到 Redis 頻道
+    每個 worker 以一條背景執行緒訂閱頻道，再交給各自的 broadcaster
+    """
+    channel = 'expense-tracker:dashboard'
+
+    def __init__(self, broadcaster: 'Broadcaster'):
+        if redis is None:
+            raise RuntimeError('需安裝 redis 才能使用 RedisBroadcastBackend')
+        self.broadcaster = broadcaster
+        self.client = redis.Redis.from_url(getattr(settings, 'LIVE_DASHBOARD_REDIS_URL', 'redis://localhost:6379/0'))
+        self._listener = threading.Thread(target=self._listen, name='live-dashboard-listener', daemon=True)
+        self._listener.start()
+
+    def has_listeners(self) -> 'bool':
+        # 無法得知其他 worker 的連線數，一律計算
+        return True
+
+    def publish(self, snapshot: 'dict'):
+        self.client.publish(self.channel, json.dumps(snapshot))
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            try:
+                self.broadcaster.receive(json.loads(message['data']))
+            except Exception:
+                logger.exception('儀表板快照轉送失敗')
+
+
+broadcaster = Broadcaster()
+_backend = None
+_timer = None
+_timer_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(BACKEND_PATH)(broadcaster)
+    return _backend
+
+
+def _publish():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    try:
+        get_backend().publish(compute_snapshot())
+    except Exception:
+        logger.exception('儀表板快照計算失敗')
+    finally:
+        connection.close()
+
+
+def schedule_publish():
+    """
+    寫入提交後呼叫；DEBOUNCE 秒內的多次寫入只計算一次
+    本行程沒有任何連線（且後端不需轉送）時不計算
+    """
+    global _timer
+    if not get_backend().has_listeners():
+        broadcaster.invalidate()
+        return
+    with _timer_lock:
+        if _timer is None:
+            _timer = threading.Timer(DEBOUNCE, _publish)
+            _timer.daemon = True
+            _timer.start()
+
+
+def format_event(event: 'str', data: 'dict') -> 'str':
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def dashboard_events(period: 'str', subscriber, snapshot: 'dict'):
+    """先送完整快照，之後只送差異；閒置時定期送註解行維持連線"""
+    _, queue = subscriber
+    try:
+        yield format_event('snapshot', dict(snapshot['stats'][period], settlement=snapshot['settlement']))
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event('delta', message)
+    finally:
+        broadcaster.unsubscribe(period, subscriber)
@@ -0,0 +1,44 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ExpenseTracker import cache as data_cache
+from ExpenseTracker.archive import archive_year, ArchiveError, DEFAULT_BATCH_SIZE
+from ExpenseTracker.models import Expense
+
+
+class Command(BaseCommand):
+    help = '將已結束年度的記帳封存至 ARCHIVE_ROOT，並從熱資料表刪除'
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--year', type=int, help='封存指定年度')
+        group.add_argument('--before', type=int, help='封存此年度之前的所有年度')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            data_cache.require_shared_cache('封存記帳')
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+        if options['year']:
+            years = [options['year']]
+        else:
+            before = min(options['before'], timezone.localdate().year)
+            years = sorted(
+                d.year for d in Expense.objects.filter(date__year__lt=before).dates('date', 'year')
+            )
+
+        for year in years:
+            try:
+                result = archive_year(
+                    year,
+                    batch_size=options['batch_size'],
+                    progress=lambda done, total: self.stdout.write(f'{year}: {done}/{total}'),
+                )
+            except ArchiveError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(
+                f"{year}：封存 {result['expenses']} 筆記帳、{result['splits']} 筆分攤，"
+                f"{len(result['segments'])} 個檔案"
+            ))
@@ -0,0 +1,76 @@
+import json
+import sys
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from ExpenseTracker import cache as data_cache
+from ExpenseTracker.audit import audit_ledger, AUDIT_BATCH_SIZE, MISMATCH, UNSPLIT, ORPHAN_SPLIT
+
+
+class Command(BaseCommand):
+    help = '稽核分攤總和與記帳金額是否一致，找出不符、沒有分攤與孤兒分攤；--fix 時批次修正'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=AUDIT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=1, help='依日期區間平行稽核的執行緒數')
+        parser.add_argument('--fix', action='store_true', help='依原比例修正分攤金額並刪除孤兒分攤')
+        parser.add_argument(
+            '--report',
+            help='JSON Lines 報告路徑（- 為標準輸出）：每行一筆問題，最後一行為 summary',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size 必須大於 0')
+        if options['fix']:
+            try:
+                data_cache.require_shared_cache('修正分攤')
+            except ImproperlyConfigured as exc:
+                raise CommandError(str(exc))
+
+        report_file = None
+        if options['report'] == '-':
+            report_file = sys.stdout
+        elif options['report']:
+            report_file = open(options['report'], 'w', encoding='utf-8')
+
+        def report(issue):
+            report_file.write(json.dumps(issue, ensure_ascii=False) + '\n')
+
+        def progress(start, end, totals):
+            # 報告輸出到標準輸出時，進度改寫到 stderr 以免混入 JSON
+            stream = self.stderr if report_file is sys.stdout else self.stdout
+            stream.write(f"{start}～{end}：{totals['expenses']} 筆記帳，"
+                         f"{totals[MISMATCH]} 筆不符、{totals[UNSPLIT]} 筆沒有分攤")
+
+        started = time.perf_counter()
+        try:
+            summary = audit_ledger(
+                batch_size=options['batch_size'],
+                fix=options['fix'],
+                workers=max(1, options['workers']),
+                report=report if report_file else None,
+                progress=progress,
+            )
+            summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+            if report_file:
+                report_file.write(json.dumps({'kind': 'summary', 'fix': options['fix'], **summary}) + '\n')
+        finally:
+            if report_file and report_file is not sys.stdout:
+                report_file.close()
+
+        if report_file is sys.stdout:
+            return
+        message = (
+            f"稽核 {summary['expenses']} 筆記帳、{summary['splits']} 筆分攤："
+            f"{summary[MISMATCH]} 筆金額不符、{summary[UNSPLIT]} 筆沒有分攤、"
+            f"{summary[ORPHAN_SPLIT]} 筆孤兒分攤（{summary['elapsed_seconds']} 秒）"
+        )
+        if options['fix']:
+            message += f"；已修正 {summary['fixed']} 筆（更新 {summary['splits_updated']} 筆分攤）"
+        if summary[MISMATCH] or summary[ORPHAN_SPLIT]:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
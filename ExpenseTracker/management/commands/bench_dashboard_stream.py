@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from ExpenseTracker.live import broadcaster
+from ExpenseTracker.models import Expense, ExpenseCategory
+
+
+class QueryCounter:
+    """計算所有執行緒的查詢數（含之後才建立的連線）"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = '以大量閒置的儀表板 SSE 連線量測閒置與推播時的查詢數'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=300)
+        parser.add_argument('--idle', type=float, default=3.0, help='閒置觀察秒數')
+        parser.add_argument('--period', default='all')
+
+    def handle(self, *args, **options):
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        counter.install(connection)
+        try:
+            result = asyncio.run(self._run(counter, options))
+        finally:
+            connection_created.disconnect(counter.install)
+            connection.execute_wrappers[:] = [w for w in connection.execute_wrappers if w is not counter]
+
+        self.stdout.write(f"連線數：{options['clients']}")
+        self.stdout.write(f"建立連線（含首次快照）：{result['connect_queries']} queries，{result['connect_ms']:.0f} ms")
+        self.stdout.write(f"閒置 {options['idle']:.0f} 秒：{result['idle_queries']} queries")
+        self.stdout.write(
+            f"寫入一筆記帳後推播：{result['push_queries']} queries（含寫入本身），"
+            f"{result['delivered']}/{options['clients']} 個連線在 {result['push_ms']:.0f} ms 內收到差異"
+        )
+
+    async def _run(self, counter, options):
+        application = get_asgi_application()
+        path = reverse('expense_tracker:dashboard_stream')
+        clients = options['clients']
+        disconnect = asyncio.Event()
+        received = [asyncio.Queue() for _ in range(clients)]
+
+        async def client(index):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': f"period={options['period']}".encode(),
+                'headers': [(b'host', b'testserver')], 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            }
+            request_sent = False
+
+            async def receive():
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.body' and message.get('body'):
+                    await received[index].put(message['body'].decode())
+
+            await application(scope, receive, send)
+
+        async def wait_all(event_name, timeout):
+            delivered = 0
+            for queue in received:
+                try:
+                    while True:
+                        body = await asyncio.wait_for(queue.get(), timeout)
+                        if body.startswith(f'event: {event_name}'):
+                            delivered += 1
+                            break
+                except asyncio.TimeoutError:
+                    pass
+            return delivered
+
+        broadcaster.invalidate()
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(client(index)) for index in range(clients)]
+        await wait_all('snapshot', 10)
+        connect_ms = (time.perf_counter() - start) * 1000
+        connect_queries = counter.count
+
+        counter.count = 0
+        await asyncio.sleep(options['idle'])
+        idle_queries = counter.count
+
+        counter.count = 0
+        start = time.perf_counter()
+        expense = await sync_to_async(self._write)()
+        delivered = await wait_all('delta', 10)
+        push_ms = (time.perf_counter() - start) * 1000
+        push_queries = counter.count
+
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await sync_to_async(expense.delete)()
+        return {
+            'connect_queries': connect_queries, 'connect_ms': connect_ms,
+            'idle_queries': idle_queries,
+            'push_queries': push_queries, 'push_ms': push_ms, 'delivered': delivered,
+        }
+
+    def _write(self):
+        return Expense.objects.create(
+            date=date.today(),
+            item_name='bench_dashboard_stream',
+            category=ExpenseCategory.objects.first(),
+            amount=Decimal('1.00'),
+        )
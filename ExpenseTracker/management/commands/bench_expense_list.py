@@ -0,0 +1,55 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from ExpenseTracker.models import Expense
+from ExpenseTracker.views import expense_list
+
+
+class Command(BaseCommand):
+    help = '比較記帳列表在冷/熱片段快取下的每頁渲染時間'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10, help='量測頁數')
+        parser.add_argument('--repeat', type=int, default=3, help='每頁重複次數')
+
+    def handle(self, *args, **options):
+        pages = options['pages']
+        repeat = options['repeat']
+        if not Expense.objects.exists():
+            self.stdout.write(self.style.WARNING('沒有記帳資料，無法量測'))
+            return
+
+        factory = RequestFactory()
+        cold = self._measure(factory, pages, repeat, clear_cache=True)
+        # 先渲染一輪讓快取變熱
+        self._measure(factory, pages, 1, clear_cache=False)
+        warm = self._measure(factory, pages, repeat, clear_cache=False)
+
+        for label, (elapsed, queries) in (('cold', cold), ('warm', warm)):
+            self.stdout.write(
+                f'{label}: {elapsed * 1000:.2f} ms/page, {queries:.1f} queries/page'
+            )
+        if warm[0] > 0:
+            self.stdout.write(f'speedup: {cold[0] / warm[0]:.2f}x')
+
+    def _measure(self, factory, pages, repeat, clear_cache):
+        total_time = 0.0
+        total_queries = 0
+        runs = 0
+        for _ in range(repeat):
+            for page in range(1, pages + 1):
+                if clear_cache:
+                    cache.clear()
+                request = factory.get('/expense/', {'page': page})
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    expense_list(request)
+                    total_time += time.perf_counter() - start
+                total_queries += len(ctx.captured_queries)
+                runs += 1
+        return total_time / runs, total_queries / runs
@@ -0,0 +1,58 @@
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ExpenseTracker.statements import (
+    EMAIL_BATCH_SIZE,
+    collect_statements,
+    get_output_dir,
+    render_statements,
+    send_statements,
+)
+
+
+class Command(BaseCommand):
+    help = '產生每位參與者的月對帳單（HTML / CSV）到 TMP_ROOT，--send 時以 EMAIL_BACKEND 寄出'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='YYYY-MM，預設為上個月')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='產生檔案的行程數')
+        parser.add_argument('--participant', type=int, action='append', help='只產生指定參與者（可重複）')
+        parser.add_argument('--send', action='store_true', help='產生後寄出')
+        parser.add_argument('--batch-size', type=int, default=EMAIL_BATCH_SIZE, help='每次送出的郵件封數')
+
+    def handle(self, *args, **options):
+        year, month = self._parse_month(options['month'])
+
+        start = time.perf_counter()
+        statements = collect_statements(year, month, participant_ids=options['participant'])
+        collected = time.perf_counter()
+        self.stdout.write(f'{year}-{month:02d}：{len(statements)} 位參與者，讀取 {collected - start:.2f} 秒')
+
+        output_dir = get_output_dir(year, month)
+        files = render_statements(statements, output_dir, workers=max(1, options['workers']))
+        rendered = time.perf_counter()
+        self.stdout.write(f'已產生 {len(files)} 份對帳單到 {output_dir}，{rendered - collected:.2f} 秒')
+
+        if options['send']:
+            result = send_statements(statements, files, batch_size=max(1, options['batch_size']))
+            self.stdout.write(
+                f"已寄出 {result['sent']} 封，{result['skipped']} 位沒有 Email 略過，"
+                f'{time.perf_counter() - rendered:.2f} 秒'
+            )
+        self.stdout.write(self.style.SUCCESS(f'完成，共 {time.perf_counter() - start:.2f} 秒'))
+
+    def _parse_month(self, value):
+        if not value:
+            first = timezone.localdate().replace(day=1)
+            previous = date.fromordinal(first.toordinal() - 1)
+            return previous.year, previous.month
+        try:
+            year, month = (int(part) for part in value.split('-'))
+            date(year, month, 1)
+        except ValueError:
+            raise CommandError('--month 格式需為 YYYY-MM')
+        return year, month
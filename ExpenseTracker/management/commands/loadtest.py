@@ -0,0 +1,387 @@
+import asyncio
+import contextvars
+import io
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from django.utils import timezone
+
+from ExpenseTracker.batch import save_expense_batch
+from ExpenseTracker.models import Expense, ExpenseCategory, Participant
+
+
+DEFAULT_MIX = 'expense_list=40,expense_create=10,dashboard_api=30,settlement=20'
+PERIODS = ('day', 'week', 'month', 'all')
+SORTS = ('-date', 'date', '-amount', 'amount', 'category__name')
+ITEM_PREFIX = 'loadtest-'
+
+# 目前請求的查詢計數；在 sync_to_async 的執行緒中也會沿用同一個物件
+_query_count = contextvars.ContextVar('loadtest_query_count', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_counter(connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def percentile(values: 'list[float]', q: 'float') -> 'float':
+    """nearest-rank 百分位數，values 需已排序"""
+    if not values:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[index]
+
+
+class Scenario:
+    """產生各種請求；每個 worker 各自持有 CSRF cookie"""
+
+    def __init__(self, rng: 'random.Random'):
+        self.rng = rng
+        self.categories = list(ExpenseCategory.objects.values_list('pk', flat=True))
+        self.participants = list(Participant.objects.filter(is_active=True).values_list('pk', flat=True))
+        names = Expense.objects.order_by('?').values_list('item_name', flat=True)[:50]
+        self.keywords = sorted({name[:2] for name in names if name}) or ['a']
+        self.list_url = reverse('expense_tracker:expense_list')
+        self.create_url = reverse('expense_tracker:expense_create')
+        self.dashboard_api_url = reverse('expense_tracker:dashboard_api')
+        self.settlement_url = reverse('expense_tracker:settlement')
+
+    def build(self, name: 'str') -> 'tuple[str, str, dict]':
+        """回傳 (method, path?query, form)"""
+        rng = self.rng
+        if name == 'expense_list':
+            params = {'page': rng.randint(1, 5), 'sort_by': rng.choice(SORTS)}
+            if rng.random() < 0.3:
+                params['keyword'] = rng.choice(self.keywords)
+            if self.categories and rng.random() < 0.3:
+                params['category'] = rng.choice(self.categories)
+            if rng.random() < 0.3:
+                params['start_date'] = (date.today() - timedelta(days=rng.randint(7, 365))).isoformat()
+            return 'GET', f'{self.list_url}?{urlencode(params)}', {}
+        if name == 'expense_create':
+            form = {
+                'date': date.today().isoformat(),
+                'time': timezone.localtime().strftime('%H:%M'),
+                'item_name': f'{ITEM_PREFIX}{rng.randint(1, 10 ** 6)}',
+                'category': rng.choice(self.categories) if self.categories else '',
+                'amount': f'{rng.uniform(10, 2000):.2f}',
+                'note': '',
+                'paid_by': rng.choice(self.participants) if self.participants else '',
+                'split_participants': rng.sample(self.participants, min(len(self.participants), 3)),
+            }
+            return 'POST', self.create_url, form
+        if name == 'dashboard_api':
+            return 'GET', f'{self.dashboard_api_url}?period={rng.choice(PERIODS)}', {}
+        if name == 'settlement':
+            return 'GET', self.settlement_url, {}
+        raise CommandError(f'未知的請求類型：{name}')
+
+
+def encode_form(form: 'dict') -> 'bytes':
+    pairs = []
+    for key, value in form.items():
+        for item in (value if isinstance(value, list) else [value]):
+            pairs.append((key, item))
+    return urlencode(pairs).encode()
+
+
+class Command(BaseCommand):
+    help = '以 WSGI/ASGI 應用程式對記帳系統做壓力測試，輸出吞吐量、延遲百分位、錯誤率與每請求查詢數'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=500, help='總請求數（不含暖機）')
+        parser.add_argument('--warmup', type=int, default=20, help='暖機請求數，不計入結果')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='請求比例，如 expense_list=40,settlement=20')
+        parser.add_argument('--seed', type=int, default=0, help='記帳少於此數時先以批次 API 補足測試資料')
+        parser.add_argument('--random-seed', type=int, default=1)
+        parser.add_argument('--output', help='JSON 結果輸出路徑')
+        parser.add_argument('--keep', action='store_true', help='保留壓測期間新增的記帳')
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options['mix'])
+        if options['seed']:
+            self._seed(options['seed'], random.Random(options['random_seed']))
+
+        connection_created.connect(install_counter)
+        for conn in connections.all():
+            install_counter(conn)
+
+        rng = random.Random(options['random_seed'])
+        names, weights = zip(*mix.items())
+        plan = rng.choices(names, weights=weights, k=options['warmup'] + options['requests'])
+        warmup, plan = plan[:options['warmup']], plan[options['warmup']:]
+
+        try:
+            runner = self._run_wsgi if options['server'] == 'wsgi' else self._run_asgi
+            runner(warmup, options['concurrency'], options['random_seed'])
+            started = time.perf_counter()
+            samples = runner(plan, options['concurrency'], options['random_seed'] + 1)
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(install_counter)
+            if not options['keep']:
+                Expense.objects.filter(item_name__startswith=ITEM_PREFIX).delete()
+
+        report = self._report(samples, elapsed, options, mix)
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"已寫入 {options['output']}"))
+
+    def _parse_mix(self, text: 'str') -> 'dict[str, int]':
+        mix = {}
+        for part in text.split(','):
+            name, _, weight = part.partition('=')
+            try:
+                mix[name.strip()] = int(weight)
+            except ValueError:
+                raise CommandError(f'--mix 格式錯誤：{part}')
+        unknown = set(mix) - {'expense_list', 'expense_create', 'dashboard_api', 'settlement'}
+        if unknown:
+            raise CommandError(f"未知的請求類型：{', '.join(sorted(unknown))}")
+        return mix
+
+    def _seed(self, target: 'int', rng: 'random.Random'):
+        """以批次 API 補足記帳，讓 signal、分攤與異動紀錄都與實際寫入一致"""
+        if not ExpenseCategory.objects.exists():
+            ExpenseCategory.objects.bulk_create(
+                ExpenseCategory(name=name) for name in ('餐飲', '交通', '娛樂', '購物', '居家', '醫療')
+            )
+        if not Participant.objects.filter(is_active=True).exists():
+            for name in ('A', 'B', 'C', 'D'):
+                Participant.objects.create(name=name)
+        categories = list(ExpenseCategory.objects.values_list('pk', flat=True))
+        participants = list(Participant.objects.filter(is_active=True).values_list('pk', flat=True))
+        missing = target - Expense.objects.count()
+        while missing > 0:
+            size = min(missing, 2000)
+            items = [
+                {
+                    'date': (date.today() - timedelta(days=rng.randint(0, 365))).isoformat(),
+                    'item_name': rng.choice(['午餐', '晚餐', '計程車', '捷運', '電影', '超市', '房租', '藥局']),
+                    'category': rng.choice(categories),
+                    'amount': f'{rng.uniform(10, 3000):.2f}',
+                    'paid_by': rng.choice(participants),
+                    'split_participants': rng.sample(participants, rng.randint(1, len(participants))),
+                }
+                for _ in range(size)
+            ]
+            saved, _ = save_expense_batch(items)
+            if not saved:
+                raise CommandError('測試資料寫入失敗')
+            missing -= size
+        self.stdout.write(f'測試資料：{Expense.objects.count()} 筆記帳')
+
+    # WSGI：每個 worker 一條執行緒、各自的資料庫連線
+    def _run_wsgi(self, plan, concurrency, seed):
+        application = get_wsgi_application()
+        chunks = [plan[i::concurrency] for i in range(concurrency)]
+
+        def worker(index):
+            scenario = Scenario(random.Random(seed * 1000 + index))
+            cookies = {}
+            samples = []
+            try:
+                for name in chunks[index]:
+                    samples.append(self._wsgi_request(application, scenario, name, cookies))
+            finally:
+                connection.close()
+            return samples
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return [sample for samples in pool.map(worker, range(concurrency)) for sample in samples]
+
+    def _wsgi_request(self, application, scenario, name, cookies):
+        method, path, form = scenario.build(name)
+        if method == 'POST' and 'csrftoken' not in cookies:
+            # 先取得 CSRF cookie，不計入結果
+            self._wsgi_call(application, 'GET', scenario.create_url, b'', cookies)
+        if method == 'POST':
+            form['csrfmiddlewaretoken'] = cookies.get('csrftoken', '')
+        body = encode_form(form) if method == 'POST' else b''
+        return (name, *self._wsgi_call(application, method, path, body, cookies))
+
+    def _wsgi_call(self, application, method, path, body, cookies):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver', 'HTTP_ACCEPT_ENCODING': 'gzip',
+            'HTTP_COOKIE': '; '.join(f'{k}={v}' for k, v in cookies.items()),
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded', 'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        status_holder = {}
+
+        def start_response(status, headers, exc_info=None):
+            status_holder['status'] = int(status.split()[0])
+            for key, value in headers:
+                if key.lower() == 'set-cookie':
+                    for morsel in SimpleCookie(value).values():
+                        cookies[morsel.key] = morsel.value
+
+        counter = [0]
+        context = contextvars.copy_context()
+        context.run(_query_count.set, counter)
+        started = time.perf_counter()
+        try:
+            response = context.run(application, environ, start_response)
+            size = sum(len(chunk) for chunk in response)
+            if hasattr(response, 'close'):
+                response.close()
+            status = status_holder.get('status', 500)
+        except Exception:
+            size, status = 0, 599
+        return status, time.perf_counter() - started, counter[0], size
+
+    # ASGI：單一事件迴圈上 concurrency 個協程，view 經由 sync_to_async 執行
+    def _run_asgi(self, plan, concurrency, seed):
+        application = get_asgi_application()
+        chunks = [plan[i::concurrency] for i in range(concurrency)]
+
+        async def worker(index):
+            scenario = await sync_to_async(Scenario)(random.Random(seed * 1000 + index))
+            cookies = {}
+            samples = []
+            for name in chunks[index]:
+                samples.append(await self._asgi_request(application, scenario, name, cookies))
+            return samples
+
+        async def run():
+            results = await asyncio.gather(*(worker(index) for index in range(concurrency)))
+            return [sample for samples in results for sample in samples]
+
+        return asyncio.run(run())
+
+    async def _asgi_request(self, application, scenario, name, cookies):
+        method, path, form = scenario.build(name)
+        if method == 'POST' and 'csrftoken' not in cookies:
+            await self._asgi_call(application, 'GET', scenario.create_url, b'', cookies)
+        if method == 'POST':
+            form['csrfmiddlewaretoken'] = cookies.get('csrftoken', '')
+        body = encode_form(form) if method == 'POST' else b''
+        return (name, *await self._asgi_call(application, method, path, body, cookies))
+
+    async def _asgi_call(self, application, method, path, body, cookies):
+        path, _, query = path.partition('?')
+        headers = [
+            (b'host', b'testserver'), (b'accept-encoding', b'gzip'),
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(body)).encode()),
+        ]
+        if cookies:
+            headers.append((b'cookie', '; '.join(f'{k}={v}' for k, v in cookies.items()).encode()))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'headers': headers, 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        }
+        sent = False
+        result = {'status': 599, 'size': 0}
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # 用戶端不中斷連線，直到回應結束被取消
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                result['status'] = message['status']
+                for key, value in message.get('headers', []):
+                    if key.lower() == b'set-cookie':
+                        for morsel in SimpleCookie(value.decode()).values():
+                            cookies[morsel.key] = morsel.value
+            elif message['type'] == 'http.response.body':
+                result['size'] += len(message.get('body', b''))
+
+        counter = [0]
+        token = _query_count.set(counter)
+        started = time.perf_counter()
+        try:
+            await application(scope, receive, send)
+        except Exception:
+            result['status'] = 599
+        finally:
+            _query_count.reset(token)
+        return result['status'], time.perf_counter() - started, counter[0], result['size']
+
+    def _report(self, samples, elapsed, options, mix) -> 'dict':
+        groups = defaultdict(list)
+        for sample in samples:
+            groups[sample[0]].append(sample)
+        groups['total'] = list(samples)
+
+        endpoints = {}
+        for name, group in sorted(groups.items()):
+            latencies = sorted(sample[2] * 1000 for sample in group)
+            # 新增成功會 302 轉址，其餘以 2xx/3xx 為成功
+            errors = sum(1 for sample in group if sample[1] >= 400)
+            endpoints[name] = {
+                'requests': len(group),
+                'errors': errors,
+                'error_rate': round(errors / len(group), 4) if group else 0,
+                'throughput_rps': round(len(group) / elapsed, 2) if elapsed else 0,
+                'latency_ms': {
+                    'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0,
+                    'p50': round(percentile(latencies, 50), 2),
+                    'p95': round(percentile(latencies, 95), 2),
+                    'p99': round(percentile(latencies, 99), 2),
+                    'max': round(latencies[-1], 2) if latencies else 0,
+                },
+                'queries_per_request': round(sum(sample[3] for sample in group) / len(group), 2) if group else 0,
+                'bytes_per_request': round(sum(sample[4] for sample in group) / len(group)) if group else 0,
+            }
+        return {
+            'started_at': timezone.now().isoformat(),
+            'server': options['server'],
+            'concurrency': options['concurrency'],
+            'mix': mix,
+            'duration_s': round(elapsed, 3),
+            'expenses': Expense.objects.count(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'endpoints': endpoints,
+        }
+
+    def _print(self, report: 'dict'):
+        self.stdout.write(
+            f"{report['server']} concurrency={report['concurrency']} "
+            f"{report['endpoints']['total']['requests']} requests in {report['duration_s']}s"
+        )
+        self.stdout.write(f"{'endpoint':<16}{'req':>6}{'err%':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>8}")
+        for name, stats in report['endpoints'].items():
+            latency = stats['latency_ms']
+            self.stdout.write(
+                f"{name:<16}{stats['requests']:>6}{stats['error_rate'] * 100:>6.1f}%{stats['throughput_rps']:>9.1f}"
+                f"{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}{stats['queries_per_request']:>8.1f}"
+            )
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from CoDevStudio.middleware.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = '產生請求分析用的 X-Profile-Token 標頭值'
+
+    def handle(self, *args, **options):
+        max_age = getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 60 * 60)
+        self.stderr.write(f'有效 {max_age} 秒，用法：curl -H "X-Profile-Token: <token>" <url>')
+        self.stdout.write(make_token())
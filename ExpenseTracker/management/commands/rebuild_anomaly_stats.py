@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ExpenseTracker.anomaly import rebuild_statistics, REBUILD_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = '依日期串流全部記帳，重建類型金額統計與異常記帳'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total}')
+
+        result = rebuild_statistics(chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：{result['expenses']} 筆記帳、{result['categories']} 個類型、{result['anomalies']} 筆異常"
+        ))
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ExpenseTracker.budgets import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = '以記帳重新彙總每月支出計數（預算使用量），修正累計誤差'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', action='append', help='YYYY-MM，只重建指定月份（可重複），預設全部')
+
+    def handle(self, *args, **options):
+        months = [self._parse_month(value) for value in options['month'] or []]
+        result = reconcile_counters(months or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：{result['counters']} 列計數，{result['changed']} 列與重建結果不同"
+        ))
+
+    def _parse_month(self, value):
+        try:
+            year, month = (int(part) for part in value.split('-'))
+            return date(year, month, 1)
+        except ValueError:
+            raise CommandError('--month 格式需為 YYYY-MM')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ExpenseTracker.search import reindex_expenses, BATCH_SIZE, BACKEND_PATH
+
+
+class Command(BaseCommand):
+    help = '依主鍵分批重建記帳搜尋索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total}')
+
+        indexed = reindex_expenses(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'完成：{indexed} 筆記帳已寫入 {BACKEND_PATH}'))
@@ -0,0 +1,96 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ExpenseTracker import cache as data_cache
+from ExpenseTracker.jobs import work, requeue_stale_jobs, default_worker_id
+
+
+def _process_main(worker_id, poll_interval, once):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    work(worker_id, stop_event, poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = '執行背景工作 worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='worker 數量')
+        parser.add_argument(
+            '--mode', choices=['thread', 'process'], default='thread',
+            help='以執行緒或行程執行 worker',
+        )
+        parser.add_argument('--poll-interval', type=float, default=None, help='無工作時的輪詢間隔（秒）')
+        parser.add_argument('--once', action='store_true', help='佇列清空後即結束')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        mode = options['mode']
+        poll_interval = options['poll_interval']
+        once = options['once']
+        try:
+            data_cache.require_shared_cache('背景工作')
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'已重新排入 {requeued} 筆失聯工作')
+
+        self.stdout.write(f'啟動 {workers} 個 {mode} worker')
+        if mode == 'process':
+            self._run_processes(workers, poll_interval, once)
+        else:
+            self._run_threads(workers, poll_interval, once)
+
+    def _run_threads(self, workers, poll_interval, once):
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=work,
+                args=(f'{default_worker_id()}-{i}', stop_event),
+                kwargs={'poll_interval': poll_interval, 'once': once},
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('停止中，等待執行中的工作完成...')
+            stop_event.set()
+            for t in threads:
+                t.join()
+
+    def _run_processes(self, workers, poll_interval, once):
+        # fork 前關閉連線，避免子行程共用同一個資料庫連線
+        connections.close_all()
+        ctx = multiprocessing.get_context('fork')
+        processes = [
+            ctx.Process(
+                target=_process_main,
+                args=(f'{default_worker_id()}-p{i}', poll_interval, once),
+            )
+            for i in range(workers)
+        ]
+        for p in processes:
+            p.start()
+        try:
+            for p in processes:
+                p.join()
+        except KeyboardInterrupt:
+            self.stdout.write('停止中，等待執行中的工作完成...')
+            for p in processes:
+                p.terminate()
+            for p in processes:
+                p.join()
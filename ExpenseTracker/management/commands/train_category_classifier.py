@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ExpenseTracker.classifier import train_classifier, MODEL_PATH
+
+
+class Command(BaseCommand):
+    help = '以歷史記帳的品項名稱訓練類型分類器，回報準確率與單筆推論延遲'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help='只重新學習上次訓練之後新增、修改或刪除的記帳')
+        parser.add_argument('--path', default=MODEL_PATH)
+
+    def handle(self, *args, **options):
+        model = train_classifier(incremental=options['incremental'], path=options['path'])
+        metrics = model.metrics
+        self.stdout.write(f"樣本數：{metrics['samples']}，類型數：{len(model.class_counts)}")
+        if metrics.get('accuracy') is not None:
+            self.stdout.write(
+                f"驗證集 {metrics['holdout']} 筆：準確率 {metrics['accuracy']:.1%}，"
+                f"單筆推論 {metrics['latency_us']:.1f} µs"
+            )
+        self.stdout.write(self.style.SUCCESS(f"已存檔：{options['path']}"))
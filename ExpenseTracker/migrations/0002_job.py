@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=100, verbose_name='工作名稱')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='參數')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '執行中'), ('succeeded', '已完成'), ('failed', '失敗')], default='pending', max_length=20, verbose_name='狀態')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='進度')),
+                ('progress_message', models.CharField(blank=True, max_length=200, verbose_name='進度說明')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='結果')),
+                ('error', models.TextField(blank=True, verbose_name='錯誤訊息')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='已執行次數')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='最大執行次數')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='排定時間')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='執行者')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成時間')),
+            ],
+            options={
+                'verbose_name': '背景工作',
+                'verbose_name_plural': '背景工作',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='expense_job_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_change_log(apps, schema_editor):
+    """既有資料補寫一筆 upsert，客戶端從游標 0 同步時才拿得到完整資料"""
+    ChangeLogEntry = apps.get_model('ExpenseTracker', 'ChangeLogEntry')
+    sources = [
+        ('category', apps.get_model('ExpenseTracker', 'ExpenseCategory')),
+        ('participant', apps.get_model('ExpenseTracker', 'Participant')),
+        ('expense', apps.get_model('ExpenseTracker', 'Expense')),
+        ('expense_split', apps.get_model('ExpenseTracker', 'ExpenseSplit')),
+    ]
+    for model_name, model in sources:
+        batch = []
+        for pk in model.objects.order_by('pk').values_list('pk', flat=True).iterator():
+            batch.append(ChangeLogEntry(model=model_name, object_id=pk, action='upsert'))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                ChangeLogEntry.objects.bulk_create(batch)
+                batch = []
+        ChangeLogEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0002_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=50, verbose_name='資料類型')),
+                ('object_id', models.BigIntegerField(verbose_name='資料 ID')),
+                ('action', models.CharField(choices=[('upsert', '新增/更新'), ('delete', '刪除')], max_length=10, verbose_name='動作')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='異動時間')),
+            ],
+            options={
+                'verbose_name': '異動紀錄',
+                'verbose_name_plural': '異動紀錄',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['model', 'object_id'], name='expense_changelog_obj_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0003_changelogentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryAmountStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='筆數')),
+                ('mean', models.FloatField(default=0, verbose_name='平均')),
+                ('m2', models.FloatField(default=0, verbose_name='離差平方和')),
+                ('sketch', models.JSONField(blank=True, default=dict, verbose_name='分位數 sketch')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('category', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='amount_stats', to='ExpenseTracker.expensecategory', verbose_name='類型')),
+            ],
+            options={
+                'verbose_name': '類型金額統計',
+                'verbose_name_plural': '類型金額統計',
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpenseAnomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('z_score', models.FloatField(verbose_name='標準分數')),
+                ('percentile', models.FloatField(verbose_name='百分位')),
+                ('reason', models.CharField(max_length=200, verbose_name='原因')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='偵測時間')),
+                ('expense', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='anomaly', to='ExpenseTracker.expense', verbose_name='記帳')),
+            ],
+            options={
+                'verbose_name': '異常記帳',
+                'verbose_name_plural': '異常記帳',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0004_anomaly_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='檔案路徑')),
+                ('year', models.PositiveIntegerField(db_index=True, verbose_name='年度')),
+                ('first_date', models.DateField(verbose_name='起始日期')),
+                ('last_date', models.DateField(verbose_name='結束日期')),
+                ('expense_count', models.PositiveIntegerField(verbose_name='記帳筆數')),
+                ('split_count', models.PositiveIntegerField(verbose_name='分攤筆數')),
+                ('size', models.BigIntegerField(verbose_name='檔案大小')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='封存時間')),
+            ],
+            options={
+                'verbose_name': '封存區段',
+                'verbose_name_plural': '封存區段',
+                'ordering': ['first_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='已付金額')),
+                ('owed', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='應分攤金額')),
+                ('participant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archived_balance', to='ExpenseTracker.participant', verbose_name='參與者')),
+            ],
+            options={
+                'verbose_name': '封存收支彙總',
+                'verbose_name_plural': '封存收支彙總',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='金額')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='筆數')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_rollups', to='ExpenseTracker.expensecategory', verbose_name='類型')),
+            ],
+            options={
+                'verbose_name': '封存每日彙總',
+                'verbose_name_plural': '封存每日彙總',
+                'indexes': [models.Index(fields=['date', 'category'], name='expense_archive_rollup_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0005_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='序列名稱')),
+                ('next_hi', models.BigIntegerField(default=0, verbose_name='下一段編號')),
+            ],
+            options={
+                'verbose_name': '分片主鍵序列',
+                'verbose_name_plural': '分片主鍵序列',
+            },
+        ),
+    ]
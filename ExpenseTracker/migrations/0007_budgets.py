@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:07
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0006_shard_id_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Budget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))], verbose_name='每月上限')),
+                ('is_active', models.BooleanField(default=True, verbose_name='啟用中')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('category', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='budget', to='ExpenseTracker.expensecategory', verbose_name='類型')),
+                ('participant', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='budget', to='ExpenseTracker.participant', verbose_name='參與者')),
+            ],
+            options={
+                'verbose_name': '預算',
+                'verbose_name_plural': '預算',
+            },
+        ),
+        migrations.CreateModel(
+            name='BudgetAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(verbose_name='月份')),
+                ('threshold', models.PositiveSmallIntegerField(verbose_name='門檻（%）')),
+                ('spent', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='觸發時金額')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='觸發時間')),
+                ('notified_at', models.DateTimeField(blank=True, null=True, verbose_name='通知時間')),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='ExpenseTracker.budget', verbose_name='預算')),
+            ],
+            options={
+                'verbose_name': '預算警示',
+                'verbose_name_plural': '預算警示',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SpendingCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('category', '類型'), ('participant', '參與者')], max_length=20, verbose_name='範圍')),
+                ('object_id', models.BigIntegerField(verbose_name='類型或參與者 ID')),
+                ('period', models.DateField(verbose_name='月份')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='金額')),
+                ('count', models.IntegerField(default=0, verbose_name='筆數')),
+            ],
+            options={
+                'verbose_name': '每月支出計數',
+                'verbose_name_plural': '每月支出計數',
+                'constraints': [models.UniqueConstraint(fields=('scope', 'object_id', 'period'), name='expense_spending_counter_uniq')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='budget',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('category__isnull', False), ('participant__isnull', True)), models.Q(('category__isnull', True), ('participant__isnull', False)), _connector='OR'), name='expense_budget_single_scope'),
+        ),
+        migrations.AddIndex(
+            model_name='budgetalert',
+            index=models.Index(fields=['notified_at'], name='expense_budget_alert_sent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='budgetalert',
+            constraint=models.UniqueConstraint(fields=('budget', 'period', 'threshold'), name='expense_budget_alert_uniq'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0007_budgets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.EmailField(max_length=254, verbose_name='收件人')),
+                ('kind', models.CharField(max_length=30, verbose_name='類型')),
+                ('subject', models.CharField(max_length=200, verbose_name='主旨')),
+                ('body', models.TextField(verbose_name='內容')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('sending', '寄送中'), ('sent', '已寄出'), ('failed', '失敗')], default='pending', max_length=20, verbose_name='狀態')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='已寄送次數')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='下次寄送時間')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='寄送者')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='取出時間')),
+                ('last_error', models.TextField(blank=True, verbose_name='錯誤訊息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='寄出時間')),
+            ],
+            options={
+                'verbose_name': '待寄通知',
+                'verbose_name_plural': '待寄通知',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='expense_outbox_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+
+CENT = Decimal('0.01')
+
+
+def _allocate(total_cents: 'int', shares: 'list[Decimal]') -> 'list[int]':
+    """依原分攤比例以最大餘數法分配 total_cents，總和必定等於 total_cents"""
+    total_share = sum(shares)
+    if total_share <= 0:
+        base, remainder = divmod(total_cents, len(shares))
+        return [base + (1 if i < remainder else 0) for i in range(len(shares))]
+    exact = [share / total_share * total_cents for share in shares]
+    allocated = [int(value) for value in exact]
+    order = sorted(range(len(shares)), key=lambda i: (-(exact[i] - allocated[i]), i))
+    for i in order[:total_cents - sum(allocated)]:
+        allocated[i] += 1
+    return allocated
+
+
+def round_legacy_splits(apps, schema_editor):
+    """
+    早期寫入的分攤有未取整到分的金額（如 3.33333333333333），SQLite 以浮點數保存
+    逐列取整與 GROUP BY 加總的結果會差一分，這裡把這些記帳的分攤改為整分：
+    每筆記帳的分攤總和取整到分後依原比例分配，總和不變，並寫入異動紀錄
+    """
+    ExpenseSplit = apps.get_model('ExpenseTracker', 'ExpenseSplit')
+    ChangeLogEntry = apps.get_model('ExpenseTracker', 'ChangeLogEntry')
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(ExpenseSplit._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT DISTINCT expense_id FROM {table} WHERE share_amount <> ROUND(share_amount, 2)'
+        )
+        expense_ids = [row[0] for row in cursor.fetchall()]
+    if not expense_ids:
+        return
+
+    updated = []
+    for expense_id in expense_ids:
+        with connection.cursor() as cursor:
+            # 讀原始值，ORM 讀取 DecimalField 時已先取整到分
+            cursor.execute(f'SELECT id, share_amount FROM {table} WHERE expense_id = %s ORDER BY id', [expense_id])
+            rows = [(pk, Decimal(str(value))) for pk, value in cursor.fetchall()]
+        shares = [share for _, share in rows]
+        total_cents = int(sum(shares).quantize(CENT) * 100)
+        for (pk, _), cents in zip(rows, _allocate(total_cents, shares)):
+            updated.append(ExpenseSplit(pk=pk, share_amount=Decimal(cents).scaleb(-2)))
+    ExpenseSplit.objects.bulk_update(updated, ['share_amount'], batch_size=500)
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model='expense_split', object_id=split.pk, action='upsert') for split in updated
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0008_outbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(round_legacy_splits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ExpenseTracker', '0010_job_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ShardIdSequence',
+        ),
+    ]
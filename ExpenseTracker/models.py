@@ -67,9 +67,25 @@ class Expense(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
 
+    # 預算計數在更新時要扣回的欄位，載入時記下，save() 不必再查一次舊值
+    SPENDING_FIELDS = ('date', 'category_id', 'paid_by_id', 'amount')
+
     def __str__(self):
         return f"{self.date} - {self.item_name} ({self.amount})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields() & set(cls.SPENDING_FIELDS):
+            instance._loaded_spending = tuple(getattr(instance, name) for name in cls.SPENDING_FIELDS)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # 重新讀取後載入時記下的值可能已過期，下次儲存改回資料庫讀取
+        if fields is None or set(fields) & {*self.SPENDING_FIELDS, 'category', 'paid_by'}:
+            self.__dict__.pop('_loaded_spending', None)
+
     class Meta:
         verbose_name = "記帳紀錄"
         verbose_name_plural = "記帳紀錄"
@@ -104,3 +120,341 @@ class ExpenseSplit(models.Model):
         verbose_name = "費用分攤"
         verbose_name_plural = "費用分攤"
         unique_together = ['expense', 'participant']
+
+
+class Job(models.Model):
+    """背景工作"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '等待中'),
+        (STATUS_RUNNING, '執行中'),
+        (STATUS_SUCCEEDED, '已完成'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    task = models.CharField(max_length=100, verbose_name="工作名稱")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="參數")
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="狀態"
+    )
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="進度")
+    progress_message = models.CharField(max_length=200, blank=True, verbose_name="進度說明")
+    result = models.JSONField(null=True, blank=True, verbose_name="結果")
+    error = models.TextField(blank=True, verbose_name="錯誤訊息")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="已執行次數")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="最大執行次數")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="排定時間")
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name="執行者")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始時間")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="最後心跳")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完成時間")
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    class Meta:
+        verbose_name = "背景工作"
+        verbose_name_plural = "背景工作"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='expense_job_status_idx'),
+        ]
+
+
+class ChangeLogEntry(models.Model):
+    """
+    資料異動紀錄
+    自動遞增的 id 即為同步游標，刪除時留下 tombstone
+    """
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_UPSERT, '新增/更新'),
+        (ACTION_DELETE, '刪除'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=50, verbose_name="資料類型")
+    object_id = models.BigIntegerField(verbose_name="資料 ID")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="動作")
+    changed_at = models.DateTimeField(auto_now_add=True, verbose_name="異動時間")
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model}:{self.object_id}"
+
+    class Meta:
+        verbose_name = "異動紀錄"
+        verbose_name_plural = "異動紀錄"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['model', 'object_id'], name='expense_changelog_obj_idx'),
+        ]
+
+
+class CategoryAmountStats(models.Model):
+    """各類型金額的線上統計（Welford 平均/變異數 + 分位數 sketch）"""
+    category = models.OneToOneField(
+        ExpenseCategory,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='amount_stats',
+        verbose_name="類型"
+    )
+    count = models.PositiveIntegerField(default=0, verbose_name="筆數")
+    mean = models.FloatField(default=0, verbose_name="平均")
+    m2 = models.FloatField(default=0, verbose_name="離差平方和")
+    sketch = models.JSONField(default=dict, blank=True, verbose_name="分位數 sketch")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    def __str__(self):
+        return f"{self.category or '未分類'} (n={self.count})"
+
+    class Meta:
+        verbose_name = "類型金額統計"
+        verbose_name_plural = "類型金額統計"
+
+
+class ExpenseAnomaly(models.Model):
+    """異常記帳"""
+    expense = models.OneToOneField(
+        Expense,
+        on_delete=models.CASCADE,
+        related_name='anomaly',
+        verbose_name="記帳"
+    )
+    z_score = models.FloatField(verbose_name="標準分數")
+    percentile = models.FloatField(verbose_name="百分位")
+    reason = models.CharField(max_length=200, verbose_name="原因")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="偵測時間")
+
+    def __str__(self):
+        return f"{self.expense} - {self.reason}"
+
+    class Meta:
+        verbose_name = "異常記帳"
+        verbose_name_plural = "異常記帳"
+        ordering = ['-created_at']
+
+
+class ArchiveSegment(models.Model):
+    """已封存至冷儲存的記帳區段"""
+    path = models.CharField(max_length=500, unique=True, verbose_name="檔案路徑")
+    year = models.PositiveIntegerField(db_index=True, verbose_name="年度")
+    first_date = models.DateField(verbose_name="起始日期")
+    last_date = models.DateField(verbose_name="結束日期")
+    expense_count = models.PositiveIntegerField(verbose_name="記帳筆數")
+    split_count = models.PositiveIntegerField(verbose_name="分攤筆數")
+    size = models.BigIntegerField(verbose_name="檔案大小")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="封存時間")
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name = "封存區段"
+        verbose_name_plural = "封存區段"
+        ordering = ['first_date']
+
+
+class ArchivedDailyRollup(models.Model):
+    """封存記帳的每日各類型彙總，供統計使用"""
+    date = models.DateField(verbose_name="日期")
+    category = models.ForeignKey(
+        ExpenseCategory,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='archived_rollups',
+        verbose_name="類型"
+    )
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="金額")
+    count = models.PositiveIntegerField(default=0, verbose_name="筆數")
+
+    def __str__(self):
+        return f"{self.date} {self.category or '未分類'} ({self.total})"
+
+    class Meta:
+        verbose_name = "封存每日彙總"
+        verbose_name_plural = "封存每日彙總"
+        indexes = [
+            models.Index(fields=['date', 'category'], name='expense_archive_rollup_idx'),
+        ]
+
+
+class ArchivedBalance(models.Model):
+    """封存記帳的參與者收支彙總，供結算使用"""
+    participant = models.OneToOneField(
+        Participant,
+        on_delete=models.CASCADE,
+        related_name='archived_balance',
+        verbose_name="參與者"
+    )
+    paid = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="已付金額")
+    owed = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="應分攤金額")
+
+    def __str__(self):
+        return f"{self.participant.name} ({self.paid} / {self.owed})"
+
+    class Meta:
+        verbose_name = "封存收支彙總"
+        verbose_name_plural = "封存收支彙總"
+
+
+class Budget(models.Model):
+    """每月預算，類型與參與者（付款人）擇一"""
+    category = models.OneToOneField(
+        ExpenseCategory,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='budget',
+        verbose_name="類型"
+    )
+    participant = models.OneToOneField(
+        Participant,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='budget',
+        verbose_name="參與者"
+    )
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.01'))],
+        verbose_name="每月上限"
+    )
+    is_active = models.BooleanField(default=True, verbose_name="啟用中")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    def __str__(self):
+        return f"{self.category or self.participant} 每月 {self.amount}"
+
+    class Meta:
+        verbose_name = "預算"
+        verbose_name_plural = "預算"
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(category__isnull=False, participant__isnull=True)
+                    | models.Q(category__isnull=True, participant__isnull=False)
+                ),
+                name='expense_budget_single_scope',
+            ),
+        ]
+
+
+class SpendingCounter(models.Model):
+    """
+    每月支出的累計計數
+    記帳寫入時在同一個交易內以 F() 增減，預算檢查只讀寫對應的計數列，不需 SUM 整個月份
+    """
+    SCOPE_CATEGORY = 'category'
+    SCOPE_PARTICIPANT = 'participant'
+    SCOPE_CHOICES = [
+        (SCOPE_CATEGORY, '類型'),
+        (SCOPE_PARTICIPANT, '參與者'),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES, verbose_name="範圍")
+    object_id = models.BigIntegerField(verbose_name="類型或參與者 ID")
+    period = models.DateField(verbose_name="月份")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="金額")
+    count = models.IntegerField(default=0, verbose_name="筆數")
+
+    def __str__(self):
+        return f"{self.scope}:{self.object_id} {self.period:%Y-%m} ({self.total})"
+
+    class Meta:
+        verbose_name = "每月支出計數"
+        verbose_name_plural = "每月支出計數"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id', 'period'], name='expense_spending_counter_uniq'),
+        ]
+
+
+class BudgetAlert(models.Model):
+    """預算警示；寫入時排入佇列，由背景工作寄出"""
+    budget = models.ForeignKey(
+        Budget,
+        on_delete=models.CASCADE,
+        related_name='alerts',
+        verbose_name="預算"
+    )
+    period = models.DateField(verbose_name="月份")
+    threshold = models.PositiveSmallIntegerField(verbose_name="門檻（%）")
+    spent = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="觸發時金額")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="觸發時間")
+    notified_at = models.DateTimeField(null=True, blank=True, verbose_name="通知時間")
+
+    def __str__(self):
+        return f"{self.budget} {self.period:%Y-%m} {self.threshold}%"
+
+    class Meta:
+        verbose_name = "預算警示"
+        verbose_name_plural = "預算警示"
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['budget', 'period', 'threshold'], name='expense_budget_alert_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['notified_at'], name='expense_budget_alert_sent_idx'),
+        ]
+
+
+class OutboxMessage(models.Model):
+    """
+    待寄出的通知（transactional outbox）
+    與記帳異動在同一個交易內寫入，由背景工作依收件人合併成摘要郵件後寄出
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '等待中'),
+        (STATUS_SENDING, '寄送中'),
+        (STATUS_SENT, '已寄出'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    recipient = models.EmailField(verbose_name="收件人")
+    kind = models.CharField(max_length=30, verbose_name="類型")
+    subject = models.CharField(max_length=200, verbose_name="主旨")
+    body = models.TextField(verbose_name="內容")
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="狀態"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="已寄送次數")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="下次寄送時間")
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name="寄送者")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="取出時間")
+    last_error = models.TextField(blank=True, verbose_name="錯誤訊息")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="寄出時間")
+
+    def __str__(self):
+        return f"{self.recipient} {self.subject} ({self.status})"
+
+    class Meta:
+        verbose_name = "待寄通知"
+        verbose_name_plural = "待寄通知"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='expense_outbox_status_idx'),
+        ]
@@ -0,0 +1,265 @@
+"""
+通知 outbox
+寫入端只在目前的交易內新增 OutboxMessage（一次 bulk_create），交易回滾時通知一併取消，請求不連 SMTP
+背景工作 dispatch_outbox 在 OUTBOX_DIGEST_DELAY 秒後執行，同一收件人累積的多則通知合併成一封摘要，
+每批共用一條郵件連線；寄送失敗的通知依次數延後重試，超過 OUTBOX_MAX_ATTEMPTS 次標記失敗
+"""
+import uuid
+from collections import defaultdict
+from contextlib import suppress
+from datetime import timedelta
+from smtplib import SMTPException, SMTPRecipientsRefused
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Min
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Job, OutboxMessage, Participant
+
+
+DIGEST_DELAY = getattr(settings, 'OUTBOX_DIGEST_DELAY', 60)
+BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BACKOFF = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 60)
+STALE_AFTER = getattr(settings, 'OUTBOX_STALE_AFTER', 60 * 10)
+EXPENSE_NOTIFICATIONS = getattr(settings, 'EXPENSE_CHANGE_NOTIFICATIONS', True)
+DEFAULT_FROM_EMAIL = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+DISPATCH_TASK = 'dispatch_outbox'
+
+KIND_EXPENSE = 'expense'
+KIND_BUDGET = 'budget'
+
+
+def add(messages) -> 'list[OutboxMessage]':
+    """
+    寫入待寄通知，需在資料異動的交易內呼叫
+    messages: [(收件人, 類型, 主旨, 內容), ...]；沒有收件人的略過
+    """
+    rows = [
+        OutboxMessage(recipient=recipient, kind=kind, subject=subject[:200], body=body)
+        for recipient, kind, subject, body in messages
+        if recipient
+    ]
+    if not rows:
+        return []
+    OutboxMessage.objects.bulk_create(rows)
+    schedule_dispatch(timezone.now() + timedelta(seconds=DIGEST_DELAY))
+    return rows
+
+
+def schedule_dispatch(run_after=None):
+    """
+    確保 run_after 之前有一個等待中的寄送工作；已排入的工作較晚執行時提前，會一併寄出之後寫入的通知
+    檢查與排入之間其他行程可能也排入一個，這裡不加鎖而容許重複：claim_batch 以帶條件的 UPDATE 搶占，
+    重複的寄送工作不會重複寄信，多出來的那個取不到通知就結束
+    """
+    run_after = run_after or timezone.now()
+    pending = Job.objects.filter(task=DISPATCH_TASK, status=Job.STATUS_PENDING)
+    if pending.filter(run_after__lte=run_after).exists():
+        return
+    # 例如重試排在數分鐘後的工作，不讓新通知跟著等
+    if not pending.update(run_after=run_after):
+        enqueue(DISPATCH_TASK, run_after=run_after)
+
+
+def requeue_stale_messages() -> 'int':
+    """把失聯的寄送工作取出後未完成的通知放回佇列"""
+    cutoff = timezone.now() - timedelta(seconds=STALE_AFTER)
+    return OutboxMessage.objects.filter(
+        status=OutboxMessage.STATUS_SENDING,
+        locked_at__lt=cutoff,
+    ).update(status=OutboxMessage.STATUS_PENDING, locked_by='', locked_at=None)
+
+
+def claim_batch(batch_size: 'int', worker_id: 'str') -> 'dict[str, list[OutboxMessage]]':
+    """
+    取出最多 batch_size 位收件人的所有到期通知，回傳 {收件人: [通知, ...]}
+    以帶條件的 UPDATE 搶占，多個寄送工作同時執行時同一則通知只會被取出一次
+    """
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING, next_attempt_at__lte=now)
+    recipients = list(
+        due.values_list('recipient', flat=True).order_by('recipient').distinct()[:batch_size]
+    )
+    if not recipients:
+        return {}
+    due.filter(recipient__in=recipients).update(
+        status=OutboxMessage.STATUS_SENDING,
+        locked_by=worker_id[:100],
+        locked_at=now,
+    )
+    groups = defaultdict(list)
+    for message in OutboxMessage.objects.filter(
+        status=OutboxMessage.STATUS_SENDING, locked_by=worker_id[:100],
+    ).order_by('pk'):
+        groups[message.recipient].append(message)
+    return groups
+
+
+def build_digest(recipient: 'str', messages: 'list[OutboxMessage]', connection=None) -> 'EmailMessage':
+    """單則通知照原主旨寄出，多則合併成一封摘要"""
+    if len(messages) == 1:
+        subject, body = messages[0].subject, messages[0].body
+    else:
+        subject = f'記帳通知：{len(messages)} 則更新'
+        body = '\n\n'.join(f'{message.subject}\n{message.body}' for message in messages)
+    return EmailMessage(
+        subject=subject,
+        body=body,
+        from_email=DEFAULT_FROM_EMAIL,
+        to=[recipient],
+        connection=connection,
+    )
+
+
+def _mark_sent(messages):
+    now = timezone.now()
+    for message in messages:
+        message.status = OutboxMessage.STATUS_SENT
+        message.attempts += 1
+        message.sent_at = now
+        message.locked_by = ''
+        message.last_error = ''
+    OutboxMessage.objects.bulk_update(messages, ['status', 'attempts', 'sent_at', 'locked_by', 'last_error'])
+
+
+def _mark_failed(messages, error: 'Exception') -> 'int':
+    """延後重試（RETRY_BACKOFF * 2^(n-1) 秒），次數用完時標記失敗；回傳標記失敗的則數"""
+    now = timezone.now()
+    failed = 0
+    for message in messages:
+        message.attempts += 1
+        message.locked_by = ''
+        message.last_error = f'{type(error).__name__}: {error}'[:1000]
+        if message.attempts >= MAX_ATTEMPTS:
+            message.status = OutboxMessage.STATUS_FAILED
+            failed += 1
+        else:
+            message.status = OutboxMessage.STATUS_PENDING
+            message.next_attempt_at = now + timedelta(seconds=RETRY_BACKOFF * 2 ** (message.attempts - 1))
+    OutboxMessage.objects.bulk_update(messages, ['status', 'attempts', 'next_attempt_at', 'locked_by', 'last_error'])
+    return failed
+
+
+def send_batch(groups: 'dict[str, list[OutboxMessage]]') -> 'dict':
+    """
+    以一條連線寄出一批摘要
+    收件人被拒只影響該收件人；其他錯誤視為連線中斷，這批剩下的通知一起延後
+    """
+    result = {'sent': 0, 'retry': 0, 'failed': 0}
+
+    def fail(messages, error):
+        failed = _mark_failed(messages, error)
+        result['failed'] += failed
+        result['retry'] += len(messages) - failed
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        fail([message for messages in groups.values() for message in messages], exc)
+        return result
+
+    delivered = []
+    try:
+        pending = list(groups.items())
+        for index, (recipient, messages) in enumerate(pending):
+            try:
+                connection.send_messages([build_digest(recipient, messages, connection)])
+            except SMTPRecipientsRefused as exc:
+                fail(messages, exc)
+            except Exception as exc:
+                fail([message for _, rest in pending[index:] for message in rest], exc)
+                break
+            else:
+                delivered.extend(messages)
+                result['sent'] += 1
+    finally:
+        with suppress(SMTPException, OSError):
+            connection.close()
+        if delivered:
+            _mark_sent(delivered)
+    return result
+
+
+def dispatch(batch_size: 'int' = BATCH_SIZE, worker_id: 'str' = None) -> 'dict':
+    """
+    寄出所有到期的通知；回傳寄出的郵件數、合併的通知則數與延後 / 失敗的則數
+    還有待重試的通知時排入下一次寄送工作
+    """
+    worker_id = worker_id or f'outbox:{uuid.uuid4().hex}'
+    requeue_stale_messages()
+    totals = {'emails': 0, 'messages': 0, 'retry': 0, 'failed': 0}
+    while True:
+        groups = claim_batch(batch_size, worker_id)
+        if not groups:
+            break
+        result = send_batch(groups)
+        totals['emails'] += result['sent']
+        totals['messages'] += sum(len(messages) for messages in groups.values())
+        totals['retry'] += result['retry']
+        totals['failed'] += result['failed']
+
+    next_attempt_at = OutboxMessage.objects.filter(
+        status=OutboxMessage.STATUS_PENDING,
+    ).aggregate(next_attempt_at=Min('next_attempt_at'))['next_attempt_at']
+    if next_attempt_at is not None:
+        schedule_dispatch(next_attempt_at)
+    return totals
+
+
+ACTION_LABELS = {
+    'create': '新增',
+    'update': '更新',
+    'delete': '刪除',
+}
+
+
+def notify_expense_change(action: 'str', expense, shares: 'dict', previous_ids=()) -> 'list[OutboxMessage]':
+    """
+    通知記帳的付款人與分攤者，需在記帳寫入的交易內呼叫
+    shares: {參與者 ID: 分攤金額}；previous_ids 為更新前的付款人與分攤者，已移除的人也會收到通知
+    """
+    return notify_expense_changes([(action, expense, shares, previous_ids)])
+
+
+def notify_expense_changes(changes) -> 'list[OutboxMessage]':
+    """
+    批次寫入的通知：參與者只查一次、通知一次 bulk_create，需在批次寫入的交易內呼叫
+    changes: [(動作, 記帳, 分攤, 更新前的參與者), ...]，參數同 notify_expense_change；
+    記帳只需有 item_name、date、amount、paid_by_id，同一收件人的多則通知寄送時合併成摘要
+    """
+    if not EXPENSE_NOTIFICATIONS:
+        return []
+    changes = [
+        (action, expense, shares, {expense.paid_by_id, *shares, *previous_ids} - {None})
+        for action, expense, shares, previous_ids in changes
+    ]
+    participant_ids = set().union(*(ids for *_, ids in changes))
+    if not participant_ids:
+        return []
+    participants = {
+        pk: (name, email)
+        for pk, name, email in Participant.objects.filter(pk__in=participant_ids).values_list('pk', 'name', 'email')
+    }
+
+    messages = []
+    for action, expense, shares, ids in changes:
+        label = ACTION_LABELS[action]
+        payer = participants.get(expense.paid_by_id, ('未指定', ''))[0]
+        subject = f'記帳{label}：{expense.item_name}'
+        summary = f'{expense.date:%Y-%m-%d} {expense.item_name} {expense.amount}（{payer} 付款）'
+        for pk in sorted(ids):
+            name, email = participants.get(pk, ('', ''))
+            if not email:
+                continue
+            if pk in shares:
+                detail = f'{name} 分攤 {shares[pk]}'
+            elif pk == expense.paid_by_id:
+                detail = f'{name} 付款，未分攤'
+            else:
+                detail = f'{name} 已不在這筆記帳中'
+            messages.append((email, KIND_EXPENSE, subject, f'{label}：{summary}\n{detail}'))
+    return add(messages)
@@ -0,0 +1,81 @@
+"""
+記帳搜尋
+後端由 EXPENSE_SEARCH_BACKEND 指定，寫入經 write-behind 佇列批次送出
+"""
+import threading
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .base import SearchBackend, SearchQuery, SearchResult, DOCUMENT_FIELDS, to_document
+from .queue import IndexQueue
+
+
+BACKEND_PATH = getattr(settings, 'EXPENSE_SEARCH_BACKEND', 'ExpenseTracker.search.inprocess.InProcessSearchBackend')
+BATCH_SIZE = getattr(settings, 'EXPENSE_SEARCH_BATCH_SIZE', 500)
+FLUSH_INTERVAL = getattr(settings, 'EXPENSE_SEARCH_FLUSH_INTERVAL', 2.0)
+MAX_HITS = getattr(settings, 'EXPENSE_SEARCH_MAX_HITS', 10000)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend() -> 'SearchBackend':
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(BACKEND_PATH)()
+    return _backend
+
+
+index_queue = IndexQueue(get_search_backend, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL)
+
+
+def search_expenses(query: 'SearchQuery') -> 'SearchResult':
+    """搜尋前先送出本行程尚未寫入的異動"""
+    index_queue.flush()
+    return get_search_backend().search(query)
+
+
+def keyword_filter(keyword: 'str', category_id: 'int|None' = None,
+                   start_date=None, end_date=None) -> 'Q':
+    """
+    關鍵字篩選條件，供記帳列表、匯出、批次操作與後台以 queryset.filter() 使用
+    日期與類型條件一併交給搜尋後端縮小命中數；命中不超過 MAX_HITS 筆時以 pk__in 過濾，
+    超過時改回 icontains，不截掉較舊的記帳，也不產生過長的 IN 參數
+    """
+    result = search_expenses(SearchQuery(
+        keyword=keyword, category_id=category_id, start_date=start_date, end_date=end_date, limit=MAX_HITS,
+    ))
+    if result.total <= len(result.ids):
+        return Q(pk__in=result.ids)
+    return Q(item_name__icontains=keyword) | Q(note__icontains=keyword)
+
+
+def reindex_expenses(batch_size: 'int' = BATCH_SIZE, progress=None) -> 'int':
+    """
+    依主鍵分批重建索引
+    progress(done, total) 可回報進度
+    """
+    from ..models import Expense
+
+    backend = get_search_backend()
+    backend.clear()
+    total = Expense.objects.count()
+    done = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            Expense.objects.filter(pk__gt=last_pk).order_by('pk').values(*DOCUMENT_FIELDS)[:batch_size]
+        )
+        if not rows:
+            break
+        backend.index_documents([to_document(row) for row in rows])
+        last_pk = rows[-1]['id']
+        done += len(rows)
+        if progress:
+            progress(done, total)
+    backend.refresh()
+    return done
@@ -0,0 +1,60 @@
+from dataclasses import dataclass, field
+from datetime import date
+
+
+# 建立索引時從 Expense 取出的欄位
+DOCUMENT_FIELDS = ['id', 'item_name', 'note', 'category_id', 'paid_by_id', 'date', 'amount']
+
+
+@dataclass
+class SearchQuery:
+    """搜尋條件；keyword 比照原本的 icontains，比對品項與備註"""
+    keyword: 'str' = ''
+    category_id: 'int|None' = None
+    paid_by_id: 'int|None' = None
+    start_date: 'date|None' = None
+    end_date: 'date|None' = None
+    limit: 'int' = 50
+    offset: 'int' = 0
+
+
+@dataclass
+class SearchResult:
+    ids: 'list[int]'
+    total: 'int'
+    # {'category': {category_id: count}, 'paid_by': {participant_id: count}}
+    facets: 'dict[str, dict]' = field(default_factory=dict)
+
+
+def to_document(row: 'dict') -> 'dict':
+    """Expense.values(*DOCUMENT_FIELDS) 轉成索引文件"""
+    return {
+        'id': row['id'],
+        'item_name': row['item_name'],
+        'note': row['note'],
+        'category_id': row['category_id'],
+        'paid_by_id': row['paid_by_id'],
+        'date': row['date'].isoformat(),
+        'amount': float(row['amount']),
+    }
+
+
+class SearchBackend:
+    """記帳搜尋後端介面"""
+
+    def index_documents(self, documents: 'list[dict]') -> 'None':
+        raise NotImplementedError
+
+    def delete_documents(self, ids: 'list[int]') -> 'None':
+        raise NotImplementedError
+
+    def search(self, query: 'SearchQuery') -> 'SearchResult':
+        """回傳依日期新到舊排序的命中 ID，facets 為所有命中文件的類型/付款人計數"""
+        raise NotImplementedError
+
+    def clear(self) -> 'None':
+        """清空索引，重建前呼叫"""
+        raise NotImplementedError
+
+    def refresh(self) -> 'None':
+        """搜尋前同步尚未反映的異動；預設不需處理"""
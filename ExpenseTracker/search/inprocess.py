@@ -0,0 +1,139 @@
+"""
+行程內倒排索引
+以字元 unigram/bigram 建索引，取交集後再以子字串確認，結果與 icontains 一致
+其他行程的寫入透過異動紀錄（ChangeLogEntry）追上，不需重建
+"""
+import threading
+from collections import Counter
+
+from ..models import Expense, ChangeLogEntry
+from .base import SearchBackend, SearchQuery, SearchResult, DOCUMENT_FIELDS, to_document
+
+
+def _grams(text: 'str') -> 'set[str]':
+    text = text.lower()
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _query_grams(keyword: 'str') -> 'set[str]':
+    keyword = keyword.lower()
+    if len(keyword) == 1:
+        return {keyword}
+    return {keyword[i:i + 2] for i in range(len(keyword) - 1)}
+
+
+class InProcessSearchBackend(SearchBackend):
+    CHANGE_BATCH_SIZE = 1000
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documents: 'dict[int, dict]' = {}
+        self._postings: 'dict[str, set[int]]' = {}
+        self._loaded = False
+        self._cursor = 0
+
+    def _add(self, document: 'dict'):
+        self._remove(document['id'])
+        text = f"{document['item_name']}\n{document['note']}"
+        document = dict(document, text=text.lower())
+        self._documents[document['id']] = document
+        for gram in _grams(text):
+            self._postings.setdefault(gram, set()).add(document['id'])
+
+    def _remove(self, doc_id: 'int'):
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        for gram in _grams(document['text']):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[gram]
+
+    def index_documents(self, documents):
+        with self._lock:
+            for document in documents:
+                self._add(document)
+
+    def delete_documents(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self._postings.clear()
+            self._loaded = True
+            self._cursor = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def _load(self):
+        """第一次使用時從資料庫建立索引"""
+        self.clear()
+        last_pk = 0
+        while True:
+            rows = list(
+                Expense.objects.filter(pk__gt=last_pk).order_by('pk').values(*DOCUMENT_FIELDS)[:self.CHANGE_BATCH_SIZE]
+            )
+            if not rows:
+                break
+            self.index_documents([to_document(row) for row in rows])
+            last_pk = rows[-1]['id']
+
+    def refresh(self):
+        """依異動紀錄追上其他行程的寫入"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                return
+            while True:
+                entries = list(
+                    ChangeLogEntry.objects.filter(id__gt=self._cursor, model='expense')
+                    .order_by('id').values_list('id', 'object_id', 'action')[:self.CHANGE_BATCH_SIZE]
+                )
+                if not entries:
+                    return
+                self._cursor = entries[-1][0]
+                changed = {object_id for _, object_id, _ in entries}
+                rows = Expense.objects.filter(pk__in=changed).values(*DOCUMENT_FIELDS)
+                documents = [to_document(row) for row in rows]
+                self.delete_documents(changed - {document['id'] for document in documents})
+                self.index_documents(documents)
+
+    def _matches(self, query: 'SearchQuery') -> 'list[dict]':
+        keyword = query.keyword.strip().lower()
+        if keyword:
+            postings = [self._postings.get(gram, set()) for gram in _query_grams(keyword)]
+            candidates = set.intersection(*sorted(postings, key=len)) if postings else set()
+            documents = (self._documents[doc_id] for doc_id in candidates)
+            documents = [document for document in documents if keyword in document['text']]
+        else:
+            documents = list(self._documents.values())
+
+        start = query.start_date.isoformat() if query.start_date else None
+        end = query.end_date.isoformat() if query.end_date else None
+        return [
+            document for document in documents
+            if (query.category_id is None or document['category_id'] == query.category_id)
+            and (query.paid_by_id is None or document['paid_by_id'] == query.paid_by_id)
+            and (start is None or document['date'] >= start)
+            and (end is None or document['date'] <= end)
+        ]
+
+    def search(self, query):
+        self.refresh()
+        with self._lock:
+            documents = self._matches(query)
+        documents.sort(key=lambda document: (document['date'], document['id']), reverse=True)
+        page = documents[query.offset:query.offset + query.limit]
+        return SearchResult(
+            ids=[document['id'] for document in page],
+            total=len(documents),
+            facets={
+                'category': dict(Counter(document['category_id'] for document in documents)),
+                'paid_by': dict(Counter(document['paid_by_id'] for document in documents)),
+            },
+        )
@@ -0,0 +1,157 @@
+"""
+OpenSearch 搜尋後端
+連線參數沿用 OPENSEARCH_* 設定，品項/備註以 ngram 建索引以符合子字串搜尋
+"""
+import time
+
+from django.conf import settings
+
+try:
+    from opensearchpy import OpenSearch, helpers
+except ImportError:  # pragma: no cover
+    OpenSearch = helpers = None
+
+from .base import SearchBackend, SearchResult
+
+
+INDEX_SETTINGS = {
+    'settings': {
+        'index': {'max_ngram_diff': 1},
+        'analysis': {
+            'tokenizer': {
+                'gram': {'type': 'ngram', 'min_gram': 1, 'max_gram': 2, 'token_chars': []},
+            },
+            'analyzer': {
+                'gram': {'type': 'custom', 'tokenizer': 'gram', 'filter': ['lowercase']},
+            },
+        },
+    },
+    'mappings': {
+        'properties': {
+            'item_name': {'type': 'text', 'analyzer': 'gram'},
+            'note': {'type': 'text', 'analyzer': 'gram'},
+            'category_id': {'type': 'integer'},
+            'paid_by_id': {'type': 'integer'},
+            'date': {'type': 'date'},
+            'amount': {'type': 'double'},
+        },
+    },
+}
+
+# 未分類/無付款人在 terms 聚合中的替代值
+MISSING_ID = -1
+
+
+class OpenSearchBackend(SearchBackend):
+
+    def __init__(self):
+        if OpenSearch is None:
+            raise RuntimeError('需安裝 opensearch-py 才能使用 OpenSearchBackend')
+        self.index = getattr(settings, 'EXPENSE_SEARCH_INDEX', 'expense-tracker-expenses')
+        self.index_cache_timeout = getattr(settings, 'OPENSEARCH_INDEX_CACHE_TIMEOUT', 900)
+        self._index_checked_at = None
+        self.client = OpenSearch(
+            hosts=[settings.OPENSEARCH_HOST],
+            http_auth=(settings.OPENSEARCH_USERNAME, settings.OPENSEARCH_PASSWORD)
+            if settings.OPENSEARCH_USERNAME else None,
+            verify_certs=settings.OPENSEARCH_VERIFY_CERTS,
+            ssl_show_warn=settings.OPENSEARCH_VERIFY_CERTS,
+            timeout=settings.OPENSEARCH_TIMEOUT,
+            max_retries=settings.OPENSEARCH_MAX_RETRIES,
+            retry_on_timeout=settings.OPENSEARCH_RETRY_ON_TIMEOUT,
+            http_compress=settings.OPENSEARCH_HTTP_COMPRESS,
+        )
+
+    def ensure_index(self):
+        """確認索引存在；結果快取 OPENSEARCH_INDEX_CACHE_TIMEOUT 秒，避免每次寫入都檢查"""
+        now = time.monotonic()
+        if self._index_checked_at is not None and now - self._index_checked_at < self.index_cache_timeout:
+            return
+        if not self.client.indices.exists(index=self.index):
+            self.client.indices.create(index=self.index, body=INDEX_SETTINGS)
+        self._index_checked_at = now
+
+    def index_documents(self, documents):
+        if not documents:
+            return
+        self.ensure_index()
+        helpers.bulk(self.client, (
+            {'_op_type': 'index', '_index': self.index, '_id': document['id'], '_source': document}
+            for document in documents
+        ))
+
+    def delete_documents(self, ids):
+        if not ids:
+            return
+        self.ensure_index()
+        helpers.bulk(self.client, (
+            {'_op_type': 'delete', '_index': self.index, '_id': doc_id}
+            for doc_id in ids
+        ), raise_on_error=False)
+
+    def clear(self):
+        self.client.indices.delete(index=self.index, ignore_unavailable=True)
+        self._index_checked_at = None
+        self.ensure_index()
+
+    def refresh(self):
+        self.client.indices.refresh(index=self.index)
+
+    def search(self, query):
+        self.ensure_index()
+        filters = []
+        if query.category_id is not None:
+            filters.append({'term': {'category_id': query.category_id}})
+        if query.paid_by_id is not None:
+            filters.append({'term': {'paid_by_id': query.paid_by_id}})
+        if query.start_date or query.end_date:
+            date_range = {}
+            if query.start_date:
+                date_range['gte'] = query.start_date.isoformat()
+            if query.end_date:
+                date_range['lte'] = query.end_date.isoformat()
+            filters.append({'range': {'date': date_range}})
+
+        must = []
+        keyword = query.keyword.strip()
+        if keyword:
+            # 所有 gram 都需命中，再於下方以子字串確認
+            must.append({'multi_match': {
+                'query': keyword, 'fields': ['item_name', 'note'], 'type': 'cross_fields', 'operator': 'and',
+            }})
+
+        body = {
+            'query': {'bool': {'must': must or [{'match_all': {}}], 'filter': filters}},
+            'sort': [{'date': 'desc'}, {'_id': 'desc'}],
+            'from': query.offset,
+            'size': query.limit,
+            '_source': ['item_name', 'note'] if keyword else False,
+            'track_total_hits': True,
+            'aggs': {
+                'category': {'terms': {'field': 'category_id', 'size': 1000, 'missing': MISSING_ID}},
+                'paid_by': {'terms': {'field': 'paid_by_id', 'size': 1000, 'missing': MISSING_ID}},
+            },
+        }
+        response = self.client.search(index=self.index, body=body)
+        hits = response['hits']
+        if keyword:
+            # gram 全數命中不代表連續出現，以子字串確認，結果與 icontains 一致；
+            # total 與 facets 仍是 gram 命中數，可能略多
+            keyword = keyword.lower()
+            matched = [
+                hit for hit in hits['hits']
+                if keyword in f"{hit['_source'].get('item_name', '')}\n{hit['_source'].get('note', '')}".lower()
+            ]
+        else:
+            matched = hits['hits']
+        return SearchResult(
+            ids=[int(hit['_id']) for hit in matched],
+            total=hits['total']['value'],
+            facets={
+                name: {
+                    (None if bucket['key'] == MISSING_ID else bucket['key']): bucket['doc_count']
+                    for bucket in response['aggregations'][name]['buckets']
+                }
+                for name in ('category', 'paid_by')
+            },
+        )
@@ -0,0 +1,83 @@
+"""
+搜尋索引的 write-behind 佇列
+signal 只記錄異動的記帳 ID，累積到批次大小或超過間隔才一次查出並送往後端
+"""
+import atexit
+import logging
+import threading
+
+from django.db import connection
+
+from .base import DOCUMENT_FIELDS, to_document
+
+
+logger = logging.getLogger(__name__)
+
+
+class IndexQueue:
+
+    def __init__(self, get_backend, batch_size: 'int' = 500, flush_interval: 'float' = 2.0):
+        self.get_backend = get_backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: 'dict[int, bool]' = {}  # 記帳 ID -> 是否已刪除
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, ids, deleted: 'bool' = False):
+        with self._lock:
+            for pk in ids:
+                self._pending[pk] = deleted
+            size = len(self._pending)
+            self._ensure_thread()
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='expense-search-indexer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('搜尋索引寫入失敗')
+            finally:
+                # 背景執行緒自己的資料庫連線用完即關
+                connection.close()
+
+    def flush(self):
+        """送出目前累積的異動；寫入失敗時放回佇列等下次重試"""
+        from ..models import Expense
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                backend = self.get_backend()
+                upsert_ids = [pk for pk, deleted in pending.items() if not deleted]
+                delete_ids = [pk for pk, deleted in pending.items() if deleted]
+                for start in range(0, len(upsert_ids), self.batch_size):
+                    chunk = upsert_ids[start:start + self.batch_size]
+                    documents = [
+                        to_document(row)
+                        for row in Expense.objects.filter(pk__in=chunk).values(*DOCUMENT_FIELDS)
+                    ]
+                    backend.index_documents(documents)
+                    # 排入後才被刪除的記帳
+                    delete_ids.extend(set(chunk) - {document['id'] for document in documents})
+                backend.delete_documents(delete_ids)
+            except Exception:
+                with self._lock:
+                    for pk, deleted in pending.items():
+                        self._pending.setdefault(pk, deleted)
+                raise
@@ -1,103 +1,214 @@
-from django.db.models import Sum, Q
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
-from collections import defaultdict
+from array import array
+from dataclasses import dataclass
 from decimal import Decimal
-from .models import Expense, ExpenseSplit, Participant
+import threading
+from .models import Participant, ExpenseAnomaly
+from .choices import category_choices, participant_choices
+from . import cache as data_cache
+from . import ledger
+from .search import keyword_filter
 
 
-def get_statistics(period='all', start_date=None, end_date=None):
+DAILY_SERIES_MAX_DAYS = getattr(settings, 'DASHBOARD_DAILY_MAX_DAYS', 366)
+
+
+def apply_expense_filters(queryset, cleaned_data):
+    """依篩選表單的 cleaned_data 過濾記帳"""
+    start_date = cleaned_data.get('start_date')
+    end_date = cleaned_data.get('end_date')
+    category = cleaned_data.get('category')
+    keyword = cleaned_data.get('keyword')
+    sort_by = cleaned_data.get('sort_by') or '-date'
+
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    if category:
+        queryset = queryset.filter(category=category)
+    if keyword:
+        # 關鍵字由搜尋後端比對，避免 icontains 全表掃描
+        queryset = queryset.filter(keyword_filter(
+            keyword, category_id=category.pk if category else None, start_date=start_date, end_date=end_date,
+        ))
+    # 排序欄位不唯一，加上主鍵讓分頁與分批讀取的順序固定
+    return queryset.order_by(sort_by, '-pk')
+
+
+def split_amount_evenly(amount, count):
     """
-    取得統計資料
-    period: 'day', 'week', 'month', 'all'
+    平均分攤金額，以分為單位分配餘數
+    回傳 count 個金額，總和必定等於 amount
     """
-    today = timezone.now().date()
-    
+    if count <= 0:
+        return []
+    cents = int((Decimal(amount) * 100).quantize(Decimal('1')))
+    base, remainder = divmod(cents, count)
+    return [
+        Decimal(base + (1 if i < remainder else 0)).scaleb(-2)
+        for i in range(count)
+    ]
+
+
+def get_period_range(period, today=None):
+    """
+    期間的起訖日期
+    period: 'day', 'week', 'month'；其他值回傳 (None, None)
+    """
+    today = today or timezone.now().date()
     if period == 'day':
-        start_date = today
-        end_date = today
-    elif period == 'week':
+        return today, today
+    if period == 'week':
         start_date = today - timedelta(days=today.weekday())
-        end_date = start_date + timedelta(days=6)
-    elif period == 'month':
+        return start_date, start_date + timedelta(days=6)
+    if period == 'month':
         start_date = today.replace(day=1)
         next_month = today.replace(day=28) + timedelta(days=4)
-        end_date = next_month - timedelta(days=next_month.day)
-    
-    queryset = Expense.objects.all()
-    
-    if start_date:
-        queryset = queryset.filter(date__gte=start_date)
-    if end_date:
-        queryset = queryset.filter(date__lte=end_date)
-    
-    # 總支出
-    total_amount = queryset.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    # 各類型支出
-    category_stats = queryset.values(
-        'category__name', 'category__color'
-    ).annotate(
-        total=Sum('amount')
-    ).order_by('-total')
-    
-    # 計算百分比
-    category_data = []
-    for stat in category_stats:
-        percentage = (stat['total'] / total_amount * 100) if total_amount > 0 else 0
-        category_data.append({
-            'name': stat['category__name'] or '未分類',
-            'color': stat['category__color'] or '#6c757d',
-            'total': float(stat['total']),
-            'percentage': round(float(percentage), 1)
-        })
-    
+        return start_date, next_month - timedelta(days=next_month.day)
+    return None, None
+
+
+def get_previous_range(period, start_date, end_date):
+    """
+    前一期的起訖日期；月份取上一個完整月份，其餘取緊鄰且等長的區間
+    起訖任一未指定（不限期間），或前一期早於 date.min 時沒有前一期，回傳 (None, None)
+    """
+    if not start_date or not end_date:
+        return None, None
+    try:
+        if period == 'month':
+            previous_end = start_date - timedelta(days=1)
+            return previous_end.replace(day=1), previous_end
+        length = end_date - start_date + timedelta(days=1)
+        return start_date - length, start_date - timedelta(days=1)
+    except OverflowError:
+        return None, None
+
+
+def _growth(current, previous):
+    """差額與成長率（%）；前一期為 0 時成長率為 None"""
     return {
+        'delta': round(float(current - previous), 2),
+        'growth_rate': round(float((current - previous) / previous * 100), 1) if previous else None,
+    }
+
+
+def get_statistics(period='all', start_date=None, end_date=None):
+    """
+    取得統計資料，並與前一期比較
+    period: 'day', 'week', 'month', 'all'；自訂區間時傳入 start_date / end_date
+    本期與前一期的各類型金額、筆數由記帳快照（含已封存的每日彙總）以 bincount 算出，資料未異動時不查資料庫
+    """
+    if period in ('day', 'week', 'month'):
+        start_date, end_date = get_period_range(period)
+    previous_start, previous_end = get_previous_range(period, start_date, end_date)
+    has_previous = previous_start is not None
+
+    snapshot = ledger.get_ledger_snapshot()
+    current = snapshot.category_totals(start_date, end_date)
+    previous = snapshot.category_totals(previous_start, previous_end) if has_previous else {}
+    category_map = category_choices.get_map()
+
+    categories = {}
+    for category_id in current.keys() | previous.keys():
+        category = category_map.get(category_id)
+        current_total, current_count = current.get(category_id, (0, 0))
+        previous_total, previous_count = previous.get(category_id, (0, 0))
+        categories[category_id] = {
+            'name': category.name if category else '未分類',
+            'color': (category.color if category else None) or '#6c757d',
+            'current': ledger.to_decimal(current_total),
+            'previous': ledger.to_decimal(previous_total),
+            'current_count': current_count,
+            'previous_count': previous_count,
+        }
+
+    total_amount = sum((row['current'] for row in categories.values()), Decimal('0'))
+    expense_count = sum(row['current_count'] for row in categories.values())
+    previous_amount = sum((row['previous'] for row in categories.values()), Decimal('0'))
+    previous_count = sum(row['previous_count'] for row in categories.values())
+
+    # 各類型支出與百分比；只列出本期有支出的類型
+    category_data = []
+    for row in sorted(categories.values(), key=lambda row: row['current'], reverse=True):
+        if not row['current_count']:
+            continue
+        percentage = (row['current'] / total_amount * 100) if total_amount > 0 else 0
+        data = {
+            'name': row['name'],
+            'color': row['color'],
+            'total': float(row['current']),
+            'percentage': round(float(percentage), 1),
+        }
+        if has_previous:
+            data['previous_total'] = float(row['previous'])
+            data.update(_growth(row['current'], row['previous']))
+        category_data.append(data)
+
+    average_amount = total_amount / expense_count if expense_count else Decimal('0')
+    stats = {
         'total_amount': float(total_amount),
         'category_data': category_data,
-        'expense_count': queryset.count(),
+        'expense_count': expense_count,
+        'average_amount': round(float(average_amount), 2),
         'period': period,
         'start_date': start_date,
         'end_date': end_date,
+        'previous': None,
+        'comparison': None,
     }
+    if has_previous:
+        previous_average = previous_amount / previous_count if previous_count else Decimal('0')
+        stats['previous'] = {
+            'start_date': previous_start,
+            'end_date': previous_end,
+            'total_amount': float(previous_amount),
+            'expense_count': previous_count,
+            'average_amount': round(float(previous_average), 2),
+        }
+        stats['comparison'] = {
+            'total_amount': _growth(total_amount, previous_amount),
+            'expense_count': _growth(Decimal(expense_count), Decimal(previous_count)),
+            'average_amount': _growth(average_amount, previous_average),
+        }
+    return stats
 
 
-def calculate_settlement():
+def get_daily_series(start_date=None, end_date=None, category_id=None, max_days=None):
     """
-    計算分帳結算結果
-    返回「誰欠誰多少錢」的清單
+    每日支出金額與筆數（含沒有支出的日子）；未指定起訖時取資料的最早／最晚日期
+    每天一筆，區間超過 max_days 天時拋出 ValueError
+    """
+    snapshot = ledger.get_ledger_snapshot()
+    if not start_date or not end_date:
+        first, last = snapshot.date_bounds()
+        if first is None:
+            return []
+        start_date, end_date = start_date or first, end_date or last
+    if max_days is not None and (end_date - start_date).days + 1 > max_days:
+        raise ValueError(f'每日金額的區間最長 {max_days} 天')
+    return [
+        {'date': day, 'total': cents / 100, 'count': count}
+        for day, cents, count in snapshot.daily_totals(start_date, end_date, category_id=category_id)
+    ]
+
+
+def settle_balances(balances, names):
+    """
+    簡化債務關係，回傳「誰欠誰多少錢」的清單
+    純函式不查資料庫；balances: {participant_id: 淨額}，正數表示別人欠他錢
     """
-    # 計算每個人應付的總額（他們的分攤）
-    participants = Participant.objects.filter(is_active=True)
-    
-    # 每個人的收支平衡
-    balance = defaultdict(Decimal)
-    
-    for participant in participants:
-        # 他付的錢
-        paid = Expense.objects.filter(
-            paid_by=participant
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        # 他應分攤的錢
-        owed = ExpenseSplit.objects.filter(
-            participant=participant
-        ).aggregate(total=Sum('share_amount'))['total'] or Decimal('0')
-        
-        # 正數表示別人欠他錢，負數表示他欠別人錢
-        balance[participant.id] = paid - owed
-    
-    # 簡化債務關係
     settlements = []
-    creditors = [(pid, bal) for pid, bal in balance.items() if bal > 0]
-    debtors = [(pid, -bal) for pid, bal in balance.items() if bal < 0]
+    creditors = [(pid, bal) for pid, bal in balances.items() if bal > 0]
+    debtors = [(pid, -bal) for pid, bal in balances.items() if bal < 0]
     
     # 排序以便快速配對
     creditors.sort(key=lambda x: x[1], reverse=True)
     debtors.sort(key=lambda x: x[1], reverse=True)
     
-    participant_map = {p.id: p.name for p in participants}
-    
     i, j = 0, 0
     while i < len(creditors) and j < len(debtors):
         creditor_id, credit = creditors[i]
@@ -106,8 +217,8 @@ def calculate_settlement():
         amount = min(credit, debt)
         if amount > Decimal('0.01'):  # 忽略極小金額
             settlements.append({
-                'from_name': participant_map.get(debtor_id, '未知'),
-                'to_name': participant_map.get(creditor_id, '未知'),
+                'from_name': names.get(debtor_id, '未知'),
+                'to_name': names.get(creditor_id, '未知'),
                 'amount': float(amount.quantize(Decimal('0.01')))
             })
         
@@ -122,28 +233,177 @@ def calculate_settlement():
     return settlements
 
 
+def calculate_settlement():
+    """
+    計算分帳結算結果
+    返回「誰欠誰多少錢」的清單
+    """
+    snapshot = get_balance_snapshot()
+    return settle_balances(snapshot.net_balances(), snapshot.names)
+
+
+def get_participant_balances():
+    """
+    每位參與者的 (已付, 應分攤) 總額，含已封存的記帳
+    由記帳快照以 bincount 算出，不逐人查詢
+    """
+    return {
+        participant_id: (ledger.to_decimal(paid), ledger.to_decimal(owed))
+        for participant_id, (paid, owed) in ledger.get_ledger_snapshot().participant_totals().items()
+    }
+
+
+@dataclass(frozen=True)
+class BalanceSnapshot:
+    """啟用中參與者的收支快照，結算與試算共用"""
+    balances: 'dict[int, tuple[Decimal, Decimal]]'  # participant_id -> (已付, 應分攤)
+    names: 'dict[int, str]'
+
+    def net_balances(self) -> 'dict[int, Decimal]':
+        return {pid: paid - owed for pid, (paid, owed) in self.balances.items()}
+
+
+_balance_snapshot_lock = threading.Lock()
+_balance_snapshot = (None, None)  # (資料版本, 快照)
+
+
+def get_balance_snapshot() -> 'BalanceSnapshot':
+    """
+    行程內快取的收支快照
+    以記帳與參與者的資料版本號判斷是否失效，版本未變時不查資料庫
+    """
+    global _balance_snapshot
+    versions = data_cache.get_data_versions(data_cache.EXPENSE, data_cache.PARTICIPANT)
+    version = (versions[data_cache.EXPENSE], versions[data_cache.PARTICIPANT])
+    cached_version, snapshot = _balance_snapshot
+    if cached_version == version:
+        return snapshot
+    with _balance_snapshot_lock:
+        cached_version, snapshot = _balance_snapshot
+        if cached_version == version:
+            return snapshot
+        participants = list(Participant.objects.filter(is_active=True).values_list('id', 'name'))
+        participant_balances = get_participant_balances()
+        zero = (Decimal('0'), Decimal('0'))
+        snapshot = BalanceSnapshot(
+            balances={pid: participant_balances.get(pid, zero) for pid, _ in participants},
+            names=dict(participants),
+        )
+        _balance_snapshot = (version, snapshot)
+        return snapshot
+
+
 def get_participant_summary():
     """取得每位參與者的收支摘要"""
-    participants = Participant.objects.filter(is_active=True)
+    snapshot = get_balance_snapshot()
     summaries = []
     
-    for participant in participants:
-        paid = Expense.objects.filter(
-            paid_by=participant
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        owed = ExpenseSplit.objects.filter(
-            participant=participant
-        ).aggregate(total=Sum('share_amount'))['total'] or Decimal('0')
-        
+    for participant_id, (paid, owed) in snapshot.balances.items():
         balance = paid - owed
         
         summaries.append({
-            'id': participant.id,
-            'name': participant.name,
+            'id': participant_id,
+            'name': snapshot.names[participant_id],
             'paid': float(paid),
             'owed': float(owed),
             'balance': float(balance),
         })
     
     return summaries
+
+
+@dataclass
+class SpendingMatrix:
+    """
+    參與者 × 類型的支出矩陣
+    cells 為以「分」為單位的一維陣列，cells[row * len(columns) + col]
+    """
+    rows: 'list[dict]'
+    columns: 'list[dict]'
+    cells: 'array'
+    row_totals: 'array'
+    column_totals: 'array'
+
+    def cell(self, row: 'int', col: 'int') -> 'int':
+        return self.cells[row * len(self.columns) + col]
+
+    @property
+    def grand_total(self) -> 'int':
+        return sum(self.row_totals)
+
+    def to_dict(self) -> 'dict':
+        width = len(self.columns)
+        return {
+            'rows': self.rows,
+            'columns': self.columns,
+            'cells': [
+                [cents / 100 for cents in self.cells[i * width:(i + 1) * width]]
+                for i in range(len(self.rows))
+            ],
+            'row_totals': [cents / 100 for cents in self.row_totals],
+            'column_totals': [cents / 100 for cents in self.column_totals],
+            'total': self.grand_total / 100,
+        }
+
+
+def get_spending_matrix(start_date=None, end_date=None, mode='share'):
+    """
+    參與者 × 類型支出矩陣，由記帳快照彙總
+    mode: 'share' 依分攤金額，'paid' 依付款人實付金額
+    """
+    groups = ledger.get_ledger_snapshot().spending_groups(start_date, end_date, mode=mode)
+
+    # 列與欄取自選項快取，資料中出現但快取沒有的 ID 附加在最後
+    participants = list(participant_choices.get_objects())
+    categories = list(category_choices.get_objects())
+    row_index = {p.pk: i for i, p in enumerate(participants)}
+    col_index = {c.pk: i for i, c in enumerate(categories)}
+    rows = [{'id': p.pk, 'name': p.name} for p in participants]
+    columns = [{'id': c.pk, 'name': c.name, 'color': c.color} for c in categories]
+    columns.append({'id': None, 'name': '未分類', 'color': '#6c757d'})
+    col_index[None] = len(columns) - 1
+    for participant_id, category_id, _ in groups:
+        if participant_id not in row_index:
+            row_index[participant_id] = len(rows)
+            rows.append({'id': participant_id, 'name': '未知'})
+        if category_id not in col_index:
+            col_index[category_id] = len(columns)
+            columns.append({'id': category_id, 'name': '未知', 'color': '#6c757d'})
+
+    width = len(columns)
+    cells = array('q', bytes(8 * len(rows) * width))
+    row_totals = array('q', bytes(8 * len(rows)))
+    column_totals = array('q', bytes(8 * width))
+    for participant_id, category_id, cents in groups:
+        row, col = row_index[participant_id], col_index[category_id]
+        cells[row * width + col] += cents
+        row_totals[row] += cents
+        column_totals[col] += cents
+
+    return SpendingMatrix(
+        rows=rows,
+        columns=columns,
+        cells=cells,
+        row_totals=row_totals,
+        column_totals=column_totals,
+    )
+
+
+def get_recent_anomalies(limit=10):
+    """最近偵測到的異常記帳"""
+    anomalies = ExpenseAnomaly.objects.select_related(
+        'expense__category', 'expense__paid_by'
+    )[:limit]
+    return [
+        {
+            'expense_id': anomaly.expense_id,
+            'date': anomaly.expense.date,
+            'item_name': anomaly.expense.item_name,
+            'category': anomaly.expense.category.name if anomaly.expense.category else '未分類',
+            'amount': float(anomaly.expense.amount),
+            'paid_by': anomaly.expense.paid_by.name if anomaly.expense.paid_by else '',
+            'z_score': round(anomaly.z_score, 1),
+            'reason': anomaly.reason,
+        }
+        for anomaly in anomalies
+    ]
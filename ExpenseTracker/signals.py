@@ -0,0 +1,170 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver, Signal
+
+from . import budgets
+from . import cache as data_cache
+from . import changefeed
+from .anomaly import score_new_expenses
+from .models import Expense, ExpenseCategory, Participant, ExpenseSplit, ChangeLogEntry, Budget
+from .search import index_queue
+from .typeahead import item_index
+from . import live
+
+
+# 批次寫入不會觸發逐筆的 post_save/post_delete，改送此 signal
+# 參數：expense_ids, created_expense_ids, deleted_expense_ids, split_ids, deleted_split_ids
+expenses_bulk_changed = Signal()
+
+
+@receiver([post_save, post_delete], sender=ExpenseCategory)
+def bump_category_version(sender, **kwargs):
+    data_cache.bump_data_version(data_cache.CATEGORY)
+
+
+@receiver([post_save, post_delete], sender=Participant)
+def bump_participant_version(sender, **kwargs):
+    data_cache.bump_data_version(data_cache.PARTICIPANT)
+
+
+@receiver([post_save, post_delete], sender=Budget)
+def bump_budget_version(sender, **kwargs):
+    data_cache.bump_data_version(data_cache.BUDGET)
+
+
+@receiver([post_save, post_delete], sender=Expense)
+@receiver([post_save, post_delete], sender=ExpenseSplit)
+def bump_expense_version(sender, **kwargs):
+    data_cache.bump_data_version(data_cache.EXPENSE)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=ExpenseSplit)
+@receiver(post_save, sender=Participant)
+@receiver(post_save, sender=ExpenseCategory)
+def record_upsert(sender, instance, raw=False, **kwargs):
+    if not raw:
+        changefeed.record_change(changefeed.MODEL_NAMES[sender], instance.pk, ChangeLogEntry.ACTION_UPSERT)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=ExpenseSplit)
+@receiver(post_delete, sender=Participant)
+@receiver(post_delete, sender=ExpenseCategory)
+def record_delete(sender, instance, **kwargs):
+    changefeed.record_change(changefeed.MODEL_NAMES[sender], instance.pk, ChangeLogEntry.ACTION_DELETE)
+
+
+@receiver(pre_delete, sender=ExpenseCategory)
+@receiver(pre_delete, sender=Participant)
+def record_set_null_expenses(sender, instance, **kwargs):
+    """刪除類型或參與者時，記帳的外鍵會被 SET_NULL 但不觸發 signal，需另外記錄"""
+    if sender is ExpenseCategory:
+        expense_ids = Expense.objects.filter(category=instance).values_list('pk', flat=True)
+    else:
+        expense_ids = Expense.objects.filter(paid_by=instance).values_list('pk', flat=True)
+    expense_ids = list(expense_ids)
+    changefeed.record_changes('expense', expense_ids, ChangeLogEntry.ACTION_UPSERT)
+    transaction.on_commit(lambda: index_queue.add(expense_ids))
+
+
+@receiver(expenses_bulk_changed)
+def record_bulk_changes(sender, expense_ids=(), deleted_expense_ids=(), split_ids=(),
+                        deleted_split_ids=(), **kwargs):
+    upsert = ChangeLogEntry.ACTION_UPSERT
+    delete = ChangeLogEntry.ACTION_DELETE
+    changefeed.record_changes('expense_split', deleted_split_ids, delete)
+    changefeed.record_changes('expense', deleted_expense_ids, delete)
+    changefeed.record_changes('expense', expense_ids, upsert)
+    changefeed.record_changes('expense_split', split_ids, upsert)
+    data_cache.bump_data_version(data_cache.EXPENSE)
+
+
+@receiver(post_save, sender=Expense)
+def score_expense_anomaly(sender, instance, created=False, raw=False, **kwargs):
+    """新記帳以類型統計評分；編輯與刪除由 rebuild_anomaly_stats 重新校正"""
+    if created and not raw:
+        score_new_expenses([(instance.pk, instance.category_id, instance.amount)])
+
+
+@receiver(expenses_bulk_changed)
+def score_bulk_expense_anomalies(sender, created_expense_ids=(), **kwargs):
+    if not created_expense_ids:
+        return
+    rows = Expense.objects.filter(pk__in=created_expense_ids).order_by('date', 'time', 'pk')
+    score_new_expenses(rows.values_list('pk', 'category_id', 'amount'))
+
+
+def _spending_row(expense) -> 'tuple':
+    return expense.date, expense.category_id, expense.paid_by_id, expense.amount
+
+
+@receiver(pre_save, sender=Expense)
+def remember_spending(sender, instance, raw=False, **kwargs):
+    """更新記帳前記下舊的日期、類型、付款人與金額，供預算計數扣回；一般取自載入時的值，不另外查詢"""
+    instance._spending_before = None
+    if raw or instance._state.adding:
+        return
+    before = getattr(instance, '_loaded_spending', None)
+    if before is None:
+        # 以 only() / defer() 載入時缺少欄位，才回資料庫讀取
+        before = Expense.objects.using(instance._state.db).filter(pk=instance.pk).values_list(
+            *Expense.SPENDING_FIELDS,
+        ).first()
+    instance._spending_before = before
+
+
+@receiver(post_save, sender=Expense)
+def update_budget_counters(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_spending_before', None)
+    budgets.apply_spending(removed=[before] if before else [], added=[_spending_row(instance)])
+    # 同一個實例再次儲存時以這次寫入的值為舊值
+    instance._loaded_spending = _spending_row(instance)
+
+
+@receiver(post_delete, sender=Expense)
+def release_budget_counters(sender, instance, **kwargs):
+    budgets.apply_spending(removed=[_spending_row(instance)])
+
+
+@receiver(post_save, sender=Expense)
+def queue_expense_index(sender, instance, raw=False, **kwargs):
+    """交易提交後才排入搜尋索引，回滾的寫入不會進索引"""
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: index_queue.add([pk]))
+
+
+@receiver(post_delete, sender=Expense)
+def queue_expense_unindex(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: index_queue.add([pk], deleted=True))
+
+
+@receiver(expenses_bulk_changed)
+def queue_bulk_expense_index(sender, expense_ids=(), deleted_expense_ids=(), **kwargs):
+    expense_ids, deleted_expense_ids = list(expense_ids), list(deleted_expense_ids)
+
+    def enqueue():
+        index_queue.add(expense_ids)
+        index_queue.add(deleted_expense_ids, deleted=True)
+    transaction.on_commit(enqueue)
+
+
+@receiver([post_save, post_delete], sender=Expense)
+@receiver(expenses_bulk_changed)
+def refresh_item_index(sender, raw=False, **kwargs):
+    """品項索引依異動紀錄追上，這裡只讓本行程下次查詢前先追上，不必等 TYPEAHEAD_REFRESH_INTERVAL"""
+    if raw:
+        return
+    transaction.on_commit(item_index.mark_dirty)
+
+
+@receiver([post_save, post_delete], sender=Expense)
+@receiver([post_save, post_delete], sender=ExpenseSplit)
+@receiver(expenses_bulk_changed)
+def push_dashboard(sender, **kwargs):
+    """提交後通知儀表板推播；同一交易內多次寫入由去抖動合併為一次計算"""
+    transaction.on_commit(live.schedule_publish)
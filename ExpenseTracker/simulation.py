@@ -0,0 +1,105 @@
+"""
+分帳試算
+在行程內快取的收支快照上套用假設的記帳與分攤，重跑結算演算法，不查詢也不寫入資料庫
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from .batch import parse_split_input
+from .services import get_balance_snapshot, settle_balances, split_amount_evenly
+
+
+MAX_SCENARIOS = getattr(settings, 'SETTLEMENT_SIMULATION_MAX_SCENARIOS', 100)
+MAX_EXPENSES_PER_SCENARIO = getattr(settings, 'SETTLEMENT_SIMULATION_MAX_EXPENSES', 100)
+
+
+class SimulationError(ValueError):
+    """整個試算請求格式錯誤"""
+
+
+def _parse_expense(item, snapshot) -> 'tuple[int, Decimal, list[tuple[int, Decimal]]]':
+    """回傳 (付款人, 金額, [(分攤者, 金額), ...])；格式錯誤時拋出 ValueError"""
+    if not isinstance(item, dict):
+        raise ValueError('記帳格式錯誤')
+    try:
+        amount = Decimal(str(item['amount'])).quantize(Decimal('0.01'))
+        paid_by = int(item['paid_by'])
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise ValueError('記帳需有 amount 與 paid_by')
+    # NaN 可以 quantize，但與 0 比較會拋出 InvalidOperation
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError('amount 必須大於 0')
+    if paid_by not in snapshot.balances:
+        raise ValueError(f'付款人 {paid_by} 不存在或已停用')
+
+    shares, even = parse_split_input(item)
+    participant_ids = [pk for pk, _ in shares]
+    if not participant_ids:
+        raise ValueError('至少需要一位分攤者')
+    if len(set(participant_ids)) != len(participant_ids):
+        raise ValueError('分攤者重複')
+    missing = [pk for pk in participant_ids if pk not in snapshot.balances]
+    if missing:
+        raise ValueError(f'分攤者 {missing[0]} 不存在或已停用')
+    if even:
+        shares = list(zip(participant_ids, split_amount_evenly(amount, len(participant_ids))))
+    elif sum(share for _, share in shares) != amount:
+        raise ValueError('分攤金額總和需等於記帳金額')
+    return paid_by, amount, shares
+
+
+def simulate_settlement(scenarios) -> 'dict':
+    """
+    scenarios: [{"name": "...", "expenses": [{"amount", "paid_by", "split_participants" | "splits"}, ...]}, ...]
+    每個情境各自從目前的收支出發，回傳結算結果與淨額有變動的參與者
+    """
+    if not isinstance(scenarios, list) or not scenarios:
+        raise SimulationError('scenarios 必須為非空陣列')
+    if len(scenarios) > MAX_SCENARIOS:
+        raise SimulationError(f'單次最多 {MAX_SCENARIOS} 個情境')
+
+    snapshot = get_balance_snapshot()
+    base = snapshot.net_balances()
+    results = []
+    for index, scenario in enumerate(scenarios):
+        result = {'index': index, 'name': '', 'ok': False}
+        results.append(result)
+        expenses = scenario.get('expenses') if isinstance(scenario, dict) else None
+        if isinstance(scenario, dict):
+            result['name'] = str(scenario.get('name') or f'情境 {index + 1}')
+        if not isinstance(expenses, list) or not expenses:
+            result['error'] = 'expenses 必須為非空陣列'
+            continue
+        if len(expenses) > MAX_EXPENSES_PER_SCENARIO:
+            result['error'] = f'每個情境最多 {MAX_EXPENSES_PER_SCENARIO} 筆記帳'
+            continue
+        try:
+            parsed = [_parse_expense(item, snapshot) for item in expenses]
+        except ValueError as exc:
+            result['error'] = str(exc)
+            continue
+
+        balances = dict(base)
+        for paid_by, amount, shares in parsed:
+            balances[paid_by] += amount
+            for participant_id, share in shares:
+                balances[participant_id] -= share
+
+        result['ok'] = True
+        result['settlements'] = settle_balances(balances, snapshot.names)
+        result['balances'] = [
+            {
+                'id': participant_id,
+                'name': snapshot.names[participant_id],
+                'before': float(base[participant_id]),
+                'after': float(balance),
+            }
+            for participant_id, balance in balances.items()
+            if balance != base[participant_id]
+        ]
+
+    return {
+        'baseline': settle_balances(base, snapshot.names),
+        'scenarios': results,
+    }
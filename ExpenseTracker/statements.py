@@ -0,0 +1,252 @@
+"""
+每月對帳單
+整個月份的付款與分攤各以一次查詢取回，在主行程依參與者分組，
+HTML / CSV 交給多個行程平行產生到 TMP_ROOT，寄送時共用同一條郵件連線分批送出
+"""
+import csv
+import io
+import multiprocessing
+import os
+from calendar import monthrange
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections
+from django.db.models import Sum
+from django.template.loader import render_to_string
+
+from .archive import ArchiveSegmentReader
+from .models import ArchivedBalance, ArchiveSegment, Expense, ExpenseSplit, Participant
+
+
+EMAIL_BATCH_SIZE = getattr(settings, 'STATEMENT_EMAIL_BATCH_SIZE', 50)
+DEFAULT_FROM_EMAIL = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+
+CENT = Decimal('0.01')
+CSV_HEADER = ['類別', '日期', '品項', '類型', '付款人', '金額']
+
+
+@dataclass
+class Statement:
+    """單一參與者的對帳資料（只含基本型別，可直接傳給子行程）"""
+    participant_id: 'int'
+    name: 'str'
+    email: 'str'
+    start_date: 'date'
+    end_date: 'date'
+    balance: 'Decimal'
+    paid: 'list[dict]' = field(default_factory=list)
+    shares: 'list[dict]' = field(default_factory=list)
+
+    @property
+    def paid_total(self) -> 'Decimal':
+        return sum((row['amount'] for row in self.paid), Decimal('0')).quantize(CENT)
+
+    @property
+    def owed_total(self) -> 'Decimal':
+        return sum((row['share_amount'] for row in self.shares), Decimal('0')).quantize(CENT)
+
+    @property
+    def filename(self) -> 'str':
+        return f'statement_{self.start_date:%Y%m}_{self.participant_id}'
+
+
+def month_range(year: 'int', month: 'int') -> 'tuple[date, date]':
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def get_balances_as_of(end_date: 'date', participants) -> 'dict[int, tuple[Decimal, Decimal]]':
+    """
+    截至 end_date（含）每位參與者的 (已付, 應分攤) 總額，含已封存的記帳
+    封存收支彙總沒有日期，封存區段含 end_date 之後的記帳時讀回該區段扣除
+    """
+    paid = defaultdict(Decimal)
+    owed = defaultdict(Decimal)
+    for participant_id, total in Expense.objects.filter(
+        date__lte=end_date, paid_by__in=participants.values('pk'),
+    ).values('paid_by_id').annotate(total=Sum('amount')).values_list('paid_by_id', 'total'):
+        paid[participant_id] += total
+    for participant_id, total in ExpenseSplit.objects.filter(
+        expense__date__lte=end_date, participant__in=participants.values('pk'),
+    ).values('participant_id').annotate(total=Sum('share_amount')).values_list('participant_id', 'total'):
+        owed[participant_id] += total
+    for participant_id, archived_paid, archived_owed in ArchivedBalance.objects.filter(
+        participant__in=participants.values('pk'),
+    ).values_list('participant_id', 'paid', 'owed'):
+        paid[participant_id] += archived_paid
+        owed[participant_id] += archived_owed
+
+    for path in ArchiveSegment.objects.filter(last_date__gt=end_date).values_list('path', flat=True):
+        with ArchiveSegmentReader(path) as reader:
+            later = set()
+            for row in reader.iter_expenses():
+                if row['date'] > end_date:
+                    later.add(row['id'])
+                    if row['paid_by_id'] in paid:
+                        paid[row['paid_by_id']] -= row['amount']
+            for row in reader.iter_splits():
+                if row['expense_id'] in later and row['participant_id'] in owed:
+                    owed[row['participant_id']] -= row['share_amount']
+    return {pk: (paid[pk], owed[pk]) for pk in paid.keys() | owed.keys()}
+
+
+def collect_statements(year: 'int', month: 'int', participant_ids=None) -> 'list[Statement]':
+    """
+    取回整月資料並依參與者分組
+    查詢次數固定（參與者、付款、分攤、截至月底的累計收支），與參與者人數無關
+    """
+    start_date, end_date = month_range(year, month)
+    participants = Participant.objects.filter(is_active=True)
+    if participant_ids:
+        participants = participants.filter(pk__in=participant_ids)
+    balances = get_balances_as_of(end_date, participants)
+    zero = (Decimal('0'), Decimal('0'))
+    statements = {}
+    for pk, name, email in participants.values_list('pk', 'name', 'email'):
+        paid, owed = balances.get(pk, zero)
+        statements[pk] = Statement(
+            participant_id=pk, name=name, email=email,
+            start_date=start_date, end_date=end_date, balance=(paid - owed).quantize(CENT),
+        )
+
+    paid_rows = Expense.objects.filter(
+        date__range=(start_date, end_date), paid_by__in=participants.values('pk'),
+    ).order_by('date', 'time', 'pk').values_list('paid_by_id', 'date', 'item_name', 'category__name', 'amount')
+    for paid_by_id, day, item_name, category, amount in paid_rows:
+        statements[paid_by_id].paid.append({
+            'date': day, 'item_name': item_name, 'category': category or '未分類', 'amount': amount,
+        })
+
+    share_rows = ExpenseSplit.objects.filter(
+        expense__date__range=(start_date, end_date), participant__in=participants.values('pk'),
+    ).order_by('expense__date', 'expense__time', 'pk').values_list(
+        'participant_id', 'expense__date', 'expense__item_name', 'expense__category__name',
+        'expense__paid_by__name', 'share_amount',
+    )
+    for participant_id, day, item_name, category, paid_by, share_amount in share_rows:
+        statements[participant_id].shares.append({
+            'date': day, 'item_name': item_name, 'category': category or '未分類',
+            'paid_by': paid_by or '', 'share_amount': share_amount,
+        })
+    return list(statements.values())
+
+
+def _context(statement: 'Statement') -> 'dict':
+    paid_total, owed_total = statement.paid_total, statement.owed_total
+    return {
+        'name': statement.name,
+        'period_label': f'{statement.start_date:%Y 年 %m 月}',
+        'start_date': statement.start_date,
+        'end_date': statement.end_date,
+        'paid': statement.paid,
+        'shares': statement.shares,
+        'paid_total': paid_total,
+        'owed_total': owed_total,
+        'net': paid_total - owed_total,
+        'balance': statement.balance,
+    }
+
+
+def render_csv(statement: 'Statement') -> 'str':
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for row in statement.paid:
+        writer.writerow(['已付', row['date'].isoformat(), row['item_name'], row['category'], statement.name, row['amount']])
+    for row in statement.shares:
+        writer.writerow(['分攤', row['date'].isoformat(), row['item_name'], row['category'], row['paid_by'], row['share_amount']])
+    return buffer.getvalue()
+
+
+def render_statement(statement: 'Statement', output_dir: 'str') -> 'tuple[int, str, str]':
+    """產生 HTML 與 CSV 檔，回傳 (參與者 ID, HTML 路徑, CSV 路徑)；在子行程執行，不查資料庫"""
+    context = _context(statement)
+    paths = []
+    for suffix, content in (
+        ('.html', render_to_string('expense_tracker/statement.html', context)),
+        ('.csv', render_csv(statement)),
+    ):
+        path = os.path.join(output_dir, statement.filename + suffix)
+        # 先寫暫存檔再改名，避免寄送時讀到寫到一半的檔案；CSV 加 BOM 讓 Excel 正確判斷編碼
+        with open(path + '.tmp', 'w', encoding='utf-8-sig' if suffix == '.csv' else 'utf-8', newline='') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+        paths.append(path)
+    return statement.participant_id, paths[0], paths[1]
+
+
+def get_output_dir(year: 'int', month: 'int') -> 'Path':
+    return Path(settings.TMP_ROOT) / 'statements' / f'{year:04d}-{month:02d}'
+
+
+def render_statements(statements, output_dir, workers: 'int' = None, progress=None) -> 'dict':
+    """
+    以行程池平行產生對帳單檔案，回傳 {參與者 ID: (HTML 路徑, CSV 路徑)}
+    workers 為 1 時在目前行程產生
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    results = {}
+    if workers == 1 or len(statements) <= 1:
+        for statement in statements:
+            participant_id, html_path, csv_path = render_statement(statement, str(output_dir))
+            results[participant_id] = (html_path, csv_path)
+            if progress:
+                progress(len(results), len(statements))
+        return results
+
+    # fork 前關閉連線，子行程只做渲染不查資料庫
+    connections.close_all()
+    chunksize = max(1, len(statements) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        for participant_id, html_path, csv_path in pool.map(
+            render_statement, statements, [str(output_dir)] * len(statements), chunksize=chunksize,
+        ):
+            results[participant_id] = (html_path, csv_path)
+            if progress:
+                progress(len(results), len(statements))
+    return results
+
+
+def build_message(statement: 'Statement', html_path: 'str', csv_path: 'str', connection=None) -> 'EmailMultiAlternatives':
+    message = EmailMultiAlternatives(
+        subject=f'{statement.start_date:%Y 年 %m 月}對帳單',
+        body=render_to_string('expense_tracker/statement.txt', _context(statement)),
+        from_email=DEFAULT_FROM_EMAIL,
+        to=[statement.email],
+        connection=connection,
+    )
+    with open(html_path, encoding='utf-8') as f:
+        message.attach_alternative(f.read(), 'text/html')
+    message.attach_file(csv_path, 'text/csv')
+    return message
+
+
+def send_statements(statements, files: 'dict', batch_size: 'int' = EMAIL_BATCH_SIZE, progress=None) -> 'dict':
+    """
+    以 EMAIL_BACKEND 寄出對帳單；整批共用一條連線，每 batch_size 封呼叫一次 send_messages
+    沒有 Email 的參與者略過
+    """
+    recipients = [statement for statement in statements if statement.email and statement.participant_id in files]
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    connection.open()
+    try:
+        for start in range(0, len(recipients), batch_size):
+            batch = recipients[start:start + batch_size]
+            messages = [
+                build_message(statement, *files[statement.participant_id], connection=connection)
+                for statement in batch
+            ]
+            sent += connection.send_messages(messages) or 0
+            if progress:
+                progress(start + len(batch), len(recipients))
+    finally:
+        connection.close()
+    return {'sent': sent, 'skipped': len(statements) - len(recipients)}
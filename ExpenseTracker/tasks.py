@@ -0,0 +1,129 @@
+import csv
+import os
+
+from django.conf import settings
+
+from .anomaly import rebuild_statistics
+from .archive import archive_year
+from .budgets import queue_pending_alerts
+from .classifier import train_classifier
+from .forms import ExpenseFilterForm
+from .jobs import task
+from .models import Expense
+from .outbox import dispatch as dispatch_outbox_messages
+from .search import reindex_expenses as reindex_search
+from .services import calculate_settlement, get_participant_summary, apply_expense_filters
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def get_export_dir() -> 'str':
+    path = os.path.join(settings.TMP_ROOT, 'expense_exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@task('recalculate_settlement')
+def recalculate_settlement(ctx):
+    """重新計算分帳結算"""
+    ctx.set_progress(10, '計算參與者收支')
+    summaries = get_participant_summary()
+    ctx.set_progress(60, '簡化債務關係')
+    settlements = calculate_settlement()
+    return {
+        'settlements': settlements,
+        'summaries': summaries,
+    }
+
+
+@task('export_expenses')
+def export_expenses(ctx, filters=None):
+    """匯出記帳 CSV，篩選條件與記帳列表相同"""
+    queryset = Expense.objects.order_by('-date', '-time', '-pk')
+    filter_form = ExpenseFilterForm(filters or {})
+    if filter_form.is_valid():
+        queryset = apply_expense_filters(queryset, filter_form.cleaned_data)
+
+    # 先取出符合條件的主鍵清單再分批讀取，匯出期間新增或刪除記帳不會造成重複或遺漏
+    expense_ids = list(queryset.values_list('pk', flat=True))
+    total = len(expense_ids)
+    path = os.path.join(get_export_dir(), f'expenses-{ctx.job.pk}.csv')
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['日期', '時間', '品項', '類型', '金額', '付款人', '備註'])
+        # 每批查詢結束後才回報進度，避免讀取游標未關閉時寫入造成鎖定
+        for offset in range(0, total, EXPORT_CHUNK_SIZE):
+            chunk_ids = expense_ids[offset:offset + EXPORT_CHUNK_SIZE]
+            expenses = Expense.objects.select_related('category', 'paid_by').in_bulk(chunk_ids)
+            for pk in chunk_ids:
+                expense = expenses.get(pk)
+                if expense is None:
+                    # 匯出期間被刪除
+                    continue
+                writer.writerow([
+                    expense.date.isoformat(),
+                    expense.time.strftime('%H:%M'),
+                    expense.item_name,
+                    expense.category.name if expense.category else '未分類',
+                    expense.amount,
+                    expense.paid_by.name if expense.paid_by else '',
+                    expense.note,
+                ])
+            done = min(offset + EXPORT_CHUNK_SIZE, total)
+            ctx.set_progress(done * 100 // total, f'{done}/{total}')
+
+    return {
+        'path': path,
+        'filename': os.path.basename(path),
+        'rows': total,
+    }
+
+
+@task('rebuild_anomaly_stats')
+def rebuild_anomaly_stats(ctx):
+    """重建類型金額統計與異常記帳"""
+    return rebuild_statistics(
+        progress=lambda done, total: ctx.set_progress(done * 100 // max(total, 1), f'{done}/{total}'),
+    )
+
+
+@task('archive_expenses', max_attempts=1)
+def archive_expenses(ctx, year):
+    """封存已結束年度的記帳"""
+    ctx.set_progress(0, f'封存 {year} 年')
+    return archive_year(
+        year,
+        progress=lambda done, total: ctx.set_progress(done * 100 // max(total, 1), f'已封存 {done}/{total} 筆'),
+    )
+
+
+@task('reindex_expenses')
+def reindex_expenses(ctx):
+    """分批重建記帳搜尋索引"""
+    indexed = reindex_search(
+        progress=lambda done, total: ctx.set_progress(done * 100 // max(total, 1), f'{done}/{total}'),
+    )
+    return {'indexed': indexed}
+
+
+@task('train_category_classifier', max_attempts=1)
+def train_category_classifier(ctx, incremental=False):
+    """訓練記帳類型分類器並存檔"""
+    model = train_classifier(
+        incremental=incremental,
+        progress=lambda done, total: ctx.set_progress(done * 100 // max(total, 1), f'已學習 {done}/{total} 筆'),
+    )
+    return model.metrics
+
+
+@task('send_budget_alerts')
+def send_budget_alerts(ctx):
+    """把尚未通知的預算警示寫入 outbox"""
+    return queue_pending_alerts()
+
+
+@task('dispatch_outbox')
+def dispatch_outbox(ctx):
+    """依收件人合併 outbox 的通知並寄出"""
+    return dispatch_outbox_messages(worker_id=f'outbox:job-{ctx.job.pk}')
@@ -0,0 +1,78 @@
+from datetime import date, time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ExpenseTracker.models import Expense, ExpenseCategory, ExpenseSplit, Participant
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AdminQueryCountTests(TestCase):
+    """changelist 與編輯頁的查詢數不隨資料筆數增加"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.categories = [ExpenseCategory.objects.create(name=f'類型 {i}') for i in range(3)]
+        cls.participants = [Participant.objects.create(name=f'參與者 {i}') for i in range(4)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create_expenses(self, count: 'int') -> 'list[Expense]':
+        expenses = Expense.objects.bulk_create([
+            Expense(
+                date=date(2026, 1, 1 + i % 28), time=time(12, 0), item_name=f'item {i}', amount=Decimal('30'),
+                category=self.categories[i % len(self.categories)],
+                paid_by=self.participants[i % len(self.participants)],
+            )
+            for i in range(count)
+        ])
+        ExpenseSplit.objects.bulk_create([
+            ExpenseSplit(expense=expense, participant=participant, share_amount=Decimal('10'))
+            for expense in expenses
+            for participant in self.participants[:3]
+        ])
+        return expenses
+
+    def count_queries(self, url: 'str') -> 'int':
+        # 每次都從空的快取開始，比較的只有與資料筆數相關的查詢
+        cache.clear()
+        ContentType.objects.clear_cache()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assert_constant_queries(self, url: 'str'):
+        self.create_expenses(5)
+        few = self.count_queries(url)
+        self.create_expenses(15)
+        self.assertEqual(self.count_queries(url), few)
+        # 筆數已快取，記帳沒有異動時翻頁不再 COUNT(*)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertFalse([query for query in context if 'COUNT(' in query['sql'].upper()])
+
+    def test_expense_changelist(self):
+        self.assert_constant_queries(reverse('admin:ExpenseTracker_expense_changelist'))
+
+    def test_expense_split_changelist(self):
+        self.assert_constant_queries(reverse('admin:ExpenseTracker_expensesplit_changelist'))
+
+    def test_expense_change_form_with_split_inline(self):
+        expense, other = self.create_expenses(2)
+        url = reverse('admin:ExpenseTracker_expense_change', args=[expense.pk])
+        three_splits = self.count_queries(url)
+
+        ExpenseSplit.objects.create(expense=other, participant=self.participants[3], share_amount=Decimal('0'))
+        ExpenseSplit.objects.create(expense=expense, participant=self.participants[3], share_amount=Decimal('0'))
+        # 分攤列數增加時，參與者下拉選單與列標題不會逐列查詢
+        self.assertEqual(self.count_queries(url), three_splits)
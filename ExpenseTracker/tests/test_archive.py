@@ -0,0 +1,96 @@
+import tempfile
+from datetime import date, time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ExpenseTracker import ledger
+from ExpenseTracker.archive import ArchiveError, ArchiveSegmentReader, archive_year, iter_archived_expenses
+from ExpenseTracker.models import ArchiveSegment, Expense, ExpenseCategory, ExpenseSplit, Participant
+from ExpenseTracker.services import get_participant_balances, get_statistics
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ledger.clear()
+        self.addCleanup(ledger.clear)
+        for name in ('archive_root', 'tmp_root'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            setattr(self, name, directory.name)
+        settings = override_settings(ARCHIVE_ROOT=self.archive_root, TMP_ROOT=self.tmp_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        food = ExpenseCategory.objects.create(name='餐飲')
+        travel = ExpenseCategory.objects.create(name='交通')
+        alice = Participant.objects.create(name='Alice')
+        bob = Participant.objects.create(name='Bob')
+        rows = [
+            (date(2024, 3, 1), '午餐', food, '120.50', alice, '備註'),
+            (date(2024, 3, 1), '晚餐', food, '80.25', bob, ''),
+            (date(2024, 7, 9), '車票', travel, '45.00', alice, ''),
+            (date(2024, 12, 31), '點心', None, '9.99', None, ''),
+            (date(2025, 1, 2), '午餐', food, '60.00', bob, ''),
+        ]
+        for day, item_name, category, amount, payer, note in rows:
+            expense = Expense.objects.create(
+                date=day, time=time(12, 30, 15), item_name=item_name, category=category,
+                amount=Decimal(amount), paid_by=payer, note=note,
+            )
+            first = (Decimal(amount) / 3).quantize(Decimal('0.01'))
+            ExpenseSplit.objects.bulk_create([
+                ExpenseSplit(expense=expense, participant=alice, share_amount=first),
+                ExpenseSplit(expense=expense, participant=bob, share_amount=Decimal(amount) - first),
+            ])
+
+    def test_archived_rows_read_back_unchanged(self):
+        fields = ['id', 'date', 'time', 'item_name', 'category_id', 'amount', 'note', 'paid_by_id']
+        expenses = list(Expense.objects.filter(date__year=2024).order_by('pk').values(*fields))
+        splits = list(
+            ExpenseSplit.objects.filter(expense__date__year=2024).order_by('pk')
+            .values('id', 'expense_id', 'participant_id', 'share_amount')
+        )
+
+        result = archive_year(2024)
+
+        self.assertEqual((result['expenses'], result['splits']), (4, 8))
+        self.assertFalse(Expense.objects.filter(date__year=2024).exists())
+        self.assertFalse(ExpenseSplit.objects.filter(expense__date__year=2024).exists())
+        self.assertEqual(Expense.objects.count(), 1)
+        self.assertEqual(sorted(iter_archived_expenses(2024), key=lambda row: row['id']), expenses)
+        archived_splits = []
+        for path in ArchiveSegment.objects.values_list('path', flat=True):
+            with ArchiveSegmentReader(path) as reader:
+                archived_splits.extend(reader.iter_splits())
+        self.assertEqual(sorted(archived_splits, key=lambda row: row['id']), splits)
+
+    def test_statistics_and_balances_include_archived_rollups(self):
+        ranges = [
+            {'period': 'all'},
+            {'period': 'custom', 'start_date': date(2024, 3, 1), 'end_date': date(2024, 3, 31)},
+            {'period': 'custom', 'start_date': date(2024, 12, 1), 'end_date': date(2025, 1, 31)},
+        ]
+        before = [get_statistics(**kwargs) for kwargs in ranges]
+        balances = get_participant_balances()
+
+        archive_year(2024)
+
+        # 先以異動紀錄套用到既有快照，再整份重新載入，兩者都要包含封存彙總
+        for reload in (False, True):
+            if reload:
+                ledger.clear()
+            with self.subTest(reload=reload):
+                self.assertEqual([get_statistics(**kwargs) for kwargs in ranges], before)
+                self.assertEqual(get_participant_balances(), balances)
+        self.assertEqual(before[0]['total_amount'], 315.74)
+        self.assertEqual(before[0]['expense_count'], 5)
+
+    def test_current_year_cannot_be_archived(self):
+        with self.assertRaises(ArchiveError):
+            archive_year(timezone.localdate().year)
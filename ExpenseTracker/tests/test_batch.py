@@ -0,0 +1,113 @@
+import json
+from datetime import date, time
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ExpenseTracker import ledger
+from ExpenseTracker.batch import save_expense_batch
+from ExpenseTracker.models import ChangeLogEntry, Expense, ExpenseCategory, ExpenseSplit, OutboxMessage, Participant
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ExpenseBatchApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ledger.clear()
+        self.addCleanup(ledger.clear)
+        self.category = ExpenseCategory.objects.create(name='餐飲')
+        self.alice = Participant.objects.create(name='Alice')
+        self.bob = Participant.objects.create(name='Bob')
+
+    def item(self, **overrides):
+        item = {
+            'date': '2026-01-15', 'time': '12:00', 'item_name': '午餐', 'category': self.category.pk,
+            'amount': '30.00', 'paid_by': self.alice.pk, 'split_participants': [self.alice.pk, self.bob.pk],
+        }
+        item.update(overrides)
+        return item
+
+    def post(self, items):
+        response = self.client.post(
+            reverse('expense_tracker:expense_batch'), json.dumps({'expenses': items}), content_type='application/json',
+        )
+        return response.status_code, response.json()
+
+    def test_creates_expenses_with_splits(self):
+        status, data = self.post([
+            self.item(),
+            self.item(item_name='晚餐', splits=[
+                {'participant': self.alice.pk, 'share_amount': '10.00'},
+                {'participant': self.bob.pk, 'share_amount': '20.00'},
+            ]),
+        ])
+
+        self.assertEqual(status, 200)
+        self.assertTrue(data['saved'])
+        self.assertEqual(Expense.objects.count(), 2)
+        self.assertEqual(
+            sorted(ExpenseSplit.objects.values_list('expense__item_name', 'participant__name', 'share_amount')),
+            [('午餐', 'Alice', 15), ('午餐', 'Bob', 15), ('晚餐', 'Alice', 10), ('晚餐', 'Bob', 20)],
+        )
+
+    def test_non_finite_share_amount_is_rejected(self):
+        for share_amount in ('NaN', 'sNaN', '-Infinity'):
+            with self.subTest(share_amount=share_amount):
+                status, data = self.post([self.item(splits=[
+                    {'participant': self.alice.pk, 'share_amount': share_amount},
+                ])])
+
+                self.assertEqual(status, 400)
+                self.assertFalse(data['saved'])
+                self.assertIn('splits', data['results'][0]['errors'])
+        self.assertFalse(Expense.objects.exists())
+
+    def existing_expense(self):
+        expense = Expense.objects.create(
+            date=date(2026, 1, 1), time=time(9, 0), item_name='早餐', amount=Decimal('20'),
+            category=self.category, paid_by=self.bob,
+        )
+        ExpenseSplit.objects.create(expense=expense, participant=self.bob, share_amount=Decimal('20'))
+        return expense
+
+    def snapshot(self):
+        return (
+            list(Expense.objects.order_by('pk').values_list('pk', 'item_name', 'amount', 'paid_by_id')),
+            list(ExpenseSplit.objects.order_by('pk').values_list('pk', 'expense_id', 'participant_id', 'share_amount')),
+            ChangeLogEntry.objects.count(),
+            OutboxMessage.objects.count(),
+        )
+
+    def test_one_invalid_item_rejects_the_whole_batch(self):
+        expense = self.existing_expense()
+        before = self.snapshot()
+
+        status, data = self.post([
+            self.item(),
+            self.item(id=expense.pk, item_name='早午餐', amount='40.00'),
+            self.item(item_name='晚餐', paid_by=999999),
+        ])
+
+        self.assertEqual(status, 400)
+        self.assertFalse(data['saved'])
+        self.assertEqual([result['ok'] for result in data['results']], [True, True, False])
+        self.assertIn('paid_by', data['results'][2]['errors'])
+        self.assertEqual(self.snapshot(), before)
+
+    def test_failure_while_writing_rolls_back_every_item(self):
+        expense = self.existing_expense()
+        before = self.snapshot()
+
+        # 記帳、舊分攤的刪除與新分攤都已寫入後才失敗
+        with mock.patch('ExpenseTracker.batch.apply_spending', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            save_expense_batch([
+                self.item(),
+                self.item(id=expense.pk, item_name='早午餐', amount='40.00'),
+            ])
+
+        self.assertEqual(self.snapshot(), before)
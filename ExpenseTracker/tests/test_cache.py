@@ -0,0 +1,45 @@
+import multiprocessing
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from ExpenseTracker import cache as data_cache
+
+PROCESSES = 4
+BUMPS = 50
+
+
+def _bump_many(count: 'int'):
+    for _ in range(count):
+        data_cache._incr_data_version(data_cache.EXPENSE)
+
+
+class FileCacheVersionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.cache_dir,
+            }
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_concurrent_bumps_from_processes_are_not_lost(self):
+        initial = data_cache.get_data_version(data_cache.EXPENSE)
+
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_bump_many, args=(BUMPS,)) for _ in range(PROCESSES)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([worker.exitcode for worker in workers], [0] * PROCESSES)
+
+        cache.close()
+        self.assertEqual(data_cache.get_data_version(data_cache.EXPENSE), initial + PROCESSES * BUMPS)
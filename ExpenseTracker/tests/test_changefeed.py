@@ -0,0 +1,92 @@
+from datetime import date, time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ExpenseTracker import ledger
+from ExpenseTracker.batch import delete_expenses
+from ExpenseTracker.changefeed import get_changes
+from ExpenseTracker.models import Expense, ExpenseSplit, Participant
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ledger.clear()
+        self.addCleanup(ledger.clear)
+        self.alice = Participant.objects.create(name='Alice')
+        self.since = self.latest_cursor()
+
+    def latest_cursor(self):
+        cursor, has_more = 0, True
+        while has_more:
+            page = get_changes(since=cursor)
+            cursor, has_more = page['cursor'], page['has_more']
+        return cursor
+
+    def add(self, item_name, amount='30'):
+        expense = Expense.objects.create(
+            date=date(2026, 1, 15), time=time(12, 0), item_name=item_name, amount=Decimal(amount), paid_by=self.alice,
+        )
+        split = ExpenseSplit.objects.create(expense=expense, participant=self.alice, share_amount=Decimal(amount))
+        return expense, split
+
+    def test_repeated_changes_collapse_to_the_latest_state(self):
+        expense, _ = self.add('午餐')
+        for amount in ('40', '50'):
+            expense.amount = Decimal(amount)
+            expense.save()
+
+        page = get_changes(since=self.since)
+
+        upserts = page['changes']['expense']['upserts']
+        self.assertEqual([(row['id'], row['amount']) for row in upserts], [(expense.pk, Decimal('50'))])
+        self.assertEqual(page['changes']['expense']['deletes'], [])
+
+    def test_deleted_rows_are_returned_as_tombstones(self):
+        created, created_split = self.add('午餐')
+        deleted, deleted_split = self.add('晚餐')
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        changes = get_changes(since=self.since)['changes']
+
+        # 新增後又刪除只剩 tombstone，不回傳資料
+        self.assertEqual([row['id'] for row in changes['expense']['upserts']], [created.pk])
+        self.assertEqual(changes['expense']['deletes'], [deleted_id])
+        self.assertEqual([row['id'] for row in changes['expense_split']['upserts']], [created_split.pk])
+        self.assertEqual(changes['expense_split']['deletes'], [deleted_split.pk])
+
+    def test_batch_delete_writes_tombstones(self):
+        expenses = [self.add(f'品項 {i}')[0] for i in range(3)]
+        cursor = self.latest_cursor()
+
+        delete_expenses(Expense.objects.filter(pk__in=[expense.pk for expense in expenses[:2]]), notify=False)
+
+        changes = get_changes(since=cursor)['changes']
+        self.assertEqual(changes['expense']['deletes'], sorted(expense.pk for expense in expenses[:2]))
+        self.assertEqual(changes['expense']['upserts'], [])
+
+    def test_paging_resumes_from_the_cursor(self):
+        expenses = [self.add(f'品項 {i}')[0] for i in range(3)]
+
+        seen, cursor, has_more = [], self.since, True
+        while has_more:
+            page = get_changes(since=cursor, limit=2)
+            seen.extend(row['id'] for row in page['changes']['expense']['upserts'])
+            cursor, has_more = page['cursor'], page['has_more']
+
+        self.assertEqual(sorted(seen), [expense.pk for expense in expenses])
+        self.assertEqual(get_changes(since=cursor)['changes']['expense']['upserts'], [])
+
+    def test_api_returns_the_feed(self):
+        expense, _ = self.add('午餐')
+
+        response = self.client.get(reverse('expense_tracker:change_feed'), {'since': self.since})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['changes']['expense']['upserts']], [expense.pk])
@@ -0,0 +1,55 @@
+from datetime import date, time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ExpenseTracker import ledger
+from ExpenseTracker.models import Expense, ExpenseCategory
+from ExpenseTracker.services import DAILY_SERIES_MAX_DAYS
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ledger.clear()
+        self.addCleanup(ledger.clear)
+        category = ExpenseCategory.objects.create(name='餐飲')
+        Expense.objects.create(
+            date=date(2026, 1, 15), time=time(12, 0), item_name='午餐', amount=Decimal('120'), category=category,
+        )
+
+    def get(self, **params):
+        return self.client.get(reverse('expense_tracker:dashboard_api'), params)
+
+    def test_custom_range_returns_one_entry_per_day(self):
+        response = self.get(start_date='2026-01-01', end_date='2026-01-31')
+
+        self.assertEqual(response.status_code, 200)
+        daily = response.json()['daily']
+        self.assertEqual(len(daily), 31)
+        self.assertEqual([row['total'] for row in daily if row['count']], [120.0])
+
+    def test_custom_range_longer_than_limit_is_rejected(self):
+        response = self.get(start_date='6000-01-01', end_date='9999-12-31')
+        self.assertEqual(response.status_code, 400)
+
+        # 只給一端時另一端取資料的日期，同樣受限
+        self.assertEqual(self.get(start_date='2000-01-01').status_code, 400)
+
+        end = date(2026, 1, 1).toordinal() + DAILY_SERIES_MAX_DAYS - 1
+        response = self.get(start_date='2026-01-01', end_date=date.fromordinal(end).isoformat())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['daily']), DAILY_SERIES_MAX_DAYS)
+
+    def test_range_at_date_min_has_no_previous_period(self):
+        response = self.get(start_date='0001-01-01', end_date='0001-01-02')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIsNone(data['previous'])
+        self.assertIsNone(data['comparison'])
+        self.assertEqual(len(data['daily']), 2)
@@ -0,0 +1,184 @@
+import csv
+import tempfile
+import time as time_module
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from ExpenseTracker import jobs, tasks
+from ExpenseTracker.jobs import enqueue, task, work
+from ExpenseTracker.models import Expense, Job
+
+
+calls = []
+
+
+@task('test_jobs.add')
+def add(ctx, a, b):
+    ctx.set_progress(50, '計算中')
+    return {'sum': a + b}
+
+
+@task('test_jobs.flaky', max_attempts=2)
+def flaky(ctx):
+    calls.append(ctx.job.attempts)
+    if len(calls) == 1:
+        raise RuntimeError('first attempt fails')
+    return {'attempts': ctx.job.attempts}
+
+
+@task('test_jobs.broken', max_attempts=1)
+def broken(ctx):
+    raise ValueError('always fails')
+
+
+@task('test_jobs.slow')
+def slow(ctx, seconds):
+    time_module.sleep(seconds)
+    return {}
+
+
+@task('test_jobs.taken_over')
+def taken_over(ctx):
+    # 模擬執行太久被判定失聯，由另一個 worker 接手
+    Job.objects.filter(pk=ctx.job.pk).update(locked_by='other-worker')
+    return {'stale': True}
+
+
+class WorkerTests(TransactionTestCase):
+    """worker 迴圈會關閉舊連線，不能在 TestCase 的交易內執行"""
+
+    def setUp(self):
+        calls.clear()
+
+    def run_worker_once(self) -> 'int':
+        return work(worker_id='test-worker', poll_interval=0, once=True)
+
+    def test_runs_job_to_completion(self):
+        job = enqueue('test_jobs.add', {'a': 1, 'b': 2})
+
+        self.assertEqual(self.run_worker_once(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result, {'sum': 3})
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.locked_by, '')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = enqueue('test_jobs.flaky')
+
+        before = timezone.now()
+        self.assertEqual(self.run_worker_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('first attempt fails', job.error)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=jobs.RETRY_BACKOFF))
+
+        # 尚未到重試時間不會被取出
+        self.assertEqual(self.run_worker_once(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(self.run_worker_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result, {'attempts': 2})
+        self.assertEqual(calls, [1, 2])
+
+    def test_job_fails_after_max_attempts(self):
+        job = enqueue('test_jobs.broken')
+
+        self.assertEqual(self.run_worker_once(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('always fails', job.error)
+        self.assertIsNotNone(job.finished_at)
+
+    def mark_running(self, job, heartbeat_age, attempts=1):
+        stale_at = timezone.now() - timedelta(seconds=heartbeat_age)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.STATUS_RUNNING,
+            locked_by='dead-worker',
+            attempts=attempts,
+            started_at=timezone.now() - timedelta(seconds=jobs.STALE_AFTER * 2),
+            heartbeat_at=stale_at,
+        )
+
+    def test_stale_running_job_is_requeued(self):
+        job = enqueue('test_jobs.add', {'a': 2, 'b': 3})
+        self.mark_running(job, heartbeat_age=jobs.STALE_AFTER + 1)
+
+        self.assertEqual(self.run_worker_once(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result, {'sum': 5})
+        self.assertEqual(job.attempts, 2)
+
+    def test_long_job_with_recent_heartbeat_is_not_requeued(self):
+        job = enqueue('test_jobs.add', {'a': 2, 'b': 3})
+        # 已執行超過 STALE_AFTER，但心跳還在
+        self.mark_running(job, heartbeat_age=1)
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.STATUS_RUNNING, 'dead-worker'))
+
+    def test_stale_job_without_attempts_left_is_failed(self):
+        job = enqueue('test_jobs.broken')
+        self.mark_running(job, heartbeat_age=jobs.STALE_AFTER + 1)
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+        self.assertEqual(self.run_worker_once(), 0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.locked_by, '')
+        self.assertIn('心跳', job.error)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_heartbeat_is_refreshed_while_running(self):
+        job = enqueue('test_jobs.slow', {'seconds': 0.5})
+
+        with mock.patch.object(jobs, 'HEARTBEAT_INTERVAL', 0.05):
+            self.assertEqual(self.run_worker_once(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertGreater(job.heartbeat_at, job.started_at + timedelta(seconds=0.2))
+
+    def test_result_of_taken_over_job_is_discarded(self):
+        job = enqueue('test_jobs.taken_over')
+
+        self.assertEqual(self.run_worker_once(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.STATUS_RUNNING, 'other-worker'))
+        self.assertIsNone(job.result)
+
+    def test_export_expenses_writes_every_row_once(self):
+        # 日期與時間都相同，只靠主鍵決定順序
+        Expense.objects.bulk_create([
+            Expense(date=date(2026, 1, 1), time=time(12, 0), item_name=f'item {i}', amount=Decimal('10'))
+            for i in range(25)
+        ])
+        with tempfile.TemporaryDirectory() as tmp_root, override_settings(TMP_ROOT=tmp_root), \
+                mock.patch.object(tasks, 'EXPORT_CHUNK_SIZE', 10):
+            job = enqueue('export_expenses')
+            self.assertEqual(self.run_worker_once(), 1)
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+            self.assertEqual(job.result['rows'], 25)
+            with open(job.result['path'], encoding='utf-8-sig') as f:
+                rows = list(csv.reader(f))[1:]
+        self.assertEqual(sorted(row[2] for row in rows), sorted(f'item {i}' for i in range(25)))
@@ -0,0 +1,137 @@
+import random
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.test import TestCase, override_settings
+
+from ExpenseTracker import ledger
+from ExpenseTracker.batch import delete_expenses
+from ExpenseTracker.search import index_queue
+from ExpenseTracker.models import Expense, ExpenseCategory, ExpenseSplit, Participant
+
+
+def cents(value) -> 'int':
+    return int(value * 100)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LedgerSnapshotTests(TestCase):
+    """快照的彙總需與直接以 ORM Sum 查詢的結果一致"""
+
+    def setUp(self):
+        cache.clear()
+        ledger.clear()
+        self.addCleanup(ledger.clear)
+        # 提交後的回呼會排入搜尋索引，與快照無關，不啟動背景寫入
+        patcher = mock.patch.object(index_queue, 'add')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.random = random.Random(20260115)
+        self.categories = [ExpenseCategory.objects.create(name=f'類型 {i}') for i in range(4)] + [None]
+        self.participants = [Participant.objects.create(name=f'參與者 {i}') for i in range(5)]
+        for _ in range(200):
+            self.add()
+
+    def add(self):
+        amount = Decimal(self.random.randint(1, 500000)) / 100
+        expense = Expense.objects.create(
+            date=date(2025, 12, 1) + timedelta(days=self.random.randint(0, 90)), time=time(12, 0),
+            item_name='品項', amount=amount, category=self.random.choice(self.categories),
+            paid_by=self.random.choice(self.participants + [None]),
+        )
+        people = self.random.sample(self.participants, self.random.randint(1, len(self.participants)))
+        share = (amount / len(people)).quantize(Decimal('0.01'))
+        for person in people:
+            ExpenseSplit.objects.create(expense=expense, participant=person, share_amount=share)
+        return expense
+
+    def expected_category_totals(self, start_date=None, end_date=None):
+        queryset = Expense.objects.all()
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+        rows = queryset.values('category_id').annotate(total=Sum('amount'), count=Count('id'))
+        return {row['category_id']: (cents(row['total']), row['count']) for row in rows}
+
+    def expected_participant_totals(self):
+        paid = dict(
+            Expense.objects.exclude(paid_by=None).values('paid_by_id').annotate(total=Sum('amount'))
+            .values_list('paid_by_id', 'total')
+        )
+        owed = dict(
+            ExpenseSplit.objects.values('participant_id').annotate(total=Sum('share_amount'))
+            .values_list('participant_id', 'total')
+        )
+        return {
+            pk: (cents(paid.get(pk, Decimal('0'))), cents(owed.get(pk, Decimal('0'))))
+            for pk in paid.keys() | owed.keys()
+        }
+
+    def expected_spending_groups(self, start_date, end_date, mode):
+        if mode == 'paid':
+            rows = Expense.objects.filter(date__range=(start_date, end_date)).exclude(paid_by=None).values_list(
+                'paid_by_id', 'category_id',
+            ).annotate(total=Sum('amount'))
+        else:
+            rows = ExpenseSplit.objects.filter(expense__date__range=(start_date, end_date)).values_list(
+                'participant_id', 'expense__category_id',
+            ).annotate(total=Sum('share_amount'))
+        return {(person, category): cents(total) for person, category, total in rows}
+
+    def assertMatchesOrm(self, snapshot):
+        ranges = [(None, None), (date(2026, 1, 1), date(2026, 1, 31)), (date(2025, 12, 15), None)]
+        for start_date, end_date in ranges:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                self.assertEqual(
+                    snapshot.category_totals(start_date, end_date), self.expected_category_totals(start_date, end_date),
+                )
+        self.assertEqual(snapshot.participant_totals(), self.expected_participant_totals())
+
+        start_date, end_date = date(2026, 1, 1), date(2026, 1, 31)
+        daily = {day: (total, count) for day, total, count in snapshot.daily_totals(start_date, end_date) if count}
+        expected = {
+            row['date']: (cents(row['total']), row['count'])
+            for row in Expense.objects.filter(date__range=(start_date, end_date))
+            .values('date').annotate(total=Sum('amount'), count=Count('id'))
+        }
+        self.assertEqual(daily, expected)
+        for mode in ('share', 'paid'):
+            with self.subTest(mode=mode):
+                self.assertEqual(
+                    {(person, category): total for person, category, total in snapshot.spending_groups(
+                        start_date, end_date, mode=mode,
+                    )},
+                    self.expected_spending_groups(start_date, end_date, mode),
+                )
+
+    def test_loaded_snapshot_matches_orm_sums(self):
+        self.assertMatchesOrm(ledger.get_ledger_snapshot())
+
+    def test_refreshed_snapshot_matches_orm_sums(self):
+        ledger.get_ledger_snapshot()
+
+        # 資料版本號在交易提交後才遞增
+        with self.captureOnCommitCallbacks(execute=True):
+            expenses = list(Expense.objects.order_by('pk')[:30])
+            for expense in expenses[:10]:
+                expense.amount += Decimal('1.23')
+                expense.category = self.random.choice(self.categories)
+                expense.save()
+            for expense in expenses[10:15]:
+                expense.delete()
+            ExpenseSplit.objects.filter(expense__in=expenses[15:20]).first().delete()
+            delete_expenses(Expense.objects.filter(pk__in=[expense.pk for expense in expenses[20:30]]), notify=False)
+            for _ in range(10):
+                self.add()
+
+        snapshot = ledger.get_ledger_snapshot()
+        self.assertMatchesOrm(snapshot)
+
+        ledger.clear()
+        reloaded = ledger.get_ledger_snapshot()
+        self.assertIsNot(reloaded, snapshot)
+        self.assertMatchesOrm(reloaded)
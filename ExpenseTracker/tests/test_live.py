@@ -0,0 +1,52 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from ExpenseTracker import live
+
+
+def make_snapshot(**stats) -> 'dict':
+    return {
+        'date': '2026-01-15',
+        'stats': {period: dict(stats) for period in live.PERIODS},
+        'settlement': {'settlements': []},
+    }
+
+
+class BroadcasterTests(SimpleTestCase):
+
+    def test_slow_subscriber_sees_every_change_after_overflow(self):
+        broadcaster = live.Broadcaster()
+        fields = {f'field_{i}': 0 for i in range(live.CLIENT_QUEUE_SIZE * 2)}
+
+        async def run():
+            _, queue = broadcaster.subscribe('all')
+            broadcaster.receive(make_snapshot(**fields))
+            # 每次只改一個欄位，連線不讀取，佇列早就滿了
+            for i, name in enumerate(fields, start=1):
+                fields[name] = i
+                broadcaster.receive(make_snapshot(**fields))
+                await asyncio.sleep(0)
+            self.assertLessEqual(queue.qsize(), live.CLIENT_QUEUE_SIZE)
+
+            state = {}
+            while not queue.empty():
+                state.update(queue.get_nowait())
+            return state
+
+        state = asyncio.run(run())
+
+        self.assertEqual({name: state[name] for name in fields}, fields)
+        self.assertIn('settlement', state)
+
+    def test_unchanged_snapshot_sends_nothing(self):
+        broadcaster = live.Broadcaster()
+
+        async def run():
+            _, queue = broadcaster.subscribe('day')
+            broadcaster.receive(make_snapshot(total_amount=1))
+            broadcaster.receive(make_snapshot(total_amount=1))
+            await asyncio.sleep(0)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(len(asyncio.run(run())), 1)
@@ -0,0 +1,282 @@
+from datetime import date, time, timedelta
+from decimal import Decimal
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ExpenseTracker import outbox
+from ExpenseTracker.batch import delete_expenses, reassign_payer, recategorize_expenses, resplit_expenses_evenly, save_expense_batch
+from ExpenseTracker.models import Expense, ExpenseCategory, Job, OutboxMessage, Participant
+
+
+class FakeSMTPBackend(locmem.EmailBackend):
+    """記錄開啟的連線數；refused 內的收件人被拒，disconnect_on 內的收件人讓連線中斷"""
+    opened = 0
+    refused = set()
+    disconnect_on = set()
+    fail_open = False
+
+    def open(self):
+        if FakeSMTPBackend.fail_open:
+            raise SMTPServerDisconnected('connection refused')
+        FakeSMTPBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            recipients = set(message.to)
+            if recipients & FakeSMTPBackend.refused:
+                raise SMTPRecipientsRefused({recipient: (550, b'no such user') for recipient in recipients})
+            if recipients & FakeSMTPBackend.disconnect_on:
+                raise SMTPServerDisconnected('server went away')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='ExpenseTracker.tests.test_outbox.FakeSMTPBackend')
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        FakeSMTPBackend.opened = 0
+        FakeSMTPBackend.refused = set()
+        FakeSMTPBackend.disconnect_on = set()
+        FakeSMTPBackend.fail_open = False
+
+    def add(self, recipient, subject='記帳新增：午餐', body='內容'):
+        return outbox.add([(recipient, outbox.KIND_EXPENSE, subject, body)])[0]
+
+    def make_due(self):
+        OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING).update(next_attempt_at=timezone.now())
+
+    def test_messages_to_one_recipient_are_coalesced_into_a_digest(self):
+        for subject in ('記帳新增：午餐', '記帳更新：晚餐', '記帳刪除：咖啡'):
+            self.add('a@example.com', subject)
+        self.add('b@example.com', '記帳新增：早餐')
+
+        result = outbox.dispatch()
+
+        self.assertEqual(result, {'emails': 2, 'messages': 4, 'retry': 0, 'failed': 0})
+        emails = {email.to[0]: email for email in mail.outbox}
+        self.assertEqual(emails['a@example.com'].subject, '記帳通知：3 則更新')
+        for subject in ('記帳新增：午餐', '記帳更新：晚餐', '記帳刪除：咖啡'):
+            self.assertIn(subject, emails['a@example.com'].body)
+        self.assertEqual(emails['b@example.com'].subject, '記帳新增：早餐')
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.STATUS_SENT).exists())
+
+    def test_one_connection_per_batch(self):
+        for i in range(5):
+            self.add(f'user{i}@example.com')
+
+        outbox.dispatch(batch_size=2)
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(FakeSMTPBackend.opened, 3)
+
+    def test_refused_recipient_does_not_affect_others(self):
+        self.add('a@example.com')
+        self.add('bad@example.com')
+        self.add('c@example.com')
+        FakeSMTPBackend.refused = {'bad@example.com'}
+
+        before = timezone.now()
+        result = outbox.dispatch()
+
+        self.assertEqual(result['emails'], 2)
+        self.assertEqual(result['retry'], 1)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ['a@example.com', 'c@example.com'])
+        refused = OutboxMessage.objects.get(recipient='bad@example.com')
+        self.assertEqual(refused.status, OutboxMessage.STATUS_PENDING)
+        self.assertEqual(refused.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', refused.last_error)
+        self.assertGreaterEqual(refused.next_attempt_at, before + timedelta(seconds=outbox.RETRY_BACKOFF))
+
+    def test_disconnect_defers_rest_of_batch(self):
+        for recipient in ('a@example.com', 'b@example.com', 'c@example.com'):
+            self.add(recipient)
+        FakeSMTPBackend.disconnect_on = {'b@example.com'}
+
+        result = outbox.dispatch()
+
+        # 依收件人排序寄出：a 已寄出，b 與之後的 c 一起延後
+        self.assertEqual([email.to[0] for email in mail.outbox], ['a@example.com'])
+        self.assertEqual(result['retry'], 2)
+        self.assertEqual(
+            set(OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING).values_list('recipient', flat=True)),
+            {'b@example.com', 'c@example.com'},
+        )
+
+    def test_backoff_schedule_then_failure(self):
+        message = self.add('a@example.com')
+        FakeSMTPBackend.fail_open = True
+
+        for attempt in range(1, outbox.MAX_ATTEMPTS):
+            self.make_due()
+            before = timezone.now()
+            outbox.dispatch()
+            message.refresh_from_db()
+            self.assertEqual(message.status, OutboxMessage.STATUS_PENDING)
+            self.assertEqual(message.attempts, attempt)
+            delay = timedelta(seconds=outbox.RETRY_BACKOFF * 2 ** (attempt - 1))
+            self.assertGreaterEqual(message.next_attempt_at, before + delay)
+            self.assertLess(message.next_attempt_at, timezone.now() + delay)
+
+        self.make_due()
+        result = outbox.dispatch()
+        message.refresh_from_db()
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(message.status, OutboxMessage.STATUS_FAILED)
+        self.assertEqual(message.attempts, outbox.MAX_ATTEMPTS)
+
+    def test_requeue_stale_messages(self):
+        stale = self.add('a@example.com')
+        fresh = self.add('b@example.com')
+        now = timezone.now()
+        OutboxMessage.objects.filter(pk=stale.pk).update(
+            status=OutboxMessage.STATUS_SENDING, locked_by='dead-worker',
+            locked_at=now - timedelta(seconds=outbox.STALE_AFTER + 1),
+        )
+        OutboxMessage.objects.filter(pk=fresh.pk).update(
+            status=OutboxMessage.STATUS_SENDING, locked_by='live-worker', locked_at=now,
+        )
+
+        self.assertEqual(outbox.requeue_stale_messages(), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), (OutboxMessage.STATUS_PENDING, ''))
+        self.assertEqual((fresh.status, fresh.locked_by), (OutboxMessage.STATUS_SENDING, 'live-worker'))
+
+    def test_schedule_dispatch_keeps_one_pending_job_and_moves_it_earlier(self):
+        now = timezone.now()
+        outbox.schedule_dispatch(now + timedelta(minutes=10))
+        outbox.schedule_dispatch(now + timedelta(minutes=20))
+        outbox.schedule_dispatch(now + timedelta(minutes=1))
+
+        jobs = Job.objects.filter(task=outbox.DISPATCH_TASK, status=Job.STATUS_PENDING)
+        self.assertEqual(jobs.count(), 1)
+        self.assertEqual(jobs.get().run_after, now + timedelta(minutes=1))
+
+    def test_duplicate_dispatch_jobs_do_not_send_twice(self):
+        self.add('a@example.com')
+        # 與排入競爭時可能多出一個寄送工作
+        first = outbox.claim_batch(10, 'worker-1')
+        second = outbox.claim_batch(10, 'worker-2')
+
+        self.assertEqual(list(first), ['a@example.com'])
+        self.assertEqual(second, {})
+
+
+class BulkNotificationTests(TestCase):
+    """批次 API 與列表 / admin 的批次操作和單筆編輯一樣寫入通知，每批只寫入一次"""
+
+    def setUp(self):
+        self.food, self.travel = ExpenseCategory.objects.create(name='餐飲'), ExpenseCategory.objects.create(name='交通')
+        self.alice = Participant.objects.create(name='Alice', email='alice@example.com')
+        self.bob = Participant.objects.create(name='Bob', email='bob@example.com')
+        self.carol = Participant.objects.create(name='Carol', email='carol@example.com')
+
+    def create_expenses(self, count, payer=None, split_with=(), name='午餐'):
+        payer = payer or self.alice
+        expenses = []
+        for i in range(count):
+            expense = Expense.objects.create(
+                date=date(2026, 1, 1 + i), time=time(12, 0), item_name=f'{name} {i}', amount=Decimal('30'),
+                category=self.food, paid_by=payer,
+            )
+            for participant in split_with:
+                expense.splits.create(participant=participant, share_amount=Decimal('30') / len(split_with))
+            expenses.append(expense)
+        OutboxMessage.objects.all().delete()
+        return expenses
+
+    def notified(self) -> 'dict[str, list[str]]':
+        recipients = {}
+        for recipient, subject in OutboxMessage.objects.order_by('recipient', 'subject').values_list('recipient', 'subject'):
+            recipients.setdefault(recipient, []).append(subject)
+        return recipients
+
+    def run_bulk(self, func, *args, **kwargs):
+        with mock.patch.object(outbox, 'add', wraps=outbox.add) as add:
+            result = func(*args, **kwargs)
+        self.assertEqual(add.call_count, 1)
+        return result
+
+    def test_bulk_delete_notifies_payer_and_sharers(self):
+        self.create_expenses(3, split_with=[self.alice, self.bob])
+
+        self.run_bulk(delete_expenses, Expense.objects.all())
+
+        subjects = ['記帳刪除：午餐 0', '記帳刪除：午餐 1', '記帳刪除：午餐 2']
+        self.assertEqual(self.notified(), {'alice@example.com': subjects, 'bob@example.com': subjects})
+        self.assertEqual(Job.objects.filter(task=outbox.DISPATCH_TASK).count(), 1)
+
+        # 寄送時每位收件人合併成一封摘要
+        result = outbox.dispatch()
+        self.assertEqual(result['emails'], 2)
+        self.assertEqual({email.subject for email in mail.outbox}, {'記帳通知：3 則更新'})
+
+    def test_archive_delete_is_silent(self):
+        self.create_expenses(2, split_with=[self.bob])
+
+        delete_expenses(Expense.objects.all(), max_items=None, notify=False)
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_recategorize_notifies_current_members(self):
+        self.create_expenses(2, split_with=[self.bob])
+
+        self.assertEqual(self.run_bulk(recategorize_expenses, Expense.objects.all(), self.travel), 2)
+
+        self.assertEqual(set(self.notified()), {'alice@example.com', 'bob@example.com'})
+        body = OutboxMessage.objects.filter(recipient='bob@example.com').values_list('body', flat=True)[0]
+        self.assertIn('Bob 分攤 30', body)
+
+    def test_reassign_payer_notifies_previous_payer(self):
+        self.create_expenses(1, split_with=[self.bob])
+
+        self.run_bulk(reassign_payer, Expense.objects.all(), self.carol)
+
+        self.assertEqual(set(self.notified()), {'alice@example.com', 'bob@example.com', 'carol@example.com'})
+        alice = OutboxMessage.objects.get(recipient='alice@example.com')
+        self.assertIn('Alice 已不在這筆記帳中', alice.body)
+        self.assertIn('Carol 付款', alice.body)
+
+    def test_resplit_notifies_only_changed_expenses(self):
+        unchanged = self.create_expenses(1, split_with=[self.alice, self.carol], name='晚餐')[0]
+        changed = self.create_expenses(1, split_with=[self.bob])[0]
+
+        self.run_bulk(resplit_expenses_evenly, Expense.objects.all(), [self.alice, self.carol])
+
+        # 第一筆原本就由 Alice 與 Carol 平均分攤，不通知；第二筆移除的 Bob 也會收到
+        self.assertEqual(
+            self.notified(),
+            {email: [f'記帳更新：{changed.item_name}'] for email in ('alice@example.com', 'bob@example.com', 'carol@example.com')},
+        )
+        self.assertNotIn(unchanged.item_name, ''.join(OutboxMessage.objects.values_list('body', flat=True)))
+
+    def test_batch_api_notifies_created_and_updated_expenses(self):
+        existing = self.create_expenses(1, split_with=[self.bob])[0]
+        item = {'date': '2026-02-01', 'time': '12:00', 'category': self.food.pk, 'amount': '20.00', 'paid_by': self.alice.pk}
+
+        saved, _ = self.run_bulk(save_expense_batch, [
+            dict(item, item_name='早餐', split_participants=[self.carol.pk]),
+            dict(item, id=existing.pk, item_name='午餐改', split_participants=[self.alice.pk]),
+        ])
+
+        self.assertTrue(saved)
+        self.assertEqual(self.notified(), {
+            'alice@example.com': ['記帳新增：早餐', '記帳更新：午餐改'],
+            'bob@example.com': ['記帳更新：午餐改'],
+            'carol@example.com': ['記帳新增：早餐'],
+        })
+
+    def test_batch_rolled_back_writes_no_notifications(self):
+        item = {'date': '2026-02-01', 'time': '12:00', 'category': self.food.pk, 'amount': '20.00', 'paid_by': self.alice.pk}
+
+        saved, _ = save_expense_batch([dict(item, item_name='早餐'), dict(item, item_name='', paid_by=999)])
+
+        self.assertFalse(saved)
+        self.assertFalse(OutboxMessage.objects.exists())
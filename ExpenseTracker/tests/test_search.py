@@ -0,0 +1,109 @@
+from datetime import date, time
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase
+
+from ExpenseTracker import search
+from ExpenseTracker.models import Expense, ExpenseCategory
+from ExpenseTracker.search import SearchQuery, keyword_filter, reindex_expenses, search_expenses
+from ExpenseTracker.search import opensearch
+from ExpenseTracker.search.inprocess import InProcessSearchBackend
+
+
+class InProcessSearchTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(search, '_backend', InProcessSearchBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.food = ExpenseCategory.objects.create(name='餐飲')
+        rows = [
+            (date(2026, 1, 1), '牛肉麵', '', self.food),
+            (date(2026, 1, 2), '牛奶', '早餐', self.food),
+            (date(2026, 1, 3), 'Coffee Beans', '', None),
+            (date(2026, 1, 4), '計程車', '去吃牛排', None),
+            (date(2026, 1, 5), '麵包', 'coffee shop', self.food),
+        ]
+        self.expenses = [
+            Expense.objects.create(
+                date=day, time=time(12, 0), item_name=item_name, note=note, category=category, amount=Decimal('10'),
+            )
+            for day, item_name, note, category in rows
+        ]
+
+    def icontains_ids(self, keyword, **filters):
+        queryset = Expense.objects.filter(Q(item_name__icontains=keyword) | Q(note__icontains=keyword), **filters)
+        return sorted(queryset.values_list('pk', flat=True))
+
+    def search_ids(self, keyword, **filters):
+        return sorted(search_expenses(SearchQuery(keyword=keyword, limit=100, **filters)).ids)
+
+    def test_matches_icontains(self):
+        for keyword in ('牛', '牛肉', '麵', 'coffee', 'COFFEE', 'e', '早餐', '不存在', 'ee b'):
+            with self.subTest(keyword=keyword):
+                self.assertEqual(self.search_ids(keyword), self.icontains_ids(keyword))
+        self.assertEqual(
+            self.search_ids('牛', category_id=self.food.pk, start_date=date(2026, 1, 2)),
+            self.icontains_ids('牛', category=self.food, date__gte=date(2026, 1, 2)),
+        )
+
+    def test_follows_updates_and_deletes(self):
+        self.assertEqual(self.search_ids('牛肉'), [self.expenses[0].pk])
+
+        self.expenses[0].item_name = '豬肉麵'
+        self.expenses[0].save()
+        self.expenses[1].delete()
+        Expense.objects.create(date=date(2026, 1, 6), time=time(12, 0), item_name='牛肉乾', amount=Decimal('5'))
+
+        for keyword in ('牛', '豬肉', '牛奶'):
+            with self.subTest(keyword=keyword):
+                self.assertEqual(self.search_ids(keyword), self.icontains_ids(keyword))
+
+    def test_reindex_rebuilds_from_the_database(self):
+        self.assertEqual(reindex_expenses(batch_size=2), len(self.expenses))
+        self.assertEqual(self.search_ids('coffee'), self.icontains_ids('coffee'))
+
+    def test_keyword_filter_uses_hits_within_the_limit(self):
+        condition = keyword_filter('牛')
+
+        self.assertEqual(condition.children[0][0], 'pk__in')
+        self.assertEqual(sorted(Expense.objects.filter(condition).values_list('pk', flat=True)), self.icontains_ids('牛'))
+
+    def test_keyword_filter_falls_back_to_icontains_over_the_limit(self):
+        with mock.patch.object(search, 'MAX_HITS', 1):
+            condition = keyword_filter('牛')
+
+        # 不截斷命中，改以 icontains 取回全部
+        self.assertNotIn('pk__in', str(condition))
+        self.assertEqual(sorted(Expense.objects.filter(condition).values_list('pk', flat=True)), self.icontains_ids('牛'))
+
+
+@skipUnless(opensearch.OpenSearch, '需安裝 opensearch-py')
+class OpenSearchBackendTests(SimpleTestCase):
+
+    def test_gram_hits_are_confirmed_as_substrings(self):
+        backend = opensearch.OpenSearchBackend()
+        backend.client = mock.Mock()
+        backend.client.indices.exists.return_value = True
+        backend.client.search.return_value = {
+            'hits': {
+                'total': {'value': 2},
+                'hits': [
+                    {'_id': '1', '_source': {'item_name': '牛肉麵', 'note': ''}},
+                    # 「牛」「肉」都命中但不連續
+                    {'_id': '2', '_source': {'item_name': '肉包', 'note': '牛奶'}},
+                ],
+            },
+            'aggregations': {
+                'category': {'buckets': [{'key': 3, 'doc_count': 1}, {'key': opensearch.MISSING_ID, 'doc_count': 1}]},
+                'paid_by': {'buckets': []},
+            },
+        }
+
+        result = backend.search(SearchQuery(keyword='牛肉'))
+
+        self.assertEqual(result.ids, [1])
+        self.assertEqual(result.total, 2)
+        self.assertEqual(result.facets['category'], {3: 1, None: 1})
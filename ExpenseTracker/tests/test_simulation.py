@@ -0,0 +1,44 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ExpenseTracker import ledger
+from ExpenseTracker.models import Participant
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SettlementSimulateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ledger.clear()
+        self.addCleanup(ledger.clear)
+        self.alice = Participant.objects.create(name='Alice')
+        self.bob = Participant.objects.create(name='Bob')
+
+    def simulate(self, expense):
+        return self.client.post(
+            reverse('expense_tracker:settlement_simulate'),
+            json.dumps({'scenarios': [{'name': '試算', 'expenses': [expense]}]}),
+            content_type='application/json',
+        )
+
+    def test_even_split(self):
+        response = self.simulate({'amount': '30', 'paid_by': self.alice.pk, 'split_participants': [self.alice.pk, self.bob.pk]})
+
+        self.assertEqual(response.status_code, 200)
+        scenario = response.json()['scenarios'][0]
+        self.assertTrue(scenario['ok'])
+        self.assertEqual(scenario['settlements'], [{'from_name': 'Bob', 'to_name': 'Alice', 'amount': 15.0}])
+
+    def test_non_finite_amount_is_rejected(self):
+        for amount in ('NaN', '-NaN', 'sNaN', 'Infinity'):
+            with self.subTest(amount=amount):
+                response = self.simulate({'amount': amount, 'paid_by': self.alice.pk, 'split_participants': [self.bob.pk]})
+
+                self.assertEqual(response.status_code, 200)
+                scenario = response.json()['scenarios'][0]
+                self.assertFalse(scenario['ok'])
+                self.assertIn('amount', scenario['error'])
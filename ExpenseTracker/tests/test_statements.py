@@ -0,0 +1,59 @@
+import tempfile
+from datetime import date, time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ExpenseTracker import ledger
+from ExpenseTracker.archive import archive_year
+from ExpenseTracker.models import Expense, ExpenseSplit, Participant
+from ExpenseTracker.statements import collect_statements
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CollectStatementsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        ledger.clear()
+        self.addCleanup(ledger.clear)
+        self.alice = Participant.objects.create(name='Alice', email='alice@example.com')
+        self.bob = Participant.objects.create(name='Bob', email='bob@example.com')
+
+    def add(self, day, amount, payer):
+        """payer 付款，兩人平分"""
+        expense = Expense.objects.create(
+            date=day, time=time(12, 0), item_name=f'{day} {amount}', amount=Decimal(amount), paid_by=payer,
+        )
+        half = Decimal(amount) / 2
+        ExpenseSplit.objects.bulk_create([
+            ExpenseSplit(expense=expense, participant=self.alice, share_amount=half),
+            ExpenseSplit(expense=expense, participant=self.bob, share_amount=half),
+        ])
+        return expense
+
+    def balances(self, year, month):
+        return {statement.name: statement.balance for statement in collect_statements(year, month)}
+
+    def test_balance_is_as_of_the_end_of_the_month(self):
+        self.add(date(2025, 12, 20), '100', self.alice)
+        self.add(date(2026, 1, 10), '60', self.alice)
+        self.add(date(2026, 2, 5), '400', self.bob)
+
+        self.assertEqual(self.balances(2026, 1), {'Alice': Decimal('80.00'), 'Bob': Decimal('-80.00')})
+        self.assertEqual(self.balances(2026, 2), {'Alice': Decimal('-120.00'), 'Bob': Decimal('120.00')})
+
+    def test_balance_includes_archived_expenses_up_to_the_end_of_the_month(self):
+        self.add(date(2024, 3, 1), '100', self.alice)
+        self.add(date(2024, 11, 1), '40', self.bob)
+        self.add(date(2026, 1, 10), '60', self.alice)
+
+        with tempfile.TemporaryDirectory() as archive_root, tempfile.TemporaryDirectory() as tmp_root, \
+                override_settings(ARCHIVE_ROOT=archive_root, TMP_ROOT=tmp_root):
+            archive_year(2024)
+            self.assertFalse(Expense.objects.filter(date__year=2024).exists())
+
+            # 封存年度的月底之後的封存記帳不算入
+            self.assertEqual(self.balances(2024, 3), {'Alice': Decimal('50.00'), 'Bob': Decimal('-50.00')})
+            self.assertEqual(self.balances(2026, 1), {'Alice': Decimal('60.00'), 'Bob': Decimal('-60.00')})
@@ -0,0 +1,55 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from CoDevStudio.middleware.static_files import PrecompressedStaticFilesMiddleware, accepted_encodings
+
+
+class AcceptEncodingTests(SimpleTestCase):
+
+    def test_q_values(self):
+        self.assertEqual(accepted_encodings('gzip, br'), {'gzip', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, gzip;q=0.5'), {'gzip'})
+        self.assertEqual(accepted_encodings('br ; q=1.0, identity;q=0'), {'br'})
+
+    def test_malformed_q_value_counts_as_zero(self):
+        self.assertEqual(accepted_encodings('br;q=1..0, gzip'), {'gzip'})
+        self.assertEqual(accepted_encodings('gzip;q=..'), set())
+
+
+class PrecompressedStaticFilesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        self.content = b'body { color: red; }\n' * 50
+        with open(os.path.join(self.static_root, 'app.css'), 'wb') as f:
+            f.write(self.content)
+        with open(os.path.join(self.static_root, 'app.css.gz'), 'wb') as f:
+            f.write(gzip.compress(self.content))
+        settings = override_settings(STATIC_ROOT=self.static_root, STATIC_URL='/static/')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.middleware = PrecompressedStaticFilesMiddleware(lambda request: HttpResponse(status=404))
+
+    def get(self, accept_encoding):
+        request = RequestFactory().get('/static/app.css', HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = self.middleware(request)
+        return response, b''.join(response.streaming_content)
+
+    def test_serves_gzip_when_accepted(self):
+        response, body = self.get('gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), self.content)
+
+    def test_malformed_accept_encoding_falls_back_to_identity(self):
+        response, body = self.get('gzip;q=1..0')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(body, self.content)
@@ -0,0 +1,191 @@
+"""
+品項名稱自動完成
+行程內以排序陣列保存不重複的品項名稱，前綴以 bisect 取範圍，不需每次按鍵查資料庫
+權重結合使用次數與新近程度（半衰期衰減），並記住每個名稱最後一次使用的類型與金額
+第一次查詢時載入，之後依異動紀錄（ChangeLogEntry）追上各行程的新增、編輯與刪除
+"""
+import bisect
+import heapq
+import math
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+
+from .models import Expense, ChangeLogEntry
+
+
+HALF_LIFE_DAYS = getattr(settings, 'TYPEAHEAD_HALF_LIFE_DAYS', 30)
+REFRESH_INTERVAL = getattr(settings, 'TYPEAHEAD_REFRESH_INTERVAL', 5.0)
+DEFAULT_LIMIT = 8
+LOAD_CHUNK_SIZE = 2000
+
+ROW_FIELDS = ('pk', 'item_name', 'category_id', 'amount', 'date', 'time')
+
+
+def _timestamp(expense_date, expense_time) -> 'float':
+    """以天為單位的時間點"""
+    seconds = expense_time.hour * 3600 + expense_time.minute * 60 + expense_time.second if expense_time else 0
+    return expense_date.toordinal() + seconds / 86400
+
+
+def _amount(amount) -> 'str':
+    return str(Decimal(amount).quantize(Decimal('0.01')))
+
+
+@dataclass
+class Suggestion:
+    item_name: 'str'
+    # 以 log2 表示的衰減權重：sum(2 ** (t / 半衰期))，所有名稱共用同一基準，可直接比較
+    log_score: 'float'
+    count: 'int'
+    last_used: 'float'
+    category_id: 'int|None'
+    amount: 'str'
+
+    def to_dict(self) -> 'dict':
+        return {
+            'item_name': self.item_name,
+            'category_id': self.category_id,
+            'amount': self.amount,
+            'count': self.count,
+        }
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys: 'list[str]' = []                 # 小寫名稱，已排序
+        self._entries: 'dict[str, Suggestion]' = {}  # 小寫名稱 -> 建議
+        # 每筆記帳目前計入的名稱，編輯或刪除時據此重算受影響的名稱
+        self._rows: 'dict[int, tuple]' = {}          # pk -> (小寫名稱, 名稱, 類型, 金額, 時間點)
+        self._names: 'dict[str, set[int]]' = {}      # 小寫名稱 -> pk
+        self._cursor = 0
+        self._loaded = False
+        self._dirty = False
+        self._refreshed_at = 0.0
+
+    def _set_row(self, pk, item_name, category_id, amount, expense_date, expense_time, touched: 'set'):
+        self._drop_row(pk, touched)
+        key = item_name.strip().lower()
+        if not key:
+            return
+        self._rows[pk] = (key, item_name.strip(), category_id, _amount(amount), _timestamp(expense_date, expense_time))
+        self._names.setdefault(key, set()).add(pk)
+        touched.add(key)
+
+    def _drop_row(self, pk, touched: 'set'):
+        row = self._rows.pop(pk, None)
+        if row is None:
+            return
+        pks = self._names[row[0]]
+        pks.discard(pk)
+        if not pks:
+            del self._names[row[0]]
+        touched.add(row[0])
+
+    def _rebuild(self, keys: 'set'):
+        """依目前計入的記帳重算名稱的次數、權重與最後一次使用"""
+        removed = set()
+        for key in keys:
+            pks = self._names.get(key)
+            if not pks:
+                if self._entries.pop(key, None) is not None:
+                    removed.add(key)
+                continue
+            rows = [(self._rows[pk], pk) for pk in pks]
+            xs = [row[4] / HALF_LIFE_DAYS for row, _ in rows]
+            high = max(xs)
+            (_, item_name, category_id, amount, last_used), _ = max(rows, key=lambda item: (item[0][4], item[1]))
+            if key not in self._entries:
+                bisect.insort(self._keys, key)
+            self._entries[key] = Suggestion(
+                item_name=item_name,
+                log_score=high + math.log2(sum(2 ** (x - high) for x in xs)),
+                count=len(rows),
+                last_used=last_used,
+                category_id=category_id,
+                amount=amount,
+            )
+        if removed:
+            self._keys = [key for key in self._keys if key not in removed]
+
+    def _load(self):
+        """從資料庫建立索引；先記下游標，載入期間的異動下次追上時會再套用一次"""
+        self.clear()
+        self._cursor = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        touched = set()
+        last_pk = 0
+        while True:
+            rows = list(
+                Expense.objects.filter(pk__gt=last_pk).order_by('pk').values_list(*ROW_FIELDS)[:LOAD_CHUNK_SIZE]
+            )
+            if not rows:
+                break
+            for row in rows:
+                self._set_row(*row, touched)
+            last_pk = rows[-1][0]
+        self._rebuild(touched)
+        self._loaded = True
+
+    def _catch_up(self):
+        """依異動紀錄追上新增、編輯與刪除（本行程與其他行程寫入的都在此處理）"""
+        touched = set()
+        while True:
+            entries = list(
+                ChangeLogEntry.objects.filter(id__gt=self._cursor, model='expense')
+                .order_by('id').values_list('id', 'object_id')[:LOAD_CHUNK_SIZE]
+            )
+            if not entries:
+                break
+            self._cursor = entries[-1][0]
+            changed = {object_id for _, object_id in entries}
+            rows = Expense.objects.filter(pk__in=changed).values_list(*ROW_FIELDS)
+            for row in rows:
+                changed.discard(row[0])
+                self._set_row(*row, touched)
+            for pk in changed:
+                self._drop_row(pk, touched)
+        self._rebuild(touched)
+
+    def refresh(self, force: 'bool' = False):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            elif force or self._dirty or time.monotonic() - self._refreshed_at >= REFRESH_INTERVAL:
+                self._catch_up()
+            else:
+                return
+            self._dirty = False
+            self._refreshed_at = time.monotonic()
+
+    def mark_dirty(self):
+        """本行程寫入了記帳，下次查詢前先追上"""
+        self._dirty = True
+
+    def suggest(self, prefix: 'str', limit: 'int' = DEFAULT_LIMIT) -> 'list[Suggestion]':
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        self.refresh()
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            end = bisect.bisect_left(self._keys, prefix + '\U0010ffff', start)
+            entries = (self._entries[key] for key in self._keys[start:end])
+            return heapq.nlargest(limit, entries, key=lambda entry: entry.log_score)
+
+    def clear(self):
+        with self._lock:
+            self._keys = []
+            self._entries = {}
+            self._rows = {}
+            self._names = {}
+            self._cursor = 0
+            self._loaded = False
+
+
+item_index = PrefixIndex()
+
@@ -9,12 +9,29 @@ urlpatterns = [
     path('create/', views.expense_create, name='expense_create'),
     path('<int:pk>/edit/', views.expense_update, name='expense_update'),
     path('<int:pk>/delete/', views.expense_delete, name='expense_delete'),
+    path('bulk/', views.expense_bulk_action, name='expense_bulk_action'),
+    path('api/expenses/batch/', views.expense_batch, name='expense_batch'),
+    path('api/search/', views.search_api, name='search_api'),
+    path('api/item-suggestions/', views.item_suggestions, name='item_suggestions'),
+    path('api/category-suggestions/', views.category_suggestions, name='category_suggestions'),
     
     # 統計與結算
     path('dashboard/', views.dashboard, name='dashboard'),
     path('api/dashboard/', views.dashboard_api, name='dashboard_api'),
+    path('api/dashboard/stream/', views.dashboard_stream, name='dashboard_stream'),
     path('settlement/', views.settlement, name='settlement'),
+    path('api/settlement/simulate/', views.settlement_simulate, name='settlement_simulate'),
+    path('api/spending-matrix/', views.spending_matrix_api, name='spending_matrix_api'),
+
+    # 背景工作
+    path('api/settlement/jobs/', views.settlement_job, name='settlement_job'),
+    path('api/export/', views.expense_export, name='expense_export'),
+    path('api/jobs/<int:pk>/', views.job_status, name='job_status'),
+    path('api/jobs/<int:pk>/download/', views.job_download, name='job_download'),
     
+    # 增量同步
+    path('api/changes/', views.change_feed, name='change_feed'),
+
     # 類型管理
     path('categories/', views.category_list, name='category_list'),
     path('categories/<int:pk>/delete/', views.category_delete, name='category_delete'),
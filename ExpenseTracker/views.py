@@ -1,13 +1,49 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.paginator import Paginator
 from django.contrib import messages
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, Http404, HttpResponse, StreamingHttpResponse, QueryDict
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_POST
 from decimal import Decimal
+import json
 
-from .models import Expense, ExpenseCategory, Participant, ExpenseSplit
-from .forms import ExpenseForm, CategoryForm, ParticipantForm, ExpenseFilterForm
-from .services import get_statistics, calculate_settlement, get_participant_summary
+from .models import Expense, ExpenseCategory, Participant, Job
+from .forms import ExpenseForm, CategoryForm, ParticipantForm, ExpenseFilterForm, ExpenseBulkActionForm
+from .services import (
+    get_statistics,
+    get_daily_series,
+    DAILY_SERIES_MAX_DAYS,
+    calculate_settlement,
+    get_participant_summary,
+    apply_expense_filters,
+    get_spending_matrix,
+    get_recent_anomalies,
+    split_amount_evenly,
+)
+from . import cache as data_cache
+from .jobs import enqueue, job_to_dict
+from .changefeed import get_changes, DEFAULT_LIMIT
+from .batch import (
+    save_expense_batch,
+    BatchError,
+    recategorize_expenses,
+    reassign_payer,
+    resplit_expenses_evenly,
+    delete_expenses,
+)
+from .choices import category_choices, participant_choices
+from .search import SearchQuery, search_expenses
+from .typeahead import item_index, DEFAULT_LIMIT as SUGGESTION_LIMIT
+from .classifier import classify_items, get_classifier
+from . import live
+from .simulation import simulate_settlement, SimulationError
+from .budgets import get_budget_usage
+from .outbox import notify_expense_change
 
 
 def expense_list(request):
@@ -16,33 +52,24 @@ def expense_list(request):
     queryset = Expense.objects.select_related('category', 'paid_by')
     
     if filter_form.is_valid():
-        start_date = filter_form.cleaned_data.get('start_date')
-        end_date = filter_form.cleaned_data.get('end_date')
-        category = filter_form.cleaned_data.get('category')
-        keyword = filter_form.cleaned_data.get('keyword')
-        sort_by = filter_form.cleaned_data.get('sort_by') or '-date'
-        
-        if start_date:
-            queryset = queryset.filter(date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(date__lte=end_date)
-        if category:
-            queryset = queryset.filter(category=category)
-        if keyword:
-            queryset = queryset.filter(
-                Q(item_name__icontains=keyword) | Q(note__icontains=keyword)
-            )
-        queryset = queryset.order_by(sort_by)
+        queryset = apply_expense_filters(queryset, filter_form.cleaned_data)
     else:
-        queryset = queryset.order_by('-date', '-time')
+        queryset = queryset.order_by('-date', '-time', '-pk')
     
     paginator = Paginator(queryset, 15)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
+    query = request.GET.copy()
+    query.pop('page', None)
     context = {
         'page_obj': page_obj,
         'filter_form': filter_form,
+        'bulk_form': ExpenseBulkActionForm(),
+        'filter_query': query.urlencode(),
+        # 列與篩選下拉選單的片段快取以資料版本為 key
+        'data_versions': data_cache.get_data_versions(data_cache.CATEGORY, data_cache.PARTICIPANT),
+        'fragment_cache_timeout': data_cache.FRAGMENT_CACHE_TIMEOUT,
     }
     return render(request, 'expense_tracker/expense_list.html', context)
 
@@ -52,21 +79,27 @@ def expense_create(request):
     if request.method == 'POST':
         form = ExpenseForm(request.POST)
         if form.is_valid():
-            expense = form.save()
-            
-            # 處理分攤
-            split_participants = form.cleaned_data.get('split_participants')
-            if split_participants:
-                share_amount = expense.amount / len(split_participants)
-                for participant in split_participants:
-                    ExpenseSplit.objects.create(
-                        expense=expense,
-                        participant=participant,
-                        share_amount=share_amount
-                    )
-            
-            messages.success(request, f'已新增記帳：{expense.item_name}')
-            return redirect('expense_tracker:expense_list')
+            # 記帳、分攤、預算計數與通知在同一個交易內寫入；通知由背景工作寄出
+            try:
+                with transaction.atomic():
+                    expense = form.save()
+
+                    # 處理分攤
+                    shares = {}
+                    split_participants = form.cleaned_data.get('split_participants')
+                    if split_participants:
+                        # 以分為單位分配餘數，分攤總和必定等於金額
+                        amounts = split_amount_evenly(expense.amount, len(split_participants))
+                        for participant, share_amount in zip(split_participants, amounts):
+                            expense.splits.create(participant=participant, share_amount=share_amount)
+                            shares[participant.pk] = share_amount
+                    notify_expense_change('create', expense, shares)
+            except IntegrityError:
+                # 驗證後類型或參與者被其他請求刪除，交易已回滾
+                form.add_error(None, '選擇的類型或參與者已不存在，請重新選擇')
+            else:
+                messages.success(request, f'已新增記帳：{expense.item_name}')
+                return redirect('expense_tracker:expense_list')
     else:
         form = ExpenseForm()
     
@@ -82,28 +115,35 @@ def expense_update(request, pk):
     expense = get_object_or_404(Expense, pk=pk)
     
     if request.method == 'POST':
+        # 驗證表單時會改寫 instance，先記下原付款人與分攤者
+        previous_ids = {expense.paid_by_id, *expense.splits.values_list('participant_id', flat=True)}
         form = ExpenseForm(request.POST, instance=expense)
         if form.is_valid():
-            expense = form.save()
-            
-            # 更新分攤
-            ExpenseSplit.objects.filter(expense=expense).delete()
-            split_participants = form.cleaned_data.get('split_participants')
-            if split_participants:
-                share_amount = expense.amount / len(split_participants)
-                for participant in split_participants:
-                    ExpenseSplit.objects.create(
-                        expense=expense,
-                        participant=participant,
-                        share_amount=share_amount
-                    )
-            
-            messages.success(request, f'已更新記帳：{expense.item_name}')
-            return redirect('expense_tracker:expense_list')
+            try:
+                with transaction.atomic():
+                    expense = form.save()
+
+                    # 更新分攤
+                    expense.splits.all().delete()
+                    shares = {}
+                    split_participants = form.cleaned_data.get('split_participants')
+                    if split_participants:
+                        # 以分為單位分配餘數，分攤總和必定等於金額
+                        amounts = split_amount_evenly(expense.amount, len(split_participants))
+                        for participant, share_amount in zip(split_participants, amounts):
+                            expense.splits.create(participant=participant, share_amount=share_amount)
+                            shares[participant.pk] = share_amount
+                    notify_expense_change('update', expense, shares, previous_ids)
+            except IntegrityError:
+                # 驗證後類型或參與者被其他請求刪除，交易已回滾
+                form.add_error(None, '選擇的類型或參與者已不存在，請重新選擇')
+            else:
+                messages.success(request, f'已更新記帳：{expense.item_name}')
+                return redirect('expense_tracker:expense_list')
     else:
         form = ExpenseForm(instance=expense)
         # 預設勾選已分攤的參與者
-        existing_splits = ExpenseSplit.objects.filter(expense=expense).values_list('participant_id', flat=True)
+        existing_splits = expense.splits.values_list('participant_id', flat=True)
         form.fields['split_participants'].initial = list(existing_splits)
     
     context = {
@@ -120,7 +160,10 @@ def expense_delete(request, pk):
     
     if request.method == 'POST':
         item_name = expense.item_name
-        expense.delete()
+        with transaction.atomic():
+            shares = dict(expense.splits.values_list('participant_id', 'share_amount'))
+            expense.delete()
+            notify_expense_change('delete', expense, shares)
         messages.success(request, f'已刪除記帳：{item_name}')
         return redirect('expense_tracker:expense_list')
     
@@ -130,6 +173,56 @@ def expense_delete(request, pk):
     return render(request, 'expense_tracker/expense_confirm_delete.html', context)
 
 
+@require_POST
+def expense_bulk_action(request):
+    """記帳列表批次操作：勾選的記帳，或所有符合目前篩選條件的記帳"""
+    filter_query = request.POST.get('filter_query', '')
+    list_url = reverse('expense_tracker:expense_list')
+    redirect_url = f'{list_url}?{filter_query}' if filter_query else list_url
+
+    form = ExpenseBulkActionForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            messages.error(request, errors[0])
+        return redirect(redirect_url)
+    data = form.cleaned_data
+
+    if data['select_all']:
+        # 直接以篩選條件更新，不把上萬個 ID 帶回伺服器
+        filter_form = ExpenseFilterForm(QueryDict(filter_query))
+        queryset = Expense.objects.all()
+        if filter_form.is_valid():
+            queryset = apply_expense_filters(queryset, filter_form.cleaned_data)
+    else:
+        try:
+            expense_ids = [int(pk) for pk in request.POST.getlist('ids')]
+        except ValueError:
+            expense_ids = []
+        if not expense_ids:
+            messages.error(request, '請先勾選記帳')
+            return redirect(redirect_url)
+        queryset = Expense.objects.filter(pk__in=expense_ids)
+
+    try:
+        if data['action'] == 'recategorize':
+            count = recategorize_expenses(queryset, data['category'])
+            message = f'已將 {count} 筆記帳改為「{data["category"].name}」'
+        elif data['action'] == 'reassign_payer':
+            count = reassign_payer(queryset, data['paid_by'])
+            message = f'已變更 {count} 筆記帳的付款人'
+        elif data['action'] == 'resplit':
+            count = resplit_expenses_evenly(queryset, data['split_participants'] or None)
+            message = f'已重新平均分攤 {count} 筆記帳'
+        else:
+            count = delete_expenses(queryset)
+            message = f'已刪除 {count} 筆記帳'
+    except BatchError as exc:
+        messages.error(request, str(exc))
+        return redirect(redirect_url)
+    messages.success(request, message)
+    return redirect(redirect_url)
+
+
 def dashboard(request):
     """統計儀表板"""
     period = request.GET.get('period', 'all')
@@ -138,17 +231,74 @@ def dashboard(request):
     context = {
         'stats': stats,
         'current_period': period,
+        'anomalies': get_recent_anomalies(),
+        'budgets': get_budget_usage(),
     }
     return render(request, 'expense_tracker/dashboard.html', context)
 
 
 def dashboard_api(request):
-    """統計資料 API"""
+    """
+    統計資料 API，含與前一期的差額與成長率、區間內的每日金額（daily）與本月預算使用狀況（budgets）
+    period: 'day', 'week', 'month', 'all'；或以 start_date / end_date 指定自訂區間，最長 DASHBOARD_DAILY_MAX_DAYS 天
+    """
     period = request.GET.get('period', 'all')
-    stats = get_statistics(period=period)
+    try:
+        start_date = parse_date(request.GET.get('start_date') or '')
+        end_date = parse_date(request.GET.get('end_date') or '')
+    except ValueError:
+        return JsonResponse({'error': '日期格式錯誤'}, status=400)
+    if start_date or end_date:
+        if start_date and end_date and start_date > end_date:
+            return JsonResponse({'error': 'start_date 不可晚於 end_date'}, status=400)
+        period = 'custom'
+    stats = get_statistics(period=period, start_date=start_date, end_date=end_date)
+    try:
+        # 自訂區間由使用者指定，每日金額需限制天數；只給一端時另一端取資料的最早／最晚日期
+        stats['daily'] = get_daily_series(
+            stats['start_date'], stats['end_date'],
+            max_days=DAILY_SERIES_MAX_DAYS if period == 'custom' else None,
+        )
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    stats['anomalies'] = get_recent_anomalies()
+    stats['budgets'] = get_budget_usage()
     return JsonResponse(stats)
 
 
+async def dashboard_stream(request):
+    """
+    儀表板即時推播（SSE）
+    記帳寫入時才推送統計與結算差異；閒置連線不查資料庫
+    """
+    period = request.GET.get('period', 'all')
+    if period not in live.PERIODS:
+        period = 'all'
+
+    if not isinstance(request, ASGIRequest):
+        # WSGI 無法長時間保持連線：送出目前快照，請瀏覽器稍後重連
+        snapshot = await sync_to_async(live.broadcaster.latest)()
+        body = 'retry: 30000\n' + live.format_event(
+            'snapshot', dict(snapshot['stats'][period], settlement=snapshot['settlement'])
+        )
+        return HttpResponse(body, content_type='text/event-stream')
+
+    # 先訂閱再取快照，避免兩者之間的寫入被漏掉
+    subscriber = live.broadcaster.subscribe(period)
+    try:
+        snapshot = await sync_to_async(live.broadcaster.latest)()
+    except Exception:
+        live.broadcaster.unsubscribe(period, subscriber)
+        raise
+    response = StreamingHttpResponse(
+        live.dashboard_events(period, subscriber, snapshot),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def settlement(request):
     """分帳結算"""
     settlements = calculate_settlement()
@@ -161,6 +311,213 @@ def settlement(request):
     return render(request, 'expense_tracker/settlement.html', context)
 
 
+@require_POST
+def settlement_simulate(request):
+    """
+    分帳試算 API，不寫入資料庫
+    body: {"scenarios": [{"name": "...", "expenses": [{"amount", "paid_by", "split_participants"}]}]}
+    """
+    try:
+        payload = json.loads(request.body)
+        result = simulate_settlement(payload.get('scenarios'))
+    except (ValueError, AttributeError) as exc:
+        message = str(exc) if isinstance(exc, SimulationError) else '請求格式錯誤'
+        return JsonResponse({'error': message}, status=400)
+    return JsonResponse(result)
+
+
+def _job_accepted(job):
+    """回傳 202 與輪詢網址"""
+    data = job_to_dict(job)
+    data['status_url'] = reverse('expense_tracker:job_status', args=[job.pk])
+    return JsonResponse(data, status=202)
+
+
+@require_POST
+def settlement_job(request):
+    """排入分帳結算重算工作"""
+    job = enqueue('recalculate_settlement')
+    return _job_accepted(job)
+
+
+@require_POST
+def expense_export(request):
+    """排入記帳匯出工作，篩選條件與記帳列表相同"""
+    filters = {
+        key: request.POST.get(key)
+        for key in ExpenseFilterForm.base_fields
+        if request.POST.get(key)
+    }
+    job = enqueue('export_expenses', {'filters': filters})
+    return _job_accepted(job)
+
+
+def job_status(request, pk):
+    """背景工作狀態 API"""
+    job = get_object_or_404(Job, pk=pk)
+    data = job_to_dict(job)
+    if job.task == 'export_expenses' and job.status == Job.STATUS_SUCCEEDED:
+        data['download_url'] = reverse('expense_tracker:job_download', args=[job.pk])
+    return JsonResponse(data)
+
+
+def job_download(request, pk):
+    """下載匯出結果"""
+    job = get_object_or_404(Job, pk=pk, task='export_expenses', status=Job.STATUS_SUCCEEDED)
+    path = (job.result or {}).get('path')
+    try:
+        f = open(path, 'rb')
+    except (TypeError, OSError):
+        raise Http404('匯出檔案不存在')
+    return FileResponse(f, as_attachment=True, filename=job.result['filename'])
+
+
+def change_feed(request):
+    """增量同步 API，since 為上次取得的游標"""
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': 'since 與 limit 必須為整數'}, status=400)
+    return JsonResponse(get_changes(since=since, limit=limit))
+
+
+@require_POST
+def expense_batch(request):
+    """
+    批次新增/更新記帳 API
+    body: {"expenses": [{...}, ...]}，含 id 者為更新
+    """
+    try:
+        payload = json.loads(request.body)
+        saved, results = save_expense_batch(payload.get('expenses'))
+    except (ValueError, AttributeError) as exc:
+        message = str(exc) if isinstance(exc, BatchError) else '請求格式錯誤'
+        return JsonResponse({'error': message}, status=400)
+    return JsonResponse({'saved': saved, 'results': results}, status=200 if saved else 400)
+
+
+def spending_matrix_api(request):
+    """參與者 × 類型支出矩陣 API"""
+    mode = request.GET.get('mode', 'share')
+    if mode not in ('share', 'paid'):
+        return JsonResponse({'error': 'mode 必須為 share 或 paid'}, status=400)
+    try:
+        start_date = parse_date(request.GET.get('start_date') or '')
+        end_date = parse_date(request.GET.get('end_date') or '')
+    except ValueError:
+        return JsonResponse({'error': '日期格式錯誤'}, status=400)
+
+    matrix = get_spending_matrix(start_date=start_date, end_date=end_date, mode=mode)
+    data = matrix.to_dict()
+    data.update({'mode': mode, 'start_date': start_date, 'end_date': end_date})
+    return JsonResponse(data)
+
+
+def _int_param(value):
+    return int(value) if value not in (None, '') else None
+
+
+def search_api(request):
+    """記帳搜尋 API，命中與類型/付款人分面計數皆由搜尋後端提供"""
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', 20)), 1), 100)
+        query = SearchQuery(
+            keyword=request.GET.get('q', ''),
+            category_id=_int_param(request.GET.get('category')),
+            paid_by_id=_int_param(request.GET.get('paid_by')),
+            start_date=parse_date(request.GET.get('start_date') or ''),
+            end_date=parse_date(request.GET.get('end_date') or ''),
+            limit=page_size,
+            offset=(page - 1) * page_size,
+        )
+    except ValueError:
+        return JsonResponse({'error': '參數格式錯誤'}, status=400)
+
+    result = search_expenses(query)
+    expenses = Expense.objects.select_related('category', 'paid_by').in_bulk(result.ids)
+    categories = category_choices.get_map()
+    participants = participant_choices.get_map()
+    return JsonResponse({
+        'total': result.total,
+        'page': page,
+        'page_size': page_size,
+        'hits': [
+            {
+                'id': expense.pk,
+                'date': expense.date,
+                'item_name': expense.item_name,
+                'category': expense.category.name if expense.category else '未分類',
+                'amount': float(expense.amount),
+                'paid_by': expense.paid_by.name if expense.paid_by else None,
+                'note': expense.note,
+            }
+            for expense in (expenses.get(pk) for pk in result.ids) if expense is not None
+        ],
+        'facets': {
+            'category': [
+                {'id': pk, 'name': categories[pk].name if pk in categories else '未分類', 'count': count}
+                for pk, count in sorted(result.facets.get('category', {}).items(), key=lambda item: -item[1])
+            ],
+            'paid_by': [
+                {'id': pk, 'name': participants[pk].name if pk in participants else None, 'count': count}
+                for pk, count in sorted(result.facets.get('paid_by', {}).items(), key=lambda item: -item[1])
+            ],
+        },
+    })
+
+
+def item_suggestions(request):
+    """品項名稱自動完成 API，由記憶體內前綴索引回應"""
+    try:
+        limit = min(max(int(request.GET.get('limit', SUGGESTION_LIMIT)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'limit 必須為整數'}, status=400)
+    categories = category_choices.get_map()
+    suggestions = []
+    for suggestion in item_index.suggest(request.GET.get('q', ''), limit=limit):
+        data = suggestion.to_dict()
+        category = categories.get(suggestion.category_id)
+        data['category'] = category.name if category else None
+        suggestions.append(data)
+    return JsonResponse({'suggestions': suggestions})
+
+
+def category_suggestions(request):
+    """
+    依品項名稱建議類型
+    GET ?item_name=... 單筆；POST {"items": ["...", ...]} 整批一次推論
+    """
+    if request.method == 'POST':
+        try:
+            items = json.loads(request.body).get('items')
+        except (ValueError, AttributeError):
+            items = None
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            return JsonResponse({'error': 'items 必須為字串陣列'}, status=400)
+    else:
+        items = [request.GET.get('item_name', '')]
+
+    categories = category_choices.get_map()
+    predictions = classify_items(items)
+    return JsonResponse({
+        'results': [
+            {
+                'item_name': item,
+                'category_id': prediction.category_id,
+                'confidence': round(prediction.confidence, 4),
+                'candidates': [
+                    {'id': pk, 'name': categories[pk].name, 'probability': round(probability, 4)}
+                    for pk, probability in prediction.ranking
+                ],
+            }
+            for item, prediction in zip(items, predictions)
+        ],
+        'model': get_classifier().metrics,
+    })
+
+
 def category_list(request):
     """類型列表"""
     categories = ExpenseCategory.objects.all()